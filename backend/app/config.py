@@ -3,16 +3,59 @@ from functools import lru_cache
 
 class Settings(BaseSettings):
     DATABASE_URL: str
+    DATABASE_ASYNC: bool = False
+    DATABASE_ASYNC_DRIVER: str = "asyncpg"
+    DATABASE_POOL_SIZE: int = 5
+    DATABASE_MAX_OVERFLOW: int = 10
     SUPABASE_URL: str
     SUPABASE_KEY: str
     SUPABASE_JWT_SECRET: str
+    # Signing secret of the auth.users webhook, "v1,whsec_...", unset disables it
+    SUPABASE_WEBHOOK_SECRET: str = ""
     SECRET_KEY: str
     ADMIN_SECRET_KEY: str
     ALGORITHM: str = "HS256"
+    JWT_CACHE_MAX_ENTRIES: int = 10000
+    JWT_CACHE_MAX_TTL_SECONDS: int = 3600
+    # How long tokens of deleted users are rejected, at least the JWT expiry set in Supabase
+    JWT_REVOCATION_TTL_SECONDS: int = 24 * 60 * 60
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     GOOGLE_CLIENT_ID: str
     GOOGLE_CLIENT_SECRET: str
     REDIS_URL: str = "redis://localhost:6379"
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_HEALTH_CHECK_INTERVAL: int = 30
+    REDIS_SOCKET_TIMEOUT: float = 5.0
+    L1_CACHE_MAX_ENTRIES: int = 10000
+    L1_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    L1_CACHE_TTL_SECONDS: int = 30
+    IMAGE_STORE: str = "local"  # "local" or "supabase"
+    IMAGE_STORE_PATH: str = "uploads"
+    IMAGE_BASE_URL: str = "/images"
+    SUPABASE_STORAGE_BUCKET: str = "recipe-images"
+    IMAGE_MAX_BYTES: int = 10 * 1024 * 1024
+    IMAGE_WORKERS: int = 2
+    IMAGE_PARSER: str = "vision"  # "vision", "ocr" or "fake"
+    VISION_API_URL: str = "https://api.openai.com/v1"
+    VISION_API_KEY: str = ""
+    VISION_MODEL: str = "gpt-4o"
+    JOB_CONCURRENCY: int = 4
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_TIMEOUT_SECONDS: int = 120
+    JOB_RETRY_BACKOFF_SECONDS: float = 5.0
+    JOB_RESULT_TTL_SECONDS: int = 24 * 60 * 60
+    # Longer than JOB_TIMEOUT_SECONDS, so running jobs are never claimed
+    JOB_CLAIM_IDLE_SECONDS: int = 5 * 60
+    OUTBOX_BATCH_SIZE: int = 100
+    # Other workers' events are picked up by polling, this worker's on commit
+    OUTBOX_POLL_SECONDS: float = 1.0
+    OUTBOX_MAX_ATTEMPTS: int = 10
+    # Smaller responses are sent uncompressed
+    COMPRESSION_MIN_BYTES: int = 1024
+    # Bearer token Prometheus scrapes /metrics with. Unset, /metrics answers
+    # 404 unless METRICS_PUBLIC opens it, e.g. behind a private network
+    METRICS_TOKEN: str = ""
+    METRICS_PUBLIC: bool = False
 
     model_config = SettingsConfigDict(env_file=".env")
 
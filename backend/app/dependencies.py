@@ -1,6 +1,11 @@
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+from typing import Optional, Union
 from .config import get_settings
+from .utils.metrics import InstrumentedQueuePool, InstrumentedAsyncQueuePool, InstrumentedRedis
 from redis import asyncio as aioredis
 import urllib.parse
 
@@ -16,22 +21,171 @@ db_url = parsed._replace(
 # Create database engine
 engine = create_engine(
     db_url,
-    pool_size=5,
-    max_overflow=10,
-    pool_timeout=30
+    pool_size=settings.DATABASE_POOL_SIZE,
+    max_overflow=settings.DATABASE_MAX_OVERFLOW,
+    pool_timeout=30,
+    poolclass=InstrumentedQueuePool
 )
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-async def get_redis():
-    """Get Redis connection"""
-    redis = await aioredis.from_url(
-        settings.REDIS_URL,
-        encoding="utf8",
-        decode_responses=True
+# Create async engine and session factory when async mode is enabled
+async_engine = None
+AsyncSessionLocal = None
+if settings.DATABASE_ASYNC:
+    async_db_url = urllib.parse.urlparse(db_url)._replace(
+        scheme=f"postgresql+{settings.DATABASE_ASYNC_DRIVER}"
+    ).geturl()
+    async_engine = create_async_engine(
+        async_db_url,
+        pool_size=settings.DATABASE_POOL_SIZE,
+        max_overflow=settings.DATABASE_MAX_OVERFLOW,
+        pool_timeout=30,
+        poolclass=InstrumentedAsyncQueuePool
     )
-    return redis
+    # Objects must stay usable after commit since lazy loads are not allowed in async mode
+    AsyncSessionLocal = async_sessionmaker(
+        async_engine,
+        autoflush=False,
+        expire_on_commit=False
+    )
+
+class ThreadedStreamResult:
+    """Streaming result of a ThreadedSession, fetching each partition in the threadpool"""
+    def __init__(self, result):
+        self.sync_result = result
+
+    async def partitions(self, size: Optional[int] = None):
+        partitions = self.sync_result.partitions(size)
+        while True:
+            partition = await run_in_threadpool(next, partitions, None)
+            if partition is None:
+                break
+            yield partition
+
+    async def close(self):
+        await run_in_threadpool(self.sync_result.close)
+
+class ThreadedSession:
+    """
+    AsyncSession-compatible wrapper around a sync Session.
+    Every database round trip runs in the threadpool so the sync driver
+    never blocks the event loop. Used when async mode is disabled.
+    """
+    def __init__(self, session: Session):
+        self.sync_session = session
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    def get_bind(self, *args, **kwargs):
+        return self.sync_session.get_bind(*args, **kwargs)
+
+    async def execute(self, statement, params=None, **kwargs):
+        return await run_in_threadpool(self.sync_session.execute, statement, params, **kwargs)
+
+    async def scalar(self, statement, params=None, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalar, statement, params, **kwargs)
+
+    async def scalars(self, statement, params=None, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalars, statement, params, **kwargs)
+
+    async def stream(self, statement, params=None, **kwargs):
+        """Execute with a server-side cursor, rows are fetched as partitions are consumed"""
+        execution_options = {"stream_results": True, **kwargs.pop("execution_options", {})}
+        result = await run_in_threadpool(
+            self.sync_session.execute, statement, params, execution_options=execution_options, **kwargs
+        )
+        return ThreadedStreamResult(result)
+
+    async def get(self, entity, ident, **kwargs):
+        return await run_in_threadpool(self.sync_session.get, entity, ident, **kwargs)
+
+    async def delete(self, instance):
+        await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def flush(self, objects=None):
+        await run_in_threadpool(self.sync_session.flush, objects)
+
+    async def refresh(self, instance, attribute_names=None):
+        await run_in_threadpool(self.sync_session.refresh, instance, attribute_names)
+
+    async def commit(self):
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self):
+        await run_in_threadpool(self.sync_session.rollback)
+
+    @asynccontextmanager
+    async def begin_nested(self):
+        """Savepoint released when the block completes and rolled back if it raises"""
+        transaction = await run_in_threadpool(self.sync_session.begin_nested)
+        try:
+            yield transaction
+        except BaseException:
+            await run_in_threadpool(transaction.rollback)
+            raise
+        await run_in_threadpool(transaction.commit)
+
+    async def close(self):
+        await run_in_threadpool(self.sync_session.close)
+
+DBSession = Union[AsyncSession, ThreadedSession]
+
+# Shared Redis pool and client, created once per worker by the app lifespan.
+# Responses are not decoded since the cache stores encoded bodies as raw bytes,
+# and command latencies are recorded for /metrics
+redis_pool: Optional[aioredis.ConnectionPool] = None
+redis_client: Optional[aioredis.Redis] = None
+
+async def init_redis() -> aioredis.Redis:
+    """Create the shared Redis connection pool and client"""
+    global redis_pool, redis_client
+    if redis_client is None:
+        redis_pool = aioredis.ConnectionPool.from_url(
+            settings.REDIS_URL,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT
+        )
+        redis_client = InstrumentedRedis(connection_pool=redis_pool)
+    return redis_client
+
+async def close_redis():
+    """Close the shared Redis client and disconnect all pooled connections"""
+    global redis_pool, redis_client
+    if redis_client is not None:
+        await redis_client.aclose()
+    if redis_pool is not None:
+        await redis_pool.disconnect()
+    redis_client = None
+    redis_pool = None
+
+async def get_redis() -> aioredis.Redis:
+    """Get the shared Redis client"""
+    if redis_client is None:
+        # Scripts and tests may run without the app lifespan
+        return await init_redis()
+    return redis_client
+
+def get_redis_pool_stats() -> dict:
+    """Get usage metrics for the shared Redis connection pool"""
+    if redis_pool is None:
+        return {"initialized": False}
+    in_use = len(redis_pool._in_use_connections)
+    idle = len(redis_pool._available_connections)
+    return {
+        "initialized": True,
+        "max_connections": redis_pool.max_connections,
+        "in_use": in_use,
+        "idle": idle,
+        "created": in_use + idle
+    }
 
 def get_db():
     """Get database session"""
@@ -39,4 +193,17 @@ def get_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    """Get async database session, or a threaded sync session when async mode is disabled"""
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as db:
+            yield db
+    else:
+        db = ThreadedSession(SessionLocal(expire_on_commit=False))
+        try:
+            yield db
+        finally:
+            await db.close()
+
@@ -1,14 +1,22 @@
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Depends, HTTPException, status, Request
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from .routers import auth, recipes, groups, users
+from fastapi.staticfiles import StaticFiles
+from .routers import auth, recipes, groups, users, webhooks, jobs
 from .models import Base
-from .dependencies import engine
+from .dependencies import engine, init_redis, close_redis, get_redis, get_redis_pool_stats
 from fastapi_limiter import FastAPILimiter
 from redis import asyncio as aioredis
 from .config import get_settings
-from .utils.auth import verify_supabase_jwt
+from .middleware.request_context import RequestContextMiddleware
+from .utils.compression import CompressionMiddleware
+from .utils.cache import listen_for_invalidations
+from .utils.images import shutdown_image_pool
+from .utils.metrics import render_metrics, METRICS_CONTENT_TYPE
+from .services.outbox import outbox_dispatcher
+import asyncio
+import hmac
 import logging
 
 settings = get_settings()
@@ -21,36 +29,44 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-async def get_redis():
-    return await aioredis.from_url(
-        settings.REDIS_URL or "redis://localhost",
-        encoding="utf8",
-        decode_responses=True
-    )
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Create database tables
     Base.metadata.create_all(bind=engine)
     logger.info("Database tables created")
     
-    # Setup - Initialize FastAPILimiter with Redis
+    # Setup - Create the shared Redis pool and initialize FastAPILimiter with it
     try:
-        redis = await get_redis()
+        redis = await init_redis()
         await FastAPILimiter.init(redis)
-        yield
     except Exception as e:
         logger.error(f"Service initialization error: {str(e)}")
+
+    # Keep this worker's L1 cache coherent with writes made by other workers
+    invalidation_listener = asyncio.create_task(listen_for_invalidations())
+    # Run the side effects of committed writes, such as cache invalidation
+    outbox = asyncio.create_task(outbox_dispatcher.run())
+
+    try:
         yield
     finally:
-        if 'redis' in locals():
-            await redis.close()
+        outbox.cancel()
+        invalidation_listener.cancel()
+        shutdown_image_pool()
+        await close_redis()
 
 app = FastAPI(
     title="Recipe Sharing API",
     lifespan=lifespan
 )
 
+# Request ID, auth, error handling, timing and metrics, inside CORS so that error
+# responses still carry CORS headers
+app.add_middleware(RequestContextMiddleware)
+
+# Negotiated br/gzip, outside the request context so error responses are compressed too
+app.add_middleware(CompressionMiddleware)
+
 # Configure CORS
 origins = [
     "http://localhost:5173",  # Vue.js development server
@@ -68,6 +84,8 @@ app.add_middleware(
         "Authorization",
         "Accept",
         "Origin",
+        "If-None-Match",
+        "If-Match",
         "X-Requested-With",
         "apikey",
         "Access-Control-Request-Method",
@@ -78,31 +96,17 @@ app.add_middleware(
     max_age=86400  # Cache preflight requests for 24 hours
 )
 
-@app.middleware("http")
-async def supabase_auth_middleware(request: Request, call_next):
-    # Skip auth for public endpoints and OPTIONS requests
-    if request.url.path in ["/", "/health", "/docs", "/openapi.json", "/redoc"] or request.method == "OPTIONS":
-        return await call_next(request)
-
-    try:
-        # Verify JWT token
-        token_data = await verify_supabase_jwt(request)
-        if token_data:
-            # Add user data to request state
-            request.state.user = token_data
-    except HTTPException as e:
-        # Skip auth errors for auth endpoints
-        if not request.url.path.startswith("/auth/"):
-            raise e
-
-    response = await call_next(request)
-    return response
-
 # Include routers
 app.include_router(auth.router, prefix="/auth", tags=["Authentication"])
 app.include_router(recipes.router, prefix="/recipes", tags=["Recipes"])
 app.include_router(groups.router, prefix="/groups", tags=["Family Groups"])
 app.include_router(users.router, prefix="/users", tags=["Users"])
+app.include_router(webhooks.router, prefix="/webhooks", tags=["Webhooks"])
+app.include_router(jobs.router, prefix="/jobs", tags=["Jobs"])
+
+# Uploaded images, when kept in the local image store
+if settings.IMAGE_STORE == "local":
+    app.mount(settings.IMAGE_BASE_URL, StaticFiles(directory=settings.IMAGE_STORE_PATH, check_dir=False), name="images")
 
 # Add TrustedHost middleware after routers
 app.add_middleware(
@@ -123,22 +127,36 @@ async def root():
     }
 
 @app.get("/health")
-async def health_check():
+async def health_check(redis: aioredis.Redis = Depends(get_redis)):
     """Health check endpoint"""
     try:
         # Test Redis connection
-        redis = await get_redis()
         await redis.ping()
         redis_status = "connected"
     except Exception as e:
         logger.error(f"Redis connection error: {str(e)}")
         redis_status = "error"
-    finally:
-        if 'redis' in locals():
-            await redis.close()
-            
+
     return {
         "status": "healthy",
         "version": "1.0.0",
-        "redis": redis_status
+        "redis": redis_status,
+        "redis_pool": get_redis_pool_stats()
     }
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """Request, database, Redis, cache and auth metrics in the Prometheus text format"""
+    if not settings.METRICS_TOKEN and not settings.METRICS_PUBLIC:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Not Found"
+        )
+    if settings.METRICS_TOKEN and not hmac.compare_digest(
+        request.headers.get("Authorization", "").encode(), f"Bearer {settings.METRICS_TOKEN}".encode()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid metrics token"
+        )
+    return Response(content=render_metrics(), headers={"Content-Type": METRICS_CONTENT_TYPE})
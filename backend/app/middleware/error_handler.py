@@ -1,22 +0,0 @@
-from fastapi import Request
-from fastapi.responses import JSONResponse
-from sqlalchemy.exc import SQLAlchemyError
-import logging
-
-logger = logging.getLogger(__name__)
-
-async def error_handler(request: Request, call_next):
-    try:
-        return await call_next(request)
-    except SQLAlchemyError as e:
-        logger.error(f"Database error: {str(e)}")
-        return JSONResponse(
-            status_code=500,
-            content={"detail": "A database error occurred."}
-        )
-    except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}")
-        return JSONResponse(
-            status_code=500,
-            content={"detail": "An unexpected error occurred."}
-        ) 
\ No newline at end of file
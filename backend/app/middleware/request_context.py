@@ -0,0 +1,111 @@
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from sqlalchemy.exc import SQLAlchemyError
+from ..config import get_settings
+from ..utils.auth import verify_supabase_jwt
+from ..utils.metrics import RequestStats, request_stats, route_name, record_request
+import logging
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Webhooks are authenticated by their signature instead
+PUBLIC_PATHS = frozenset(["/", "/health", "/metrics", "/docs", "/openapi.json", "/redoc", "/webhooks/supabase/users"])
+# Images are loaded by <img> tags, which send no Authorization header
+PUBLIC_PREFIXES = (get_settings().IMAGE_BASE_URL.rstrip("/") + "/",)
+
+class RequestContextMiddleware:
+    """
+    Request ID, Supabase auth, error handling, timing and request metrics in a single raw ASGI pass.
+    Unlike BaseHTTPMiddleware and @app.middleware("http"), the request and response
+    are passed straight through, without extra tasks or copies of the body stream.
+    """
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        finished = None
+        request_id = str(uuid.uuid4())
+        state = scope.setdefault("state", {})
+        state["request_id"] = request_id
+        # Mounted apps may replace scope["app"], the routes are looked up in this one
+        app = scope.get("app")
+        stats = RequestStats()
+        stats_token = request_stats.set(stats)
+        response_started = False
+        status_code = 500
+
+        async def send_with_context(message: Message):
+            nonlocal response_started, status_code, finished
+            if message["type"] == "http.response.start":
+                response_started = True
+                status_code = message["status"]
+                duration_ms = (time.perf_counter() - started) * 1000
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-request-id", request_id.encode()),
+                    (b"server-timing", b"app;dur=%.1f, db;dur=%.1f" % (duration_ms, stats.db_seconds * 1000))
+                ]
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                # Background tasks run after this, and are not part of the request's latency
+                finished = time.perf_counter()
+            await send(message)
+
+        try:
+            error = await self.authenticate(scope, state)
+            if error is not None:
+                await error(scope, receive, send_with_context)
+                return
+            await self.app(scope, receive, send_with_context)
+        except Exception as e:
+            if response_started:
+                # Too late to send an error response, let the server drop the connection
+                raise
+            await self.error_response(e)(scope, receive, send_with_context)
+        finally:
+            request_stats.reset(stats_token)
+            record_request(
+                scope["method"],
+                route_name(app, scope.get("endpoint")),
+                status_code,
+                (finished or time.perf_counter()) - started,
+                stats
+            )
+
+    async def authenticate(self, scope: Scope, state: dict):
+        """Verify the Supabase JWT and add its claims to the request state"""
+        path = scope["path"]
+        if path in PUBLIC_PATHS or path.startswith(PUBLIC_PREFIXES) or scope["method"] == "OPTIONS":
+            return None
+
+        try:
+            state["user"] = await verify_supabase_jwt(Request(scope))
+        except HTTPException as e:
+            # Skip auth errors for auth endpoints
+            if not path.startswith("/auth/"):
+                return JSONResponse(
+                    status_code=e.status_code,
+                    content={"detail": e.detail},
+                    headers=e.headers
+                )
+        return None
+
+    def error_response(self, e: Exception) -> JSONResponse:
+        if isinstance(e, SQLAlchemyError):
+            logger.error(f"Database error: {str(e)}")
+            return JSONResponse(
+                status_code=500,
+                content={"detail": "A database error occurred."}
+            )
+        logger.exception(f"Unexpected error: {str(e)}")
+        return JSONResponse(
+            status_code=500,
+            content={"detail": "An unexpected error occurred."}
+        )
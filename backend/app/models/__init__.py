@@ -1,7 +1,9 @@
 from .database import Base, engine
-from .user import User
+from .user import User, DeletedUser
 from .group import FamilyGroup, GroupMember
-from .recipe import Recipe
+from .recipe import Recipe, RecipeLSHBucket
+from .sync_state import SyncState
+from .outbox import OutboxEvent
 
 # Create all tables
 def create_tables():
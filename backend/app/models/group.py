@@ -1,5 +1,4 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, String, DateTime, ForeignKey, Index, Integer, Uuid, DDL, event
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -8,24 +7,36 @@ import uuid
 class FamilyGroup(Base):
     __tablename__ = "family_groups"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
     name = Column(String, nullable=False)
-    owner_id = Column(UUID(as_uuid=True), ForeignKey("users.id"))
+    owner_id = Column(Uuid, ForeignKey("users.id"))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Bumped by every write to the group or its recipes, list ETags are computed from it
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     # Relationships
     owner = relationship("User", back_populates="owned_groups")
     members = relationship("GroupMember", back_populates="group")
     recipes = relationship("Recipe", back_populates="group")
 
+    __table_args__ = (
+        Index("ix_family_groups_owner_id", "owner_id"),
+    )
+
 class GroupMember(Base):
     __tablename__ = "group_members"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"))
-    group_id = Column(UUID(as_uuid=True), ForeignKey("family_groups.id"))
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    user_id = Column(Uuid, ForeignKey("users.id"))
+    group_id = Column(Uuid, ForeignKey("family_groups.id"))
     joined_at = Column(DateTime(timezone=True), server_default=func.now())
 
     # Relationships
     user = relationship("User", back_populates="group_memberships")
-    group = relationship("FamilyGroup", back_populates="members") 
\ No newline at end of file
+    group = relationship("FamilyGroup", back_populates="members") 
+# Columns and indexes added after the table was first created, see RECIPE_DDL
+for statement in (
+    "ALTER TABLE family_groups ADD COLUMN IF NOT EXISTS version integer NOT NULL DEFAULT 1",
+    "CREATE INDEX IF NOT EXISTS ix_family_groups_owner_id ON family_groups (owner_id)",
+):
+    event.listen(Base.metadata, "after_create", DDL(statement).execute_if(dialect="postgresql"))
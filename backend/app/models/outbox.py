@@ -0,0 +1,19 @@
+from sqlalchemy import Column, String, DateTime, Integer, BigInteger, JSON
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.sql import func
+from .database import Base
+
+class OutboxEvent(Base):
+    """
+    A side effect of a write, such as a cache invalidation, recorded in the
+    write's own transaction and run by the outbox dispatcher once committed
+    """
+    __tablename__ = "outbox_events"
+
+    # SQLite only autoincrements INTEGER primary keys
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    topic = Column(String, nullable=False)
+    payload = Column(JSON().with_variant(JSONB, "postgresql"), nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(String)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -1,5 +1,5 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey
-from sqlalchemy.dialects.postgresql import UUID, JSONB
+from sqlalchemy import Column, String, DateTime, ForeignKey, Index, JSON, Uuid, Integer, BigInteger, SmallInteger, DDL, event
+from sqlalchemy.dialects.postgresql import JSONB, ARRAY
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -8,13 +8,108 @@ import uuid
 class Recipe(Base):
     __tablename__ = "recipes"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
     title = Column(String, nullable=False)
-    ingredients = Column(JSONB, nullable=False)
+    ingredients = Column(JSON().with_variant(JSONB, "postgresql"), nullable=False)
+    # Derived from ingredients on write, see utils.ingredients.ingredient_columns
+    parsed_ingredients = Column(JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), "postgresql"))
+    ingredient_terms = Column(JSON(none_as_null=True).with_variant(ARRAY(String), "postgresql"))
+    # MinHash over ingredients and instructions, see utils.minhash
+    minhash_signature = Column(JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), "postgresql"))
     instructions = Column(String, nullable=False)
     image_url = Column(String)
-    group_id = Column(UUID(as_uuid=True), ForeignKey("family_groups.id"))
+    # URLs of the WebP variants of the image by name, see utils.images.IMAGE_VARIANTS
+    image_variants = Column(JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), "postgresql"))
+    group_id = Column(Uuid, ForeignKey("family_groups.id"))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Bumped on every update, the recipe's ETag and optimistic lock
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     # Relationships
-    group = relationship("FamilyGroup", back_populates="recipes") 
\ No newline at end of file
+    group = relationship("FamilyGroup", back_populates="recipes")
+
+    # Updates check the version they loaded, so a concurrent write fails with StaleDataError
+    __mapper_args__ = {"version_id_col": version}
+
+    __table_args__ = (
+        # Keyset pagination indexes, ordered by (created_at, id)
+        Index("ix_recipes_created_at_id", "created_at", "id"),
+        Index("ix_recipes_group_id_created_at_id", "group_id", "created_at", "id"),
+    )
+
+class RecipeLSHBucket(Base):
+    """LSH band buckets of a recipe's MinHash signature, for near-duplicate lookups"""
+    __tablename__ = "recipe_lsh_buckets"
+
+    recipe_id = Column(Uuid, ForeignKey("recipes.id", ondelete="CASCADE"), primary_key=True)
+    band = Column(SmallInteger, primary_key=True)
+    bucket = Column(BigInteger, nullable=False)
+    group_id = Column(Uuid, nullable=False)
+
+    __table_args__ = (
+        Index("ix_recipe_lsh_buckets_group_id_band_bucket", "group_id", "band", "bucket"),
+    )
+
+# Search columns and indexes, and columns added after the table was first
+# created. For full-text search Postgres keeps a weighted tsvector in a
+# generated column with a GIN index, SQLite (used by the tests) an external
+# content FTS5 table kept current by triggers. Everything is created with
+# IF NOT EXISTS after every create_all, so existing databases are upgraded
+# at startup.
+RECIPE_DDL = {
+    "postgresql": [
+        # Keyset pagination indexes, which create_all skips on existing tables
+        "CREATE INDEX IF NOT EXISTS ix_recipes_created_at_id ON recipes (created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_recipes_group_id_created_at_id ON recipes (group_id, created_at, id)",
+        """
+        ALTER TABLE recipes ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+            setweight(jsonb_to_tsvector('english', ingredients, '["string"]'), 'B') ||
+            setweight(to_tsvector('english', coalesce(instructions, '')), 'C')
+        ) STORED
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_recipes_search_vector ON recipes USING GIN (search_vector)",
+        # Pantry search prunes candidates with an indexed array overlap (&&)
+        "ALTER TABLE recipes ADD COLUMN IF NOT EXISTS ingredient_terms varchar[]",
+        "CREATE INDEX IF NOT EXISTS ix_recipes_ingredient_terms ON recipes USING GIN (ingredient_terms)",
+        "ALTER TABLE recipes ADD COLUMN IF NOT EXISTS parsed_ingredients jsonb",
+        "ALTER TABLE recipes ADD COLUMN IF NOT EXISTS minhash_signature jsonb",
+        "ALTER TABLE recipes ADD COLUMN IF NOT EXISTS image_variants jsonb",
+        "ALTER TABLE recipes ADD COLUMN IF NOT EXISTS version integer NOT NULL DEFAULT 1",
+    ],
+    "sqlite": [
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS recipes_fts USING fts5(
+            title, ingredients, instructions, content='recipes', content_rowid='rowid', tokenize='porter unicode61'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS recipes_fts_insert AFTER INSERT ON recipes BEGIN
+            INSERT INTO recipes_fts(rowid, title, ingredients, instructions)
+            VALUES (new.rowid, new.title, new.ingredients, new.instructions);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS recipes_fts_delete AFTER DELETE ON recipes BEGIN
+            INSERT INTO recipes_fts(recipes_fts, rowid, title, ingredients, instructions)
+            VALUES ('delete', old.rowid, old.title, old.ingredients, old.instructions);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS recipes_fts_update AFTER UPDATE ON recipes BEGIN
+            INSERT INTO recipes_fts(recipes_fts, rowid, title, ingredients, instructions)
+            VALUES ('delete', old.rowid, old.title, old.ingredients, old.instructions);
+            INSERT INTO recipes_fts(rowid, title, ingredients, instructions)
+            VALUES (new.rowid, new.title, new.ingredients, new.instructions);
+        END
+        """,
+    ],
+}
+
+for dialect, statements in RECIPE_DDL.items():
+    for statement in statements:
+        event.listen(Base.metadata, "after_create", DDL(statement).execute_if(dialect=dialect))
+
+# The FTS5 table is not part of the metadata, so drop it with the recipes table
+event.listen(Base.metadata, "before_drop", DDL("DROP TABLE IF EXISTS recipes_fts").execute_if(dialect="sqlite"))
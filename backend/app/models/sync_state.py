@@ -0,0 +1,11 @@
+from sqlalchemy import Column, String, DateTime
+from sqlalchemy.sql import func
+from .database import Base
+
+class SyncState(Base):
+    """Progress of a recurring sync job, such as the watermark of the Supabase user sync"""
+    __tablename__ = "sync_state"
+
+    name = Column(String, primary_key=True)
+    value = Column(String, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, UUID, Enum as SQLEnum
+from sqlalchemy import Column, String, Uuid, Enum as SQLEnum, DDL, event
 from sqlalchemy.sql import func
 from sqlalchemy.types import TIMESTAMP
 from sqlalchemy.orm import relationship
@@ -19,7 +19,7 @@ class UserRole(str, enum.Enum):
 class User(Base):
     __tablename__ = "users"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
     name = Column(String, nullable=False)
     email = Column(String, unique=True, nullable=False)
     password_hash = Column(String)
@@ -29,8 +29,24 @@ class User(Base):
     # Additional fields for premium features
     subscription_expires = Column(TIMESTAMP(timezone=True), nullable=True)
     is_verified = Column(Boolean, default=False)
+    # updated_at of the Supabase Auth user last synced, older events are not applied
+    auth_updated_at = Column(TIMESTAMP(timezone=True), nullable=True)
     
     # Relationships
     owned_groups = relationship("FamilyGroup", back_populates="owner")
     group_memberships = relationship("GroupMember", back_populates="user")
-    
\ No newline at end of file
+
+class DeletedUser(Base):
+    """Tombstone of a user deleted in Supabase Auth, so late or replayed changes cannot bring it back"""
+    __tablename__ = "deleted_users"
+
+    id = Column(Uuid, primary_key=True)
+    # updated_at of the Supabase Auth user when deleted, changes up to it are older than the delete
+    deleted_at = Column(TIMESTAMP(timezone=True), nullable=False)
+
+# Columns added after the table was first created, see RECIPE_DDL
+event.listen(
+    Base.metadata,
+    "after_create",
+    DDL("ALTER TABLE users ADD COLUMN IF NOT EXISTS auth_updated_at timestamptz").execute_if(dialect="postgresql")
+)
@@ -1,21 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request
-from sqlalchemy.orm import Session
-from typing import List
-from ..dependencies import get_db
+from fastapi import APIRouter, Depends, Request, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal
+from ..dependencies import get_async_db
 from ..utils.auth import get_current_user, get_user_id_from_jwt, require_role, UserRole
 from ..schemas.group import GroupCreate, GroupResponse, GroupMemberResponse
+from ..schemas.recipe import RecipeImportResult
 from ..services.group import GroupService
-from ..models.user import User
+from ..services.user import UserService
+from ..services import recipe_import, recipe_export
 from uuid import UUID
-from ..utils.cache import cache_response
+from ..utils.cache import cache_response, json_response
+from ..utils.etag import make_etag
 
 router = APIRouter()
 
+async def group_list_etag(kwargs: dict) -> str:
+    user_id = get_user_id_from_jwt(kwargs["token_data"])
+    return make_etag("groups", *await GroupService().get_owned_group_versions(kwargs["db"], user_id))
+
 @router.post("/", response_model=GroupResponse)
 async def create_group(
     group: GroupCreate,
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     token_data: dict = Depends(get_current_user)
 ):
     """Create a new family group"""
@@ -23,33 +31,39 @@ async def create_group(
     return await GroupService().create_group(db, user_id, group)
 
 @router.get("/", response_model=List[GroupResponse])
-@cache_response(expire_time_seconds=300)  # Cache for 5 minutes
+@cache_response(
+    expire_time_seconds=300,  # Cache for 5 minutes
+    response_model=List[GroupResponse],
+    scope=("user",),
+    tags=lambda kwargs, groups: [f"group:{group.id}" for group in groups],
+    etag=group_list_etag
+)
 async def get_user_groups(
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     token_data: dict = Depends(get_current_user)
 ):
     """Get all groups user belongs to"""
     user_id = get_user_id_from_jwt(token_data)
-    return GroupService().get_user_groups(db, user_id)
+    return await GroupService().get_user_groups(db, user_id)
 
 @router.get("/{group_id}", response_model=GroupResponse)
 async def get_group_by_id(
     group_id: UUID,
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     token_data: dict = Depends(get_current_user)
 ):
     """Get a group by its ID"""
     user_id = get_user_id_from_jwt(token_data)
     group_service = GroupService()
-    return await group_service.get_group_by_id(db, group_id)
+    return json_response(await group_service.get_group_by_id(db, group_id))
 
 @router.delete("/{group_id}")
 async def delete_group(
     group_id: UUID,
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     token_data: dict = Depends(get_current_user)
 ):
     """Delete a family group - Only group owner or admin can delete"""
@@ -60,39 +74,60 @@ async def delete_group(
 async def get_group_members(
     group_id: UUID,
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     token_data: dict = Depends(get_current_user)
 ):
     """Get all members of a group"""
     user_id = get_user_id_from_jwt(token_data)
-    return GroupService().get_group_members(db, user_id, group_id)
+    return await GroupService().get_group_members(db, user_id, group_id)
 
 @router.post("/{group_id}/members", response_model=GroupMemberResponse)
 async def add_group_member(
     group_id: UUID,
     email: str,
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     token_data: dict = Depends(get_current_user)
 ):
     """Add a member to the group"""
     user_id = get_user_id_from_jwt(token_data)
-    user = db.query(User).filter(User.email == email).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-    return GroupService().add_group_member(db, group_id, user.id, user_id)
+    user = await UserService().get_user_by_email(db, email)
+    return await GroupService().add_group_member(db, group_id, user.id, user_id)
 
-@router.delete("/{group_id}/members/{user_id}")
+@router.delete("/{group_id}/members/{member_id}")
 async def remove_group_member(
     group_id: UUID,
     member_id: UUID,
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     token_data: dict = Depends(get_current_user)
 ):
     """Remove a member from the group"""
     user_id = get_user_id_from_jwt(token_data)
-    return GroupService().remove_group_member(db, group_id, member_id, user_id)
\ No newline at end of file
+    return await GroupService().remove_group_member(db, group_id, member_id, user_id)
+
+@router.post("/{group_id}/recipes:import", response_model=RecipeImportResult)
+async def import_group_recipes(
+    group_id: UUID,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    token_data: dict = Depends(require_role(UserRole.MEMBER, UserRole.PREMIUM, UserRole.CREATOR, UserRole.ADMIN, UserRole.SUPER_ADMIN))
+):
+    """Import recipes from a streamed NDJSON or CSV body - Requires MEMBER role or above"""
+    user_id = get_user_id_from_jwt(token_data)
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    return await recipe_import.import_recipes(db, group_id, user_id, request.stream(), content_type)
+
+@router.get("/{group_id}/recipes:export")
+async def export_group_recipes(
+    group_id: UUID,
+    request: Request,
+    format: Literal["ndjson", "csv"] = Query("ndjson"),
+    db: AsyncSession = Depends(get_async_db),
+    token_data: dict = Depends(get_current_user)
+):
+    """Stream all recipes of a group as NDJSON or CSV, compressed on the fly if the client accepts it"""
+    user_id = get_user_id_from_jwt(token_data)
+    chunks = await recipe_export.export_recipes(db, group_id, user_id, format)
+    headers = {"Content-Disposition": f'attachment; filename="recipes-{group_id}.{format}"'}
+    return StreamingResponse(chunks, media_type=recipe_export.MEDIA_TYPES[format], headers=headers)
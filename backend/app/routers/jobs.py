@@ -0,0 +1,17 @@
+from fastapi import APIRouter, Depends, Request
+from uuid import UUID
+from ..schemas.job import JobResponse
+from ..services import jobs as job_service
+from ..utils.auth import get_current_user, get_user_id_from_jwt
+
+router = APIRouter()
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(
+    job_id: UUID,
+    request: Request,
+    token_data: dict = Depends(get_current_user)
+):
+    """Get the status and result of one of the user's background jobs"""
+    user_id = get_user_id_from_jwt(token_data)
+    return await job_service.get_job(job_id, user_id)
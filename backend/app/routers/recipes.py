@@ -1,81 +1,203 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Request
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Request, Response, Query, BackgroundTasks
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from uuid import UUID
 
-from ..dependencies import get_db
+from ..dependencies import get_async_db
 from ..services import recipe as recipe_service
-from ..schemas.recipe import RecipeCreate, RecipeResponse, RecipeUpdate
-from ..utils.cache import cache_response
-from ..utils.auth import get_current_user, get_user_id_from_jwt, require_role, UserRole
+from ..services import recipe_image
+from ..services.group import GroupService
+from ..schemas.recipe import RecipeCreate, RecipeResponse, RecipeUpdate, RecipePage, PantryMatch, RecipeCreateResponse, SimilarRecipe
+from ..schemas.job import JobResponse
+from ..utils.cache import cache_response, variant_response
+from ..utils.etag import make_etag, etag_matches, not_modified, set_etag
+from ..utils.auth import get_current_user, get_user_id_from_jwt, get_user_role, require_role, UserRole
 
 router = APIRouter()
 
-@router.post("/", response_model=RecipeResponse)
+async def recipe_list_tags(kwargs: dict, page: dict) -> List[str]:
+    """Tag a user's recipe list with every group it draws recipes from"""
+    user_id = get_user_id_from_jwt(kwargs["token_data"])
+    group_ids = await GroupService().get_member_group_ids(kwargs["db"], user_id)
+    return [f"group:{group_id}" for group_id in group_ids]
+
+async def recipe_list_etag(kwargs: dict) -> str:
+    """A user's recipe lists change only with their groups, or with a group's version"""
+    group_service = GroupService()
+    user_id = get_user_id_from_jwt(kwargs["token_data"])
+    group_ids = await group_service.get_member_group_ids(kwargs["db"], user_id)
+    return make_etag("recipes", *await group_service.get_group_versions(kwargs["db"], group_ids))
+
+@router.post("/", response_model=RecipeCreateResponse)
 async def create_recipe(
     recipe: RecipeCreate,
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     token_data: dict = Depends(require_role(UserRole.MEMBER, UserRole.PREMIUM, UserRole.CREATOR, UserRole.ADMIN, UserRole.SUPER_ADMIN))
 ):
-    """Create a new recipe - Requires MEMBER role or above"""
+    """Create a new recipe - Requires MEMBER role or above. Near duplicates in the group are listed as possible_duplicates"""
     user_id = get_user_id_from_jwt(token_data)
-    return recipe_service.create_recipe(db, recipe, user_id)
+    db_recipe, possible_duplicates = await recipe_service.create_recipe(db, recipe, user_id)
+    return {
+        **RecipeResponse.model_validate(db_recipe).model_dump(),
+        "possible_duplicates": possible_duplicates
+    }
 
-@router.get("/", response_model=List[RecipeResponse])
-@cache_response(expire_time_seconds=300)
+@router.get("/", response_model=RecipePage)
+@cache_response(
+    expire_time_seconds=300,
+    response_model=RecipePage,
+    scope=("user",),
+    tags=recipe_list_tags,
+    etag=recipe_list_etag
+)
 async def get_recipes(
     request: Request,
-    skip: int = 0,
-    limit: int = 10,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db),
+    token_data: dict = Depends(get_current_user)
+):
+    """Get a page of recipes for user's groups - Any authenticated user"""
+    user_id = get_user_id_from_jwt(token_data)
+    return await recipe_service.get_user_recipes(db, user_id, cursor, limit)
+
+@router.get("/all", response_model=RecipePage)
+async def get_all_recipes(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db),
+    token_data: dict = Depends(require_role(UserRole.ADMIN, UserRole.SUPER_ADMIN))
+):
+    """Get a page of all recipes in the system - Requires ADMIN or above"""
+    return await recipe_service.get_all_recipes(db, cursor, limit)
+
+@router.get("/search", response_model=List[RecipeResponse])
+@cache_response(
+    expire_time_seconds=60,
+    response_model=List[RecipeResponse],
+    scope=("user",),
+    tags=recipe_list_tags
+)
+async def search_recipes(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_async_db),
     token_data: dict = Depends(get_current_user)
 ):
-    """Get all recipes for user's groups - Any authenticated user"""
+    """Search recipes from user's groups by title, ingredients and instructions"""
     user_id = get_user_id_from_jwt(token_data)
-    return recipe_service.get_user_recipes(db, user_id, skip, limit)
+    return await recipe_service.search_recipes(db, user_id, q, limit, offset)
+
+@router.get("/pantry", response_model=List[PantryMatch])
+@cache_response(
+    expire_time_seconds=60,
+    response_model=List[PantryMatch],
+    scope=("user",),
+    tags=recipe_list_tags
+)
+async def find_recipes_by_pantry(
+    request: Request,
+    ingredient: List[str] = Query([]),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db),
+    token_data: dict = Depends(get_current_user)
+):
+    """Recipes from user's groups that can be cooked with the given ingredients, best covered first"""
+    if not 1 <= len(ingredient) <= 50:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Give between 1 and 50 ingredients"
+        )
+    user_id = get_user_id_from_jwt(token_data)
+    return await recipe_service.find_recipes_by_pantry(db, user_id, ingredient, limit)
 
 @router.get("/{recipe_id}", response_model=RecipeResponse)
 async def get_recipe(
     recipe_id: UUID,
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
+    token_data: dict = Depends(get_current_user)
+):
+    """Get a specific recipe - Any authenticated user. Answers 304 if If-None-Match has its ETag"""
+    user_id = get_user_id_from_jwt(token_data)
+    etag, variants = await recipe_service.get_recipe_by_id(db, recipe_id, user_id)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
+    return variant_response(request, variants, etag)
+
+@router.get("/{recipe_id}/similar", response_model=List[SimilarRecipe])
+async def get_similar_recipes(
+    recipe_id: UUID,
+    request: Request,
+    limit: int = Query(10, ge=1, le=50),
+    db: AsyncSession = Depends(get_async_db),
     token_data: dict = Depends(get_current_user)
 ):
-    """Get a specific recipe - Any authenticated user"""
+    """Near-duplicate recipes in the same group, most similar first"""
     user_id = get_user_id_from_jwt(token_data)
-    return await recipe_service.get_recipe_by_id(db, recipe_id, user_id)
+    return await recipe_service.get_similar_recipes(db, recipe_id, user_id, limit)
 
 @router.put("/{recipe_id}", response_model=RecipeResponse)
 async def update_recipe(
     recipe_id: UUID,
     recipe_update: RecipeUpdate,
     request: Request,
-    db: Session = Depends(get_db),
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
     token_data: dict = Depends(require_role(UserRole.MEMBER, UserRole.PREMIUM, UserRole.CREATOR, UserRole.ADMIN, UserRole.SUPER_ADMIN))
 ):
-    """Update a recipe - Requires MEMBER role or above"""
+    """
+    Update a recipe - Requires MEMBER role or above.
+    With If-Match, answers 412 if the recipe was changed since that ETag was read.
+    """
     user_id = get_user_id_from_jwt(token_data)
-    return await recipe_service.update_recipe(db, recipe_id, recipe_update, user_id)
+    recipe = await recipe_service.update_recipe(db, recipe_id, recipe_update, user_id, request.headers.get("if-match"))
+    set_etag(response, recipe_service.recipe_etag(recipe.id, recipe.version))
+    return recipe
 
 @router.delete("/{recipe_id}")
 async def delete_recipe(
     recipe_id: UUID,
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     token_data: dict = Depends(require_role(UserRole.MEMBER, UserRole.PREMIUM, UserRole.CREATOR, UserRole.ADMIN, UserRole.SUPER_ADMIN))
 ):
     """Delete a recipe - Requires MEMBER role or above"""
     user_id = get_user_id_from_jwt(token_data)
     return await recipe_service.delete_recipe(db, recipe_id, user_id)
 
-@router.post("/parse-image")
+@router.put("/{recipe_id}/image", response_model=RecipeResponse)
+async def upload_recipe_image(
+    recipe_id: UUID,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
+    token_data: dict = Depends(require_role(UserRole.MEMBER, UserRole.PREMIUM, UserRole.CREATOR, UserRole.ADMIN, UserRole.SUPER_ADMIN))
+):
+    """
+    Upload the recipe's image as the raw request body - Requires MEMBER role or above.
+    The image is stored right away, its thumbnails are rendered in the background
+    and appear in image_variants once done.
+    """
+    user_id = get_user_id_from_jwt(token_data)
+    recipe, pending = await recipe_image.upload_recipe_image(db, recipe_id, user_id, request.stream())
+    if pending:
+        background_tasks.add_task(recipe_image.store_image_variants, **pending)
+    return recipe
+
+@router.post("/parse-image", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
 async def parse_recipe_from_image(
     request: Request,
     image: UploadFile = File(...),
-    db: Session = Depends(get_db),
     token_data: dict = Depends(require_role(UserRole.PREMIUM, UserRole.ADMIN, UserRole.SUPER_ADMIN))
 ):
-    """Parse recipe from uploaded image - Requires PREMIUM or above"""
+    """
+    Queue parsing a recipe from an uploaded photo - Requires PREMIUM or above.
+    Poll GET /jobs/{id} for the parsed recipe.
+    """
     user_id = get_user_id_from_jwt(token_data)
-    return await recipe_service.parse_recipe_image(db, image, user_id)
\ No newline at end of file
+    return await recipe_image.parse_recipe_image(image, user_id, get_user_role(token_data))
@@ -0,0 +1,43 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Request
+from ..config import get_settings
+from ..schemas.user import SupabaseUserEvent
+from ..services.user_sync import UserSyncBatcher, get_user_sync_batcher, user_change
+from ..utils.webhooks import verify_webhook
+import logging
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+@router.post("/supabase/users")
+async def supabase_user_event(
+    request: Request,
+    batcher: UserSyncBatcher = Depends(get_user_sync_batcher)
+):
+    """
+    Apply a Supabase auth.users change (INSERT, UPDATE or DELETE) to the users table.
+    Signed with SUPABASE_WEBHOOK_SECRET, answers once the change is committed so
+    failed deliveries are retried by Supabase.
+    """
+    secret = get_settings().SUPABASE_WEBHOOK_SECRET
+    if not secret:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="User webhook is not configured"
+        )
+
+    body = await request.body()
+    verify_webhook(secret, request.headers, body)
+    try:
+        event = SupabaseUserEvent.model_validate_json(body)
+        change = user_change(event.type, event.record, event.old_record)
+    except (KeyError, TypeError, ValueError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid user event: {str(e)}"
+        )
+
+    if change is None:
+        # Users without an email address, e.g. phone sign-ins, are not synced
+        return {"status": "ignored"}
+    await batcher.submit(change)
+    return {"status": "applied"}
@@ -0,0 +1,13 @@
+from pydantic import BaseModel
+from datetime import datetime
+from typing import Any, Dict, Literal, Optional
+from uuid import UUID
+
+class JobResponse(BaseModel):
+    id: UUID
+    status: Literal["queued", "running", "succeeded", "failed"]
+    attempts: int
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, field_validator
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional
 from uuid import UUID
 import bleach
 
@@ -26,10 +26,46 @@ class RecipeCreate(RecipeBase):
 class RecipeUpdate(RecipeBase):
     pass
 
+class ParsedIngredient(BaseModel):
+    quantity: Optional[float] = None
+    quantity_max: Optional[float] = None
+    unit: Optional[str] = None
+    name: str
+    notes: Optional[str] = None
+
 class RecipeResponse(RecipeBase):
     id: UUID
     group_id: UUID
     created_at: datetime
+    parsed_ingredients: Optional[List[ParsedIngredient]] = None
+    image_variants: Optional[Dict[str, str]] = None
 
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True
+
+class SimilarRecipe(BaseModel):
+    recipe: RecipeResponse
+    similarity: float
+
+class RecipeCreateResponse(RecipeResponse):
+    # Existing recipes of the group the new one nearly duplicates
+    possible_duplicates: List[SimilarRecipe] = []
+
+class RecipePage(BaseModel):
+    items: List[RecipeResponse]
+    next_cursor: Optional[str] = None
+
+class PantryMatch(BaseModel):
+    recipe: RecipeResponse
+    matched: int
+    missing: int
+    missing_ingredients: List[str]
+
+class RecipeImportError(BaseModel):
+    row: int
+    error: str
+
+class RecipeImportResult(BaseModel):
+    imported: int
+    failed: int
+    errors: List[RecipeImportError]
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, Dict, Any
+from pydantic import BaseModel, EmailStr, Field
+from typing import Optional, Dict, Any, Literal
 from datetime import datetime
 from uuid import UUID
 from enum import Enum
@@ -43,4 +43,12 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     sub: Optional[str] = None  # Supabase uses 'sub' as the user ID
     email: Optional[str] = None
-    role: Optional[str] = None
\ No newline at end of file
+    role: Optional[str] = None
+
+class SupabaseUserEvent(BaseModel):
+    """Payload of a Supabase database webhook on auth.users"""
+    type: Literal["INSERT", "UPDATE", "DELETE"]
+    table: Literal["users"]
+    db_schema: Literal["auth"] = Field(alias="schema")
+    record: Optional[Dict[str, Any]] = None
+    old_record: Optional[Dict[str, Any]] = None
@@ -0,0 +1,117 @@
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from sqlalchemy import select, update, delete, insert, bindparam, or_
+from sqlalchemy.orm import sessionmaker
+from typing import List, Optional, Tuple
+from uuid import UUID
+import argparse
+import logging
+import os
+from ..dependencies import SessionLocal
+from ..models.recipe import Recipe, RecipeLSHBucket
+from ..models.group import FamilyGroup
+from ..services.outbox import add_invalidation
+from ..utils.ingredients import ingredient_columns
+from ..utils.minhash import signature_columns, bucket_rows
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+recipes = Recipe.__table__
+# Bumps the version like any other write, so ETags of the re-rendered recipes change.
+# Core rather than ORM bulk update, which would fail the batch on a concurrent edit
+UPDATE_RECIPE = (
+    update(recipes)
+    .where(recipes.c.id == bindparam("recipe_id"))
+    .values(version=recipes.c.version + 1)
+)
+
+def parse_batch(rows: List[Tuple[UUID, List[str], str, Optional[UUID]]]) -> Tuple[List[dict], List[dict]]:
+    """
+    Parse the ingredients and compute the MinHash signature of a batch of
+    recipes, runs in a worker process. Returns the column values and LSH bucket rows.
+    """
+    values = []
+    buckets = []
+    for recipe_id, ingredients, instructions, group_id in rows:
+        columns = ingredient_columns(ingredients)
+        columns.update(signature_columns(columns["ingredient_terms"], instructions))
+        values.append({"id": recipe_id, **columns})
+        # Recipes of deleted groups are not indexed
+        if group_id is not None:
+            buckets.extend(bucket_rows(recipe_id, group_id, columns["minhash_signature"]))
+    return values, buckets
+
+def backfill_ingredients(
+    session_factory: sessionmaker = SessionLocal,
+    workers: Optional[int] = None,
+    reparse: bool = False
+) -> int:
+    """
+    Parse the ingredients and index the signatures of recipes written before
+    that was done on write, or of every recipe with reparse, e.g. after the parser changed.
+    Batches are read in id order and parsed in parallel worker processes while
+    this process keeps reading and writing back finished batches.
+    """
+    workers = workers or os.cpu_count() or 1
+    total = 0
+    last_id = None
+    pending = deque()
+    with session_factory() as db, ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            query = (
+                select(Recipe.id, Recipe.ingredients, Recipe.instructions, Recipe.group_id)
+                .order_by(Recipe.id)
+                .limit(BATCH_SIZE)
+            )
+            if not reparse:
+                query = query.where(or_(Recipe.parsed_ingredients.is_(None), Recipe.minhash_signature.is_(None)))
+            if last_id is not None:
+                query = query.where(Recipe.id > last_id)
+            rows = [tuple(row) for row in db.execute(query).all()]
+            if rows:
+                last_id = rows[-1][0]
+                pending.append(pool.submit(parse_batch, rows))
+
+            # Keep every worker busy, writing back the oldest batch once enough are queued
+            while pending and (len(pending) >= workers * 2 or not rows):
+                values, buckets = pending.popleft().result()
+                recipe_ids = [row["id"] for row in values]
+                db.execute(UPDATE_RECIPE, [
+                    {"recipe_id": row["id"], **{key: value for key, value in row.items() if key != "id"}}
+                    for row in values
+                ])
+                group_ids = {bucket["group_id"] for bucket in buckets}
+                if group_ids:
+                    db.execute(
+                        update(FamilyGroup)
+                        .where(FamilyGroup.id.in_(group_ids))
+                        .values(version=FamilyGroup.version + 1)
+                    )
+                    # Cached bodies and lists are tagged with their group. Run by the
+                    # app's outbox dispatchers, which poll for events committed elsewhere
+                    add_invalidation(db, [f"group:{group_id}" for group_id in group_ids])
+                db.execute(delete(RecipeLSHBucket).where(RecipeLSHBucket.recipe_id.in_(recipe_ids)))
+                if buckets:
+                    db.execute(insert(RecipeLSHBucket), buckets)
+                db.commit()
+                total += len(values)
+                logger.info(f'Backfilled ingredients for {total} recipes')
+
+            if not rows:
+                return total
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse recipe ingredients into structured columns")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--all", action="store_true", help="Reparse every recipe, not only unparsed ones")
+    args = parser.parse_args()
+
+    total = backfill_ingredients(workers=args.workers, reparse=args.all)
+    logger.info(f'Ingredient backfill completed, {total} recipes updated')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+import argparse
+import asyncio
+import logging
+from ..dependencies import close_redis
+from ..services.jobs import JobWorker
+from ..services.recipe_image import PARSE_IMAGE_QUEUE, run_parse_image_job
+from ..utils.images import shutdown_image_pool
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Handler of every queue, by queue name
+QUEUES = {
+    PARSE_IMAGE_QUEUE: run_parse_image_job,
+}
+
+async def run_workers(concurrency: int = None):
+    """Run a worker for every queue until interrupted"""
+    workers = [JobWorker(queue, handler, concurrency) for queue, handler in QUEUES.items()]
+    logger.info(f'Running job workers for {", ".join(QUEUES)}')
+    try:
+        await asyncio.gather(*(worker.run() for worker in workers))
+    finally:
+        shutdown_image_pool()
+        await close_redis()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run background job workers")
+    parser.add_argument("--concurrency", type=int, default=None, help="Jobs run at a time per queue (default: JOB_CONCURRENCY)")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run_workers(args.concurrency))
+    except KeyboardInterrupt:
+        logger.info('Job workers stopped')
+
+if __name__ == '__main__':
+    main()
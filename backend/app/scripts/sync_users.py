@@ -1,10 +1,16 @@
 import httpx
+import argparse
 import asyncio
-from sqlalchemy import create_engine, text
-from sqlalchemy.exc import IntegrityError
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from sqlalchemy.orm import sessionmaker
+from typing import AsyncIterator, List, Optional, Tuple
+import orjson
 import logging
 from ..config import get_settings
-from ..models.user import UserRole  # Import the UserRole enum
+from ..dependencies import SessionLocal
+from ..models.sync_state import SyncState
+from ..services.user_sync import parse_timestamp, user_values, upsert_users
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -12,96 +18,131 @@ logger = logging.getLogger(__name__)
 
 settings = get_settings()
 
-async def fetch_supabase_users():
-    """Fetch all users from Supabase Auth"""
-    headers = {
-        'apikey': settings.SUPABASE_KEY,
-        'Authorization': f'Bearer {settings.ADMIN_SECRET_KEY}'
-    }
-    
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f'{settings.SUPABASE_URL}/auth/v1/admin/users',
-            headers=headers
-        )
+# Users per page of the admin API
+PAGE_SIZE = 1000
+# Pages downloaded ahead of the writer
+PREFETCH_PAGES = 4
+# Name of the SyncState row holding the updated_at watermark of the last run
+WATERMARK = "supabase_users"
+
+def supabase_client() -> httpx.AsyncClient:
+    """Client for the Supabase Auth admin API"""
+    return httpx.AsyncClient(
+        base_url=settings.SUPABASE_URL,
+        headers={
+            'apikey': settings.SUPABASE_KEY,
+            'Authorization': f'Bearer {settings.ADMIN_SECRET_KEY}'
+        },
+        timeout=30
+    )
+
+async def fetch_supabase_users(
+    client: httpx.AsyncClient,
+    page_size: int = PAGE_SIZE
+) -> AsyncIterator[Tuple[List[dict], Optional[datetime]]]:
+    """Fetch users from Supabase Auth page by page, yielding each page with the server time it was served at"""
+    page = 1
+    while True:
+        response = await client.get('/auth/v1/admin/users', params={'page': page, 'per_page': page_size})
         response.raise_for_status()
-        return response.json()
+        users = orjson.loads(response.content)['users']
+        date = response.headers.get('date')
+        yield users, parsedate_to_datetime(date) if date else None
+        if len(users) < page_size:
+            return
+        page += 1
+
+def get_watermark(session_factory: sessionmaker) -> Optional[datetime]:
+    with session_factory() as db:
+        state = db.get(SyncState, WATERMARK)
+        return parse_timestamp(state.value) if state else None
+
+def set_watermark(session_factory: sessionmaker, watermark: datetime):
+    with session_factory() as db:
+        db.merge(SyncState(name=WATERMARK, value=watermark.isoformat()))
+        db.commit()
+
+async def sync_users(
+    client: httpx.AsyncClient,
+    session_factory: sessionmaker = SessionLocal,
+    full: bool = False,
+    page_size: int = PAGE_SIZE
+) -> dict:
+    """
+    Sync Supabase Auth users into the users table. Changes are applied as
+    they happen by the Supabase webhook, this is the reconciliation pass.
+    Pages are downloaded in the background while earlier ones are written, and
+    only users updated since the watermark of the last run are written, unless
+    full is set. The watermark only advances once every page is written.
+    """
+    watermark = None if full else await asyncio.to_thread(get_watermark, session_factory)
+    pages = asyncio.Queue(maxsize=PREFETCH_PAGES)
+
+    async def download():
+        try:
+            async for page in fetch_supabase_users(client, page_size):
+                await pages.put(page)
+            await pages.put(None)
+        except Exception as e:
+            await pages.put(e)
 
-def sync_user(connection, user_data):
-    """Sync a single user to the application's users table"""
+    fetched = synced = skipped = 0
+    latest = None
+    started_at = None
+    downloader = asyncio.create_task(download())
     try:
-        # Extract user information
-        user_id = user_data['id']
-        email = user_data['email']
-        name = user_data.get('raw_user_meta_data', {}).get('name', email)
-        is_verified = user_data.get('email_confirmed_at') is not None
-        
-        # Check if user exists
-        result = connection.execute(
-            text('SELECT id FROM users WHERE id = :user_id'),
-            {'user_id': user_id}
-        ).fetchone()
-        
-        if result is None:
-            # Insert new user
-            connection.execute(
-                text('''
-                    INSERT INTO users (id, email, name, role, is_verified)
-                    VALUES (:id, :email, :name, :role, :is_verified)
-                '''),
-                {
-                    'id': user_id,
-                    'email': email,
-                    'name': name,
-                    'role': UserRole.MEMBER.value,  # Use the correct enum value
-                    'is_verified': is_verified
-                }
-            )
-            logger.info(f'Created new user record for {email}')
-        else:
-            # Update existing user
-            connection.execute(
-                text('''
-                    UPDATE users
-                    SET email = :email,
-                        name = :name,
-                        is_verified = :is_verified
-                    WHERE id = :id
-                '''),
-                {
-                    'id': user_id,
-                    'email': email,
-                    'name': name,
-                    'is_verified': is_verified
-                }
-            )
-            logger.info(f'Updated existing user record for {email}')
-            
-    except IntegrityError as e:
-        logger.error(f'Error syncing user {email}: {str(e)}')
-    except Exception as e:
-        logger.error(f'Unexpected error syncing user {email}: {str(e)}')
+        while (page := await pages.get()) is not None:
+            if isinstance(page, Exception):
+                raise page
+            users, served_at = page
+            started_at = started_at or served_at
+            fetched += len(users)
+
+            rows = []
+            for user_data in users:
+                updated_at = parse_timestamp(user_data.get('updated_at'))
+                # Users changed at the watermark are synced again, upserts are idempotent
+                if watermark and updated_at and updated_at < watermark:
+                    continue
+                if not user_data.get('email'):
+                    skipped += 1
+                    continue
+                if updated_at and (latest is None or updated_at > latest):
+                    latest = updated_at
+                rows.append(user_values(user_data))
+
+            if rows:
+                synced += await asyncio.to_thread(upsert_users, session_factory, rows)
+            logger.info(f'Fetched {fetched} users, synced {synced}')
+    finally:
+        downloader.cancel()
+
+    if latest:
+        # Users changed while earlier pages were written may not have been
+        # seen, so the watermark never passes the time the first page was served
+        await asyncio.to_thread(set_watermark, session_factory, min(latest, started_at or latest))
+
+    return {
+        'fetched': fetched,
+        'synced': synced,
+        'skipped': skipped
+    }
 
 async def main():
+    parser = argparse.ArgumentParser(description="Sync Supabase Auth users into the users table")
+    parser.add_argument("--full", action="store_true", help="Sync every user, not only users changed since the last run")
+    args = parser.parse_args()
+
     try:
-        # Fetch all Supabase users
-        logger.info('Fetching users from Supabase...')
-        supabase_users = await fetch_supabase_users()
-        
-        # Create database engine
-        engine = create_engine(settings.DATABASE_URL)
-        
-        # Sync each user
-        with engine.connect() as connection:
-            with connection.begin():
-                for user in supabase_users:
-                    sync_user(connection, user)
-        
-        logger.info('User sync completed successfully')
-        
+        logger.info('Syncing users from Supabase...')
+        async with supabase_client() as client:
+            result = await sync_users(client, full=args.full)
+        logger.info(
+            f'User sync completed successfully, {result["synced"]} of {result["fetched"]} users synced'
+        )
     except Exception as e:
         logger.error(f'Sync failed: {str(e)}')
         raise
 
 if __name__ == '__main__':
-    asyncio.run(main()) 
\ No newline at end of file
+    asyncio.run(main())
@@ -1,32 +1,31 @@
 import logging
-from sqlalchemy.orm import Session
-from ..schemas.group import GroupCreate
+from sqlalchemy import select, delete
+from sqlalchemy.orm import selectinload
+from ..schemas.group import GroupCreate, GroupResponse
 from ..models.group import FamilyGroup, GroupMember
 from uuid import UUID
 from sqlalchemy.exc import SQLAlchemyError
 from fastapi import HTTPException, status
-from typing import List
+from typing import List, Iterable, Tuple
 from app.models.user import User, UserRole
-from ..dependencies import get_redis
-import json
-from ..utils.cache import get_redis
+from ..dependencies import DBSession
+from ..utils.cache import get_or_compute
+from .membership import membership_index
+from .outbox import add_invalidation, add_membership_change, outbox_dispatcher
 
 logger = logging.getLogger(__name__)
 
 class GroupService:
-    async def invalidate_group_cache(self, group_id: UUID = None):
-        """Invalidate group cache after modifications"""
-        try:
-            redis = await get_redis()
-            if group_id:
-                # Delete specific group cache
-                await redis.delete(f"group:{group_id}")
-            # Delete list cache
-            await redis.delete("cache:/groups")
-        except Exception as e:
-            logger.error(f"Cache invalidation error: {str(e)}")
+    def invalidate_group_cache(self, db: DBSession, group_id: UUID = None, user_ids: Iterable[UUID] = ()):
+        """Invalidate cached reads affected by a group write, once the caller's transaction commits"""
+        # Group and recipe lists of the affected users
+        tags = [f"user:{user_id}" for user_id in user_ids]
+        if group_id:
+            # Specific group cache and every list that includes the group
+            tags.append(f"group:{group_id}")
+        add_invalidation(db, tags)
 
-    async def create_group(self, db: Session, user_id: UUID, group: GroupCreate) -> FamilyGroup:
+    async def create_group(self, db: DBSession, user_id: UUID, group: GroupCreate) -> FamilyGroup:
         """Create a new family group"""
         try:
             db_group = FamilyGroup(
@@ -34,8 +33,7 @@ class GroupService:
                 owner_id=user_id
             )
             db.add(db_group)
-            db.commit()
-            db.refresh(db_group)
+            await db.flush()
             
             # Add the owner as a member
             member = GroupMember(
@@ -43,65 +41,77 @@ class GroupService:
                 group_id=db_group.id
             )
             db.add(member)
-            db.commit()
-            
-            # Invalidate group list cache
-            await self.invalidate_group_cache()
+            add_membership_change(db, db_group.id, added=[user_id])
+            # Invalidate the owner's group list cache
+            self.invalidate_group_cache(db, user_ids=[user_id])
+            await db.commit()
+            await membership_index.apply(db_group.id, added=[user_id])
+            outbox_dispatcher.notify()
+            await db.refresh(db_group)
             
             return db_group
             
         except SQLAlchemyError as e:
-            db.rollback()
+            await db.rollback()
             logger.error(f"Error creating group: {str(e)}")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Could not create group {e}" 
             )
     
-    def get_user_groups(self, db: Session, user_id: UUID) -> List[FamilyGroup]:
+    async def get_user_groups(self, db: DBSession, user_id: UUID) -> List[FamilyGroup]:
         logger.info(f"Getting all groups for user {user_id}")
-        groups = db.query(FamilyGroup).filter(FamilyGroup.owner_id == user_id).all()
+        result = await db.scalars(select(FamilyGroup).where(FamilyGroup.owner_id == user_id))
+        groups = result.all()
         logger.info(f"Found {len(groups)} groups for user {user_id}")
         return groups
-    
-    async def get_group_by_id(self, db: Session, group_id: UUID) -> FamilyGroup:
-        """Get a group by its ID"""
-        cache_key = f"group:{group_id}"
-        try:
-            redis = await get_redis()
-            cached_group = await redis.get(cache_key)
-            if cached_group:
-                # Parse the cached JSON string back into a FamilyGroup object
-                group_data = json.loads(cached_group)
-                return FamilyGroup(**group_data)
-        except Exception as e:
-            logger.error(f"Cache retrieval error: {str(e)}")
 
-        group = db.query(FamilyGroup).filter(FamilyGroup.id == group_id).first()
+    async def get_member_group_ids(self, db: DBSession, user_id: UUID) -> List[UUID]:
+        """Get the IDs of all groups the user is a member of"""
+        return list(await membership_index.get_group_ids(db, user_id))
+
+    async def get_group_versions(self, db: DBSession, group_ids: Iterable[UUID]) -> List[Tuple[UUID, int]]:
+        """Get the (id, version) of each group, by primary key and ordered by ID"""
+        group_ids = list(group_ids)
+        if not group_ids:
+            return []
+        result = await db.execute(
+            select(FamilyGroup.id, FamilyGroup.version).where(FamilyGroup.id.in_(group_ids)).order_by(FamilyGroup.id)
+        )
+        return [tuple(row) for row in result.all()]
+
+    async def get_owned_group_versions(self, db: DBSession, user_id: UUID) -> List[Tuple[UUID, int]]:
+        """Get the (id, version) of each group the user owns, through the owner_id index"""
+        result = await db.execute(
+            select(FamilyGroup.id, FamilyGroup.version).where(FamilyGroup.owner_id == user_id).order_by(FamilyGroup.id)
+        )
+        return [tuple(row) for row in result.all()]
+    
+    async def _render_group(self, db: DBSession, group_id: UUID) -> bytes:
+        """Load a group and render its response body for caching"""
+        group = await db.get(FamilyGroup, group_id)
         if not group:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Group not found"
             )
-        
-        # Cache the group data as JSON string
-        try:
-            group_data = {
-                "id": str(group.id),
-                "name": group.name,
-                "owner_id": str(group.owner_id),
-                "created_at": group.created_at.isoformat()
-            }
-            await redis.set(cache_key, json.dumps(group_data), ex=300)
-        except Exception as e:
-            logger.error(f"Cache set error: {str(e)}")
+        return GroupResponse.model_validate(group).model_dump_json().encode()
 
-        return group
+    async def get_group_by_id(self, db: DBSession, group_id: UUID) -> bytes:
+        """Get the rendered JSON body of a group by its ID"""
+        return await get_or_compute(
+            f"group:{group_id}",
+            lambda: self._render_group(db, group_id),
+            expire_time_seconds=300,
+            tags=[f"group:{group_id}"],
+            encode=lambda body: body,
+            decode=lambda body: body
+        )
     
-    async def delete_group(self, db: Session, group_id: UUID, user_id: UUID) -> bool:
+    async def delete_group(self, db: DBSession, group_id: UUID, user_id: UUID) -> bool:
         """Delete a family group"""
         # Check if group exists
-        group = db.query(FamilyGroup).filter(FamilyGroup.id == group_id).first()
+        group = await db.get(FamilyGroup, group_id)
         if not group:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -109,7 +119,7 @@ class GroupService:
             )
         
         # Check if user is the owner or has admin privileges
-        user = db.query(User).filter(User.id == user_id).first()
+        user = await db.get(User, user_id)
         if not user or (user.id != group.owner_id and user.role not in [UserRole.ADMIN, UserRole.SUPER_ADMIN]):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -118,28 +128,33 @@ class GroupService:
         
         try:
             # Delete all group members first
-            db.query(GroupMember).filter(GroupMember.group_id == group_id).delete()
+            result = await db.scalars(
+                delete(GroupMember).where(GroupMember.group_id == group_id).returning(GroupMember.user_id)
+            )
+            member_ids = result.all()
             
             # Delete the group
-            db.delete(group)
-            db.commit()
-            
+            await db.delete(group)
+            add_membership_change(db, group_id, removed=member_ids)
             # Invalidate cache
-            await self.invalidate_group_cache(group_id)
+            self.invalidate_group_cache(db, group_id)
+            await db.commit()
+            await membership_index.apply(group_id, removed=member_ids)
+            outbox_dispatcher.notify()
             
             return True
         except SQLAlchemyError as e:
-            db.rollback()
+            await db.rollback()
             logger.error(f"Error deleting group: {str(e)}")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Could not delete group"
             )
     
-    def add_group_member(self, db: Session, group_id: UUID, user_id: UUID, added_by_id: UUID) -> GroupMember:
+    async def add_group_member(self, db: DBSession, group_id: UUID, user_id: UUID, added_by_id: UUID) -> GroupMember:
         """Add a member to the group ensuring the requester has appropriate permissions"""
         # Check if the requester is the owner or has admin privileges
-        requester = db.query(User).filter(User.id == added_by_id).first()
+        requester = await db.get(User, added_by_id)
         if not requester or requester.role not in [UserRole.ADMIN, UserRole.SUPER_ADMIN, UserRole.CREATOR]:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -147,7 +162,7 @@ class GroupService:
             )
         
         # Check if the group exists
-        group = db.query(FamilyGroup).filter(FamilyGroup.id == group_id).first()
+        group = await db.get(FamilyGroup, group_id)
         if not group:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -155,10 +170,12 @@ class GroupService:
             )
         
         # Check if the user is already a member
-        existing_member = db.query(GroupMember).filter(
-            GroupMember.group_id == group_id,
-            GroupMember.user_id == user_id
-        ).first()
+        existing_member = await db.scalar(
+            select(GroupMember).where(
+                GroupMember.group_id == group_id,
+                GroupMember.user_id == user_id
+            ).limit(1)
+        )
         if existing_member:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -168,14 +185,57 @@ class GroupService:
         # Add the new member
         group_member = GroupMember(group_id=group_id, user_id=user_id)
         db.add(group_member)
-        db.commit()
-        db.refresh(group_member)
+        add_membership_change(db, group_id, added=[user_id])
+        # The new member's recipe lists now include the group's recipes
+        self.invalidate_group_cache(db, user_ids=[user_id])
+        await db.commit()
+        await membership_index.apply(group_id, added=[user_id])
+        outbox_dispatcher.notify()
+        # Load the user relationship eagerly since the response includes it
+        await db.refresh(group_member, attribute_names=["joined_at", "user"])
         logger.info(f"Successfully added user {user_id} to group {group_id}")
         return group_member
     
-    def get_group_members(self, db: Session, user_id: UUID, group_id: UUID) -> List[GroupMember]:
+    async def remove_group_member(self, db: DBSession, group_id: UUID, member_id: UUID, removed_by_id: UUID) -> bool:
+        """Remove a member from the group - Group owner, admins or the member themselves"""
+        group = await db.get(FamilyGroup, group_id)
+        if not group:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Group not found"
+            )
+
+        if removed_by_id not in (member_id, group.owner_id):
+            requester = await db.get(User, removed_by_id)
+            if not requester or requester.role not in [UserRole.ADMIN, UserRole.SUPER_ADMIN]:
+                raise HTTPException(
+                    status_code=status.HTTP_403_FORBIDDEN,
+                    detail="Only group owner or admin can remove members"
+                )
+
+        result = await db.execute(
+            delete(GroupMember).where(
+                GroupMember.group_id == group_id,
+                GroupMember.user_id == member_id
+            )
+        )
+        if not result.rowcount:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User is not a member of the group"
+            )
+        add_membership_change(db, group_id, removed=[member_id])
+        # The member's recipe and group lists no longer include the group
+        self.invalidate_group_cache(db, user_ids=[member_id])
+        await db.commit()
+        await membership_index.apply(group_id, removed=[member_id])
+        outbox_dispatcher.notify()
+        logger.info(f"Removed user {member_id} from group {group_id}")
+        return True
+    
+    async def get_group_members(self, db: DBSession, user_id: UUID, group_id: UUID) -> List[GroupMember]:
         """Get all members for group"""
-        requester = db.query(User).filter(User.id == user_id).first()
+        requester = await db.get(User, user_id)
         if not requester or requester.role not in [UserRole.ADMIN, UserRole.SUPER_ADMIN, UserRole.CREATOR]:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -183,7 +243,11 @@ class GroupService:
             )
 
         logger.info(f"Getting all members for group {group_id}")
-        members = db.query(GroupMember).filter(GroupMember.group_id == group_id).all()
+        result = await db.scalars(
+            select(GroupMember).options(
+                selectinload(GroupMember.user)
+            ).where(GroupMember.group_id == group_id)
+        )
+        members = result.all()
         logger.info(f"Found {len(members)} members for group {group_id}")
         return members  # Return GroupMember objects directly instead of user objects
-    
\ No newline at end of file
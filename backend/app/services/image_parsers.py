@@ -0,0 +1,119 @@
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Optional
+from PIL import Image, ImageOps
+import asyncio
+import base64
+import io
+import re
+import httpx
+import orjson
+from ..config import get_settings
+from ..utils.images import get_image_pool
+from ..utils.ingredients import QUANTITY_PATTERN
+from .jobs import PermanentJobError
+
+INGREDIENT_HEADINGS = {"ingredients", "you will need", "you'll need"}
+INSTRUCTION_HEADINGS = {"instructions", "directions", "method", "preparation", "steps"}
+
+VISION_PROMPT = (
+    "Extract the recipe from this photo. Answer with a JSON object with the keys "
+    "\"title\" (string), \"ingredients\" (array of strings, one ingredient line each, "
+    "with amounts) and \"instructions\" (string, one step per line)."
+)
+
+class RecipeImageParser(ABC):
+    """Extracts a recipe from a photo of one, as a dict of title, ingredients and instructions"""
+    @abstractmethod
+    async def parse(self, image: bytes, content_type: str) -> dict:
+        """Parse one image; raise PermanentJobError for failures a retry cannot fix"""
+
+class FakeImageParser(RecipeImageParser):
+    """Returns the same recipe for every image, for tests and local development"""
+    def __init__(self, recipe: Optional[dict] = None):
+        self.recipe = recipe or {
+            "title": "Parsed recipe",
+            "ingredients": ["1 cup flour"],
+            "instructions": "Mix and bake."
+        }
+
+    async def parse(self, image: bytes, content_type: str) -> dict:
+        return dict(self.recipe)
+
+def recipe_from_text(text: str) -> dict:
+    """
+    Split the text of a recipe into title, ingredients and instructions.
+    The first line is the title, headings such as "Ingredients" and "Method"
+    start sections, and outside of sections lines starting with an amount
+    are taken as ingredients.
+    """
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    ingredients = []
+    instructions = []
+    section = None
+    for line in lines[1:]:
+        heading = re.sub(r"[^a-z' ]", "", line.lower()).strip()
+        if heading in INGREDIENT_HEADINGS:
+            section = "ingredients"
+        elif heading in INSTRUCTION_HEADINGS:
+            section = "instructions"
+        elif section == "ingredients" or (section is None and QUANTITY_PATTERN.match(line)):
+            ingredients.append(line.lstrip("-•* "))
+        else:
+            instructions.append(line)
+    return {
+        "title": lines[0] if lines else "",
+        "ingredients": ingredients,
+        "instructions": "\n".join(instructions)
+    }
+
+def _recognize_text(image: bytes) -> str:
+    # Optional, needs the pytesseract package and the tesseract binary
+    import pytesseract
+    with Image.open(io.BytesIO(image)) as photo:
+        return pytesseract.image_to_string(ImageOps.exif_transpose(photo))
+
+class OCRImageParser(RecipeImageParser):
+    """Local OCR with Tesseract, run in the image worker processes"""
+    async def parse(self, image: bytes, content_type: str) -> dict:
+        text = await asyncio.get_running_loop().run_in_executor(get_image_pool(), _recognize_text, image)
+        return recipe_from_text(text)
+
+class VisionImageParser(RecipeImageParser):
+    """A vision model behind an OpenAI compatible chat completions API"""
+    def __init__(self, api_url: str, api_key: str, model: str):
+        self.model = model
+        self.client = httpx.AsyncClient(
+            base_url=api_url,
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=90
+        )
+
+    async def parse(self, image: bytes, content_type: str) -> dict:
+        image_url = f"data:{content_type};base64,{base64.b64encode(image).decode()}"
+        response = await self.client.post("/chat/completions", json={
+            "model": self.model,
+            "response_format": {"type": "json_object"},
+            "messages": [{
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": VISION_PROMPT},
+                    {"type": "image_url", "image_url": {"url": image_url}}
+                ]
+            }]
+        })
+        if 400 <= response.status_code < 500 and response.status_code != 429:
+            # Rejected requests fail the same way on every attempt
+            raise PermanentJobError(f"Vision API rejected the image: {response.status_code}")
+        response.raise_for_status()
+        return orjson.loads(response.json()["choices"][0]["message"]["content"])
+
+@lru_cache()
+def get_image_parser() -> RecipeImageParser:
+    """The parser backend selected by IMAGE_PARSER"""
+    settings = get_settings()
+    if settings.IMAGE_PARSER == "fake":
+        return FakeImageParser()
+    if settings.IMAGE_PARSER == "ocr":
+        return OCRImageParser()
+    return VisionImageParser(settings.VISION_API_URL, settings.VISION_API_KEY, settings.VISION_MODEL)
@@ -0,0 +1,250 @@
+from redis.exceptions import ResponseError
+from fastapi import HTTPException, status
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, List, Optional, Tuple
+from uuid import UUID, uuid4
+import asyncio
+import os
+import socket
+import time
+import orjson
+from ..config import get_settings
+from ..dependencies import get_redis
+import logging
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+# Streams of a queue in the order workers take jobs from them
+PRIORITIES = ("premium", "standard")
+CONSUMER_GROUP = "workers"
+# Bound on the entries kept per stream, acknowledged entries are deleted right away
+STREAM_MAX_LENGTH = 100000
+# How long an idle worker waits on the streams per read
+BLOCK_MILLISECONDS = 1000
+# How often a worker looks for jobs left pending by crashed workers
+CLAIM_INTERVAL_SECONDS = 30
+# Bound on the retries moved back to the streams per read
+PROMOTE_BATCH_SIZE = 100
+
+# Moves retries whose backoff is over from each delayed set to its stream.
+# KEYS are pairs of delayed set and stream, ARGV the time, batch size and max length
+PROMOTE_DUE_SCRIPT = """
+local moved = 0
+for i = 1, #KEYS, 2 do
+    local due = redis.call('ZRANGEBYSCORE', KEYS[i], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+    for _, job_id in ipairs(due) do
+        redis.call('ZREM', KEYS[i], job_id)
+        redis.call('XADD', KEYS[i + 1], 'MAXLEN', '~', ARGV[3], '*', 'job_id', job_id)
+        moved = moved + 1
+    end
+end
+return moved
+"""
+
+JobHandler = Callable[[dict], Awaitable[dict]]
+
+class PermanentJobError(Exception):
+    """Raised by a job handler for failures that retrying cannot fix"""
+
+def stream_key(queue: str, priority: str) -> str:
+    return f"jobs:{queue}:{priority}"
+
+def delayed_key(stream: str) -> str:
+    """Sorted set of the jobs waiting out a retry backoff, scored by when they are due"""
+    return f"{stream}:delayed"
+
+def job_key(job_id) -> str:
+    return f"job:{job_id}"
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def _job_response(job: dict) -> dict:
+    fields = {key.decode(): value.decode() for key, value in job.items()}
+    return {
+        "id": fields["id"],
+        "status": fields["status"],
+        "attempts": int(fields["attempts"]),
+        "result": orjson.loads(fields["result"]) if fields.get("result") else None,
+        "error": fields.get("error") or None,
+        "created_at": fields["created_at"],
+        "updated_at": fields["updated_at"]
+    }
+
+async def enqueue_job(queue: str, payload: dict, user_id: UUID, priority: str = "standard") -> dict:
+    """Queue a job for the workers of a queue and return its status"""
+    redis = await get_redis()
+    job_id = str(uuid4())
+    now = _now()
+    job = {
+        "id": job_id,
+        "user_id": str(user_id),
+        "status": "queued",
+        "payload": orjson.dumps(payload),
+        "attempts": 0,
+        "created_at": now,
+        "updated_at": now
+    }
+    pipe = redis.pipeline(transaction=True)
+    pipe.hset(job_key(job_id), mapping=job)
+    # Jobs no worker picks up within the TTL expire with it
+    pipe.expire(job_key(job_id), settings.JOB_RESULT_TTL_SECONDS)
+    pipe.xadd(stream_key(queue, priority), {"job_id": job_id}, maxlen=STREAM_MAX_LENGTH, approximate=True)
+    await pipe.execute()
+    return _job_response({key.encode(): str(value).encode() for key, value in job.items() if key != "payload"})
+
+async def get_job(job_id: UUID, user_id: UUID) -> dict:
+    """Get the status and result of a job, raises 404 unless it belongs to the user"""
+    redis = await get_redis()
+    job = await redis.hgetall(job_key(job_id))
+    if not job or job.get(b"user_id", b"").decode() != str(user_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    return _job_response(job)
+
+class JobWorker:
+    """
+    Runs the jobs of one queue with up to concurrency handlers at a time,
+    premium jobs first. Workers share the streams through a consumer group,
+    and jobs left pending by a crashed worker are claimed by another after
+    JOB_CLAIM_IDLE_SECONDS. Failed jobs are retried with exponential backoff
+    until JOB_MAX_ATTEMPTS, waiting in a delayed set rather than in a worker,
+    and results are kept for JOB_RESULT_TTL_SECONDS.
+    """
+    def __init__(self, queue: str, handler: JobHandler, concurrency: Optional[int] = None, consumer: Optional[str] = None):
+        self.queue = queue
+        self.handler = handler
+        self.concurrency = concurrency or settings.JOB_CONCURRENCY
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.streams = [stream_key(queue, priority) for priority in PRIORITIES]
+        self._claimed_at = 0.0
+
+    async def setup(self, redis):
+        for stream in self.streams:
+            try:
+                await redis.xgroup_create(stream, CONSUMER_GROUP, id="0", mkstream=True)
+            except ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+
+    async def promote_due(self, redis) -> int:
+        """Move the retries whose backoff is over back to their streams"""
+        keys = [key for stream in self.streams for key in (delayed_key(stream), stream)]
+        return await redis.register_script(PROMOTE_DUE_SCRIPT)(
+            keys=keys, args=[time.time(), PROMOTE_BATCH_SIZE, STREAM_MAX_LENGTH]
+        )
+
+    async def next_entries(self, redis) -> List[Tuple[str, bytes, dict]]:
+        """Read the next jobs, stale pending ones first, then premium before standard"""
+        await self.promote_due(redis)
+        if time.monotonic() - self._claimed_at > CLAIM_INTERVAL_SECONDS:
+            self._claimed_at = time.monotonic()
+            for stream in self.streams:
+                _, entries, *_ = await redis.xautoclaim(
+                    stream, CONSUMER_GROUP, self.consumer,
+                    min_idle_time=settings.JOB_CLAIM_IDLE_SECONDS * 1000, count=self.concurrency
+                )
+                if entries:
+                    return [(stream, message_id, fields) for message_id, fields in entries]
+
+        for stream in self.streams:
+            response = await redis.xreadgroup(CONSUMER_GROUP, self.consumer, {stream: ">"}, count=1)
+            if response:
+                return [(stream, message_id, fields) for message_id, fields in response[0][1]]
+
+        # Nothing queued, wait for a job on any stream
+        response = await redis.xreadgroup(
+            CONSUMER_GROUP, self.consumer, {stream: ">" for stream in self.streams},
+            count=1, block=BLOCK_MILLISECONDS
+        )
+        return [
+            (stream.decode(), message_id, fields)
+            for stream, entries in response or []
+            for message_id, fields in entries
+        ]
+
+    async def _update(self, redis, key: str, expire: bool = False, **fields):
+        pipe = redis.pipeline(transaction=True)
+        pipe.hset(key, mapping={**fields, "updated_at": _now()})
+        if expire:
+            pipe.expire(key, settings.JOB_RESULT_TTL_SECONDS)
+        await pipe.execute()
+
+    async def _ack(self, redis, stream: str, message_id: bytes):
+        pipe = redis.pipeline(transaction=True)
+        pipe.xack(stream, CONSUMER_GROUP, message_id)
+        pipe.xdel(stream, message_id)
+        await pipe.execute()
+
+    async def process(self, redis, stream: str, message_id: bytes, fields: Optional[dict]):
+        """
+        Run one job. The entry is only acknowledged once the job is finished or
+        queued again, so a job interrupted by shutdown is claimed by another worker.
+        """
+        payload = await redis.hget(job_key(fields[b"job_id"].decode()), "payload") if fields else None
+        if payload is None:
+            # Deleted entry, or the job expired before a worker got to it
+            await self._ack(redis, stream, message_id)
+            return
+
+        job_id = fields[b"job_id"].decode()
+        key = job_key(job_id)
+        attempts = await redis.hincrby(key, "attempts", 1)
+        if attempts > settings.JOB_MAX_ATTEMPTS:
+            # Claimed again after taking down the workers that ran it
+            await self._update(redis, key, expire=True, status="failed", error="Worker lost the job")
+            await self._ack(redis, stream, message_id)
+            return
+        await self._update(redis, key, status="running")
+        try:
+            result = await asyncio.wait_for(self.handler(orjson.loads(payload)), settings.JOB_TIMEOUT_SECONDS)
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            logger.error(f"Job {job_id} failed on attempt {attempts}: {error}")
+            if attempts < settings.JOB_MAX_ATTEMPTS and not isinstance(e, PermanentJobError):
+                await self._retry(redis, stream, message_id, job_id, attempts, error)
+                return
+            await self._update(redis, key, expire=True, status="failed", error=error)
+        else:
+            await self._update(redis, key, expire=True, status="succeeded", result=orjson.dumps(result), error="")
+        await self._ack(redis, stream, message_id)
+
+    async def _retry(self, redis, stream: str, message_id: bytes, job_id: str, attempts: int, error: str):
+        """
+        Queue a failed job again after its backoff and acknowledge the entry, in one
+        transaction. The job waits in the delayed set, so it holds no slot meanwhile.
+        """
+        due = time.time() + settings.JOB_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1)
+        pipe = redis.pipeline(transaction=True)
+        pipe.hset(job_key(job_id), mapping={"status": "queued", "error": error, "updated_at": _now()})
+        pipe.zadd(delayed_key(stream), {job_id: due})
+        pipe.xack(stream, CONSUMER_GROUP, message_id)
+        pipe.xdel(stream, message_id)
+        await pipe.execute()
+
+    async def run(self):
+        """Process jobs until cancelled, unfinished jobs are picked up again by the claim"""
+        redis = await get_redis()
+        await self.setup(redis)
+        running = set()
+        try:
+            while True:
+                while len(running) >= self.concurrency:
+                    await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                try:
+                    entries = await self.next_entries(redis)
+                except Exception as e:
+                    logger.error(f"Job queue error: {str(e)}")
+                    await asyncio.sleep(1)
+                    continue
+                for entry in entries:
+                    task = asyncio.create_task(self.process(redis, *entry))
+                    running.add(task)
+                    task.add_done_callback(running.discard)
+        finally:
+            for task in running:
+                task.cancel()
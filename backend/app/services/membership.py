@@ -0,0 +1,135 @@
+from sqlalchemy import select
+from uuid import UUID
+from typing import FrozenSet, Iterable
+import orjson
+from ..models.group import GroupMember
+from redis.exceptions import WatchError
+from ..dependencies import DBSession, get_redis
+from ..utils.cache import local_cache, INVALIDATION_CHANNEL
+from ..utils.metrics import record_cache_lookup
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on how long a missed index update can go unnoticed
+MEMBERSHIP_TTL_SECONDS = 60 * 60
+
+# Marks a set as loaded from the database. Sets without it were only
+# touched by writes and may be missing groups, so they are reloaded
+COMPLETE_MARKER = b""
+
+def membership_key(user_id: UUID) -> str:
+    """Key of the set of group IDs a user belongs to, in Redis and the L1 tier"""
+    return f"membership:{user_id}"
+
+def generation_key(user_id: UUID) -> str:
+    """Counter bumped by every change to a user's set, so loads can tell they raced one"""
+    return f"membership:{user_id}:generation"
+
+class MembershipIndex:
+    """
+    Maps each user to the set of group IDs they belong to, so access checks
+    are set lookups instead of GroupMember queries. Sets live in Redis with the
+    per-worker L1 tier in front, and group writes keep both tiers current
+    through the outbox.
+    """
+    async def _load(self, db: DBSession, user_id: UUID) -> FrozenSet[UUID]:
+        result = await db.scalars(select(GroupMember.group_id).where(GroupMember.user_id == user_id))
+        return frozenset(result.all())
+
+    async def get_group_ids(self, db: DBSession, user_id: UUID) -> FrozenSet[UUID]:
+        """Get the IDs of all groups the user is a member of"""
+        key = membership_key(user_id)
+        group_ids = local_cache.get(key)
+        if group_ids is not None:
+            record_cache_lookup("membership", True)
+            return group_ids
+
+        try:
+            redis = await get_redis()
+            # The generation is read before loading, so changes during the load are noticed
+            members, generation = await (
+                redis.pipeline(transaction=False).smembers(key).get(generation_key(user_id)).execute()
+            )
+        except Exception as e:
+            logger.error(f"Membership index error: {str(e)}")
+            record_cache_lookup("membership", False)
+            return await self._load(db, user_id)
+
+        record_cache_lookup("membership", COMPLETE_MARKER in members)
+        if COMPLETE_MARKER in members:
+            group_ids = frozenset(UUID(member.decode()) for member in members if member != COMPLETE_MARKER)
+        else:
+            group_ids = await self._load(db, user_id)
+            if not await self._store(redis, user_id, generation, group_ids):
+                return group_ids
+
+        local_cache.set(key, group_ids)
+        return group_ids
+
+    async def _store(self, redis, user_id: UUID, generation, group_ids: FrozenSet[UUID]) -> bool:
+        """
+        Replace a user's set with a load from the database and mark it complete,
+        unless a membership change was recorded since the load began. Such a
+        load may predate the change, and storing it would undo the change.
+        """
+        key = membership_key(user_id)
+        try:
+            async with redis.pipeline(transaction=True) as pipe:
+                await pipe.watch(generation_key(user_id))
+                if await pipe.get(generation_key(user_id)) != generation:
+                    return False
+                pipe.multi()
+                pipe.delete(key)
+                pipe.sadd(key, COMPLETE_MARKER, *(str(group_id) for group_id in group_ids))
+                pipe.expire(key, MEMBERSHIP_TTL_SECONDS)
+                await pipe.execute()
+            return True
+        except WatchError:
+            return False
+        except Exception as e:
+            logger.error(f"Membership index error: {str(e)}")
+            return False
+
+    async def is_member(self, db: DBSession, user_id: UUID, group_id: UUID) -> bool:
+        """Check if user is a member of the group"""
+        return group_id in await self.get_group_ids(db, user_id)
+
+    async def update(self, group_id: UUID, added: Iterable[UUID] = (), removed: Iterable[UUID] = ()):
+        """
+        Record members joining and leaving a group, after the change is committed.
+        Run by the outbox dispatcher, which retries it if Redis fails.
+        """
+        keys = []
+        try:
+            redis = await get_redis()
+            pipe = redis.pipeline(transaction=True)
+            for user_id in added:
+                keys.append(membership_key(user_id))
+                pipe.sadd(keys[-1], str(group_id))
+                pipe.expire(keys[-1], MEMBERSHIP_TTL_SECONDS)
+                pipe.incr(generation_key(user_id))
+                pipe.expire(generation_key(user_id), MEMBERSHIP_TTL_SECONDS)
+            for user_id in removed:
+                keys.append(membership_key(user_id))
+                pipe.srem(keys[-1], str(group_id))
+                pipe.incr(generation_key(user_id))
+                pipe.expire(generation_key(user_id), MEMBERSHIP_TTL_SECONDS)
+            if keys:
+                # Evict the changed sets from the L1 tier of every worker
+                pipe.publish(INVALIDATION_CHANNEL, orjson.dumps(keys))
+                await pipe.execute()
+        finally:
+            local_cache.delete_many(keys)
+
+    async def apply(self, group_id: UUID, added: Iterable[UUID] = (), removed: Iterable[UUID] = ()):
+        """
+        Apply a committed membership change right away, so the next request is
+        checked against it. Best effort: the change's outbox event retries it.
+        """
+        try:
+            await self.update(group_id, added, removed)
+        except Exception as e:
+            logger.error(f"Membership index update error: {str(e)}")
+
+membership_index = MembershipIndex()
@@ -0,0 +1,175 @@
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.orm import Session, sessionmaker
+from starlette.concurrency import run_in_threadpool
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+import asyncio
+import time
+import orjson
+from ..config import get_settings
+from ..dependencies import SessionLocal, get_redis
+from ..models.outbox import OutboxEvent
+from ..utils.auth import apply_revocations, revoked_key
+from ..utils.cache import invalidate, INVALIDATION_CHANNEL
+from .membership import membership_index
+import logging
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+CACHE_INVALIDATION = "cache.invalidate"
+MEMBERSHIP_CHANGE = "membership.change"
+TOKEN_REVOCATION = "auth.revoke"
+# Postgres advisory lock held while draining, so events run one batch at a
+# time in ID order even with a dispatcher in every worker
+OUTBOX_LOCK_ID = 0x6f7574626f78
+
+OutboxHandler = Callable[[dict], Awaitable[None]]
+
+def add_event(db, topic: str, payload: dict):
+    """Record an event in the session, it is dispatched once the caller's transaction commits"""
+    db.add(OutboxEvent(topic=topic, payload=payload))
+
+def add_invalidation(db, tags: Iterable[str]):
+    """Invalidate cache tags once the caller's transaction commits"""
+    tags = sorted(set(tags))
+    if tags:
+        add_event(db, CACHE_INVALIDATION, {"tags": tags})
+
+def add_membership_change(db, group_id: UUID, added: Iterable[UUID] = (), removed: Iterable[UUID] = ()):
+    """Update the membership index once the caller's transaction commits"""
+    added, removed = [str(user_id) for user_id in added], [str(user_id) for user_id in removed]
+    if added or removed:
+        add_event(db, MEMBERSHIP_CHANGE, {"group_id": str(group_id), "added": added, "removed": removed})
+
+def add_token_revocation(db, user_ids: Iterable[UUID]):
+    """Reject the users' current tokens in every worker once the caller's transaction commits"""
+    user_ids = sorted(str(user_id) for user_id in user_ids)
+    if user_ids:
+        add_event(db, TOKEN_REVOCATION, {"user_ids": user_ids})
+
+async def _invalidate(payload: dict):
+    await invalidate(payload["tags"])
+
+async def _change_membership(payload: dict):
+    await membership_index.update(
+        UUID(payload["group_id"]),
+        added=[UUID(user_id) for user_id in payload["added"]],
+        removed=[UUID(user_id) for user_id in payload["removed"]]
+    )
+
+async def _revoke_tokens(payload: dict):
+    keys = [revoked_key(user_id) for user_id in payload["user_ids"]]
+    redis = await get_redis()
+    pipe = redis.pipeline(transaction=True)
+    for key in keys:
+        pipe.set(key, time.time(), ex=settings.JWT_REVOCATION_TTL_SECONDS)
+    pipe.publish(INVALIDATION_CHANNEL, orjson.dumps(keys))
+    await pipe.execute()
+    apply_revocations(keys)
+
+def _claim_batch(db: Session, limit: int) -> List[Tuple[int, str, dict]]:
+    if db.get_bind().dialect.name == "postgresql":
+        # Released with the transaction, another worker is draining if not acquired
+        if not db.scalar(select(func.pg_try_advisory_xact_lock(OUTBOX_LOCK_ID))):
+            return []
+    rows = db.execute(
+        select(OutboxEvent.id, OutboxEvent.topic, OutboxEvent.payload)
+        .where(OutboxEvent.attempts < settings.OUTBOX_MAX_ATTEMPTS)
+        .order_by(OutboxEvent.id)
+        .limit(limit)
+    ).all()
+    return [tuple(row) for row in rows]
+
+def _finish_batch(db: Session, done: List[int], failed: Optional[Tuple[int, str]]):
+    if done:
+        db.execute(delete(OutboxEvent).where(OutboxEvent.id.in_(done)))
+    if failed:
+        event_id, error = failed
+        db.execute(
+            update(OutboxEvent)
+            .where(OutboxEvent.id == event_id)
+            .values(attempts=OutboxEvent.attempts + 1, last_error=error)
+        )
+    db.commit()
+
+class OutboxDispatcher:
+    """
+    Runs the side effects recorded in the outbox off the request path, in the
+    order their events were inserted. IDs are assigned on insert, so events of
+    concurrent transactions may run in a different order than they committed.
+    An event is deleted only after its handler succeeded, so each runs at
+    least once and handlers must be idempotent. A failing event holds back
+    the ones after it until it succeeds or has been tried OUTBOX_MAX_ATTEMPTS
+    times, when it is left in the table for inspection.
+    """
+    def __init__(self, session_factory: sessionmaker = SessionLocal, batch_size: Optional[int] = None):
+        self.session_factory = session_factory
+        self.batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+        self.handlers: Dict[str, OutboxHandler] = {
+            CACHE_INVALIDATION: _invalidate,
+            MEMBERSHIP_CHANGE: _change_membership,
+            TOKEN_REVOCATION: _revoke_tokens
+        }
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def register(self, topic: str, handler: OutboxHandler):
+        """Run handler for the events of a topic"""
+        self.handlers[topic] = handler
+
+    def notify(self):
+        """Wake the dispatcher after committing events, rather than waiting for the next poll"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def dispatch_batch(self) -> Tuple[int, bool]:
+        """Run the oldest pending events, returns how many ran and whether one failed"""
+        db = self.session_factory()
+        try:
+            events = await run_in_threadpool(_claim_batch, db, self.batch_size)
+            done, failed = [], None
+            for event_id, topic, payload in events:
+                try:
+                    handler = self.handlers.get(topic)
+                    if handler is None:
+                        raise LookupError(f"No handler for outbox topic {topic}")
+                    await handler(payload)
+                except Exception as e:
+                    logger.error(f"Outbox event {event_id} ({topic}) failed: {str(e)}")
+                    failed = (event_id, str(e) or type(e).__name__)
+                    break
+                done.append(event_id)
+            if events:
+                await run_in_threadpool(_finish_batch, db, done, failed)
+            return len(done), failed is not None
+        finally:
+            await run_in_threadpool(db.close)
+
+    async def drain(self) -> int:
+        """Run pending events until none are left or one fails, returns how many ran"""
+        total = 0
+        while True:
+            dispatched, failed = await self.dispatch_batch()
+            total += dispatched
+            if failed or dispatched < self.batch_size:
+                return total
+
+    async def run(self):
+        """Dispatch events until cancelled, failed events are retried every poll"""
+        self._wakeup = asyncio.Event()
+        try:
+            while True:
+                self._wakeup.clear()
+                try:
+                    await self.drain()
+                except Exception as e:
+                    logger.error(f"Outbox dispatch error: {str(e)}")
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), settings.OUTBOX_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._wakeup = None
+
+outbox_dispatcher = OutboxDispatcher()
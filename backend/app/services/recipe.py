@@ -1,199 +1,372 @@
-from sqlalchemy.orm import Session
-from fastapi import HTTPException, status, UploadFile
-from uuid import UUID
-from typing import List
-import asyncio
+from sqlalchemy import select, insert, update, delete, exists, func, literal_column, text, table, column, cast, any_, and_, or_, String
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm.exc import StaleDataError
+from fastapi import HTTPException, status
+from uuid import UUID, uuid4
+from typing import Dict, List, Optional, Tuple
 import json
 
-from ..models.recipe import Recipe
-from ..models.group import GroupMember
-from ..schemas.recipe import RecipeCreate, RecipeUpdate
-from ..dependencies import get_redis
-from ..utils.cache import get_redis
+from ..models.recipe import Recipe, RecipeLSHBucket
+from ..models.group import FamilyGroup, GroupMember
+from ..schemas.recipe import RecipeCreate, RecipeUpdate, RecipeResponse
+from ..dependencies import DBSession
+from ..utils.pagination import keyset_paginate, build_page
+from ..utils.cache import get_or_compute
+from ..utils.etag import make_etag, check_if_match
+from ..utils.compression import precompress, pack_variants, unpack_variants
+from ..utils.ingredients import ingredient_columns, normalize_ingredient
+from ..utils.minhash import signature_columns, bucket_rows, lsh_buckets, estimate_similarity
+from .membership import membership_index
+from .outbox import add_invalidation, outbox_dispatcher
 import logging
 
 logger = logging.getLogger(__name__)
 
-def check_recipe_access(db: Session, recipe_id: UUID, user_id: UUID) -> bool:
-    """Check if user has access to the recipe through group membership"""
-    return db.query(Recipe).join(
-        GroupMember, Recipe.group_id == GroupMember.group_id
-    ).filter(
-        Recipe.id == recipe_id,
+# Estimated Jaccard similarity from which recipes are reported as near duplicates
+SIMILARITY_THRESHOLD = 0.5
+# Bucket matches scored per lookup, the most colliding recipes first
+SIMILAR_CANDIDATES = 50
+
+async def fetch_recipe_with_access(db: DBSession, recipe_id: UUID, user_id: UUID) -> Tuple[Recipe, bool]:
+    """
+    Load a recipe together with whether the user belongs to its group, in one query.
+    Raises 404 if the recipe does not exist.
+    """
+    is_member = exists().where(
+        GroupMember.group_id == Recipe.group_id,
         GroupMember.user_id == user_id
-    ).first() is not None
+    )
+    row = (await db.execute(
+        select(Recipe, is_member.label("has_access")).where(Recipe.id == recipe_id)
+    )).first()
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Recipe not found"
+        )
+    return row.Recipe, bool(row.has_access)
 
-async def invalidate_recipe_cache(recipe_id: UUID = None):
-    """Invalidate recipe cache after modifications"""
-    try:
-        redis = await get_redis()
-        try:
-            if recipe_id:
-                # Delete specific recipe cache
-                await redis.delete(f"recipe:{recipe_id}")
-            # Delete list cache if applicable
-            await redis.delete("cache:/recipes")
-        finally:
-            await redis.close()
-    except Exception as e:
-        logger.error(f"Cache invalidation error: {str(e)}")
+async def get_accessible_recipe(db: DBSession, recipe_id: UUID, user_id: UUID) -> Recipe:
+    """Load a recipe the user has access to, raising 404 or 403 otherwise"""
+    recipe, has_access = await fetch_recipe_with_access(db, recipe_id, user_id)
+    if not has_access:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+    return recipe
+
+def invalidate_recipe_cache(db: DBSession, recipe_id: UUID = None, group_id: UUID = None):
+    """Invalidate cached reads affected by a recipe write, once the caller's transaction commits"""
+    tags = []
+    if recipe_id:
+        # Specific recipe cache
+        tags.append(f"recipe:{recipe_id}")
+    if group_id:
+        # Recipe lists of every member of the group
+        tags.append(f"group:{group_id}")
+    add_invalidation(db, tags)
 
-def create_recipe(db: Session, recipe: RecipeCreate, user_id: UUID) -> Recipe:
-    """Create a new recipe after verifying user is member of the group"""
+def group_version_bump(group_id: UUID):
+    """Statement bumping a group's version, so list ETags covering its recipes change"""
+    return update(FamilyGroup).where(FamilyGroup.id == group_id).values(version=FamilyGroup.version + 1)
+
+async def record_recipe_write(db: DBSession, recipe_id: UUID = None, group_id: UUID = None):
+    """Bump the group's version and invalidate cached reads, with the caller's commit"""
+    await db.execute(group_version_bump(group_id))
+    invalidate_recipe_cache(db, recipe_id, group_id)
+
+def recipe_etag(recipe_id: UUID, version: int) -> str:
+    return make_etag("recipe", recipe_id, version)
+
+async def replace_lsh_buckets(db: DBSession, recipe: Recipe):
+    """Re-index a recipe's signature, flushed with the caller's commit"""
+    await db.execute(delete(RecipeLSHBucket).where(RecipeLSHBucket.recipe_id == recipe.id))
+    await db.execute(insert(RecipeLSHBucket), bucket_rows(recipe.id, recipe.group_id, recipe.minhash_signature))
+
+async def find_similar_recipes(
+    db: DBSession,
+    group_id: UUID,
+    signature: List[int],
+    exclude_id: Optional[UUID] = None,
+    limit: int = 10
+) -> List[dict]:
+    """
+    Find near duplicates of a signature within a group. Candidates are the
+    recipes sharing at least one LSH bucket, found through the bucket index,
+    so only those are loaded and scored rather than the whole group.
+    """
+    shares_bucket = or_(*(
+        and_(RecipeLSHBucket.band == band, RecipeLSHBucket.bucket == bucket)
+        for band, bucket in lsh_buckets(signature)
+    ))
+    query = (
+        select(RecipeLSHBucket.recipe_id)
+        .where(RecipeLSHBucket.group_id == group_id, shares_bucket)
+        .group_by(RecipeLSHBucket.recipe_id)
+        .order_by(func.count().desc())
+        .limit(SIMILAR_CANDIDATES)
+    )
+    if exclude_id is not None:
+        query = query.where(RecipeLSHBucket.recipe_id != exclude_id)
+    candidate_ids = (await db.scalars(query)).all()
+    if not candidate_ids:
+        return []
+
+    candidates = (await db.scalars(select(Recipe).where(Recipe.id.in_(candidate_ids)))).all()
+    scored = [
+        (estimate_similarity(signature, candidate.minhash_signature), candidate)
+        for candidate in candidates if candidate.minhash_signature
+    ]
+    scored.sort(key=lambda match: (-match[0], str(match[1].id)))
+    return [
+        {"recipe": candidate, "similarity": similarity}
+        for similarity, candidate in scored if similarity >= SIMILARITY_THRESHOLD
+    ][:limit]
+
+async def create_recipe(db: DBSession, recipe: RecipeCreate, user_id: UUID) -> Tuple[Recipe, List[dict]]:
+    """
+    Create a new recipe after verifying user is member of the group.
+    Returns the recipe and the existing recipes of the group it nearly duplicates.
+    """
     # Check if user is member of the group
-    membership = db.query(GroupMember).filter(
-        GroupMember.group_id == recipe.group_id,
-        GroupMember.user_id == user_id
-    ).first()
-    
-    if not membership:
+    if not await membership_index.is_member(db, user_id, recipe.group_id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="User is not a member of this group"
         )
     
+    ingredients = ingredient_columns(recipe.ingredients)
     db_recipe = Recipe(
+        id=uuid4(),
         title=recipe.title,
         ingredients=recipe.ingredients,
         instructions=recipe.instructions,
         image_url=recipe.image_url,
-        group_id=recipe.group_id
+        group_id=recipe.group_id,
+        # Parsed once here so reads never re-parse the ingredient lines
+        **ingredients,
+        **signature_columns(ingredients["ingredient_terms"], recipe.instructions)
     )
+    # Looked up before the insert, so the new recipe is not its own duplicate
+    possible_duplicates = await find_similar_recipes(db, db_recipe.group_id, db_recipe.minhash_signature)
     
     db.add(db_recipe)
-    db.commit()
-    db.refresh(db_recipe)
-    # Run cache invalidation in the background
-    asyncio.create_task(invalidate_recipe_cache())
-    return db_recipe
+    await db.flush()
+    await replace_lsh_buckets(db, db_recipe)
+    await record_recipe_write(db, group_id=db_recipe.group_id)
+    await db.commit()
+    outbox_dispatcher.notify()
+    await db.refresh(db_recipe)
+    return db_recipe, possible_duplicates
 
-def get_public_recipes(db: Session, skip: int = 0, limit: int = 10) -> List[Recipe]:
+async def get_public_recipes(db: DBSession, skip: int = 0, limit: int = 10) -> List[Recipe]:
     """Get public recipes only"""
-    return db.query(Recipe).filter(
-        Recipe.is_public == True
-    ).offset(skip).limit(limit).all()
+    result = await db.scalars(
+        select(Recipe).where(Recipe.is_public == True).offset(skip).limit(limit)
+    )
+    return result.all()
 
-def get_user_recipes(db: Session, user_id: UUID, skip: int = 0, limit: int = 10) -> List[Recipe]:
-    """Get all recipes from groups user is member of"""
-    return db.query(Recipe).join(
+async def get_user_recipes(db: DBSession, user_id: UUID, cursor: Optional[str] = None, limit: int = 10) -> dict:
+    """Get a page of recipes from groups user is member of, newest first"""
+    query = select(Recipe).join(
         GroupMember, Recipe.group_id == GroupMember.group_id
-    ).filter(
+    ).where(
         GroupMember.user_id == user_id
-    ).offset(skip).limit(limit).all()
+    )
+    result = await db.scalars(keyset_paginate(query, Recipe, cursor, limit))
+    return build_page(result.all(), limit)
 
-def get_all_recipes(db: Session, user_id: UUID = None, skip: int = 0, limit: int = 10) -> List[Recipe]:
-    """Get all recipes in the system - Admin only"""
-    return db.query(Recipe).offset(skip).limit(limit).all()
+def _fts5_query(q: str) -> str:
+    """Quote each search term so user input is never parsed as FTS5 query syntax"""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in q.split())
 
-async def get_recipe_by_id(db: Session, recipe_id: UUID, user_id: UUID) -> Recipe:
-    """Get a specific recipe if user has access"""
-    cache_key = f"recipe:{recipe_id}"
-    try:
-        redis = await get_redis()
-        cached_recipe = await redis.get(cache_key)
-        if cached_recipe:
-            return Recipe.parse_raw(cached_recipe)
-    except Exception as e:
-        logger.error(f"Cache retrieval error: {str(e)}")
+async def search_recipes(db: DBSession, user_id: UUID, q: str, limit: int = 20, offset: int = 0) -> List[Recipe]:
+    """Full-text search over the recipes of groups user is member of, best matches first"""
+    group_ids = await membership_index.get_group_ids(db, user_id)
+    if not group_ids or not q.strip():
+        return []
 
-    # Fetch from database
-    recipe = db.query(Recipe).filter(Recipe.id == recipe_id).first()
-    if not recipe:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Recipe not found"
-        )
-    
-    # Check if user has access through group membership
-    if not check_recipe_access(db, recipe_id, user_id):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied"
-        )
+    query = select(Recipe).where(Recipe.group_id.in_(group_ids))
+    if db.get_bind().dialect.name == "sqlite":
+        # Title, ingredients and instructions are weighted like the tsvector below
+        recipes_fts = table("recipes_fts", column("rowid"))
+        query = query.join(
+            recipes_fts, recipes_fts.c.rowid == literal_column("recipes.rowid")
+        ).where(
+            text("recipes_fts MATCH :q").bindparams(q=_fts5_query(q))
+        ).order_by(text("bm25(recipes_fts, 10.0, 5.0, 1.0)"), Recipe.id)
+    else:
+        search_vector = literal_column("recipes.search_vector")
+        ts_query = func.websearch_to_tsquery(literal_column("'english'::regconfig"), q)
+        query = query.where(
+            search_vector.op("@@")(ts_query)
+        ).order_by(func.ts_rank(search_vector, ts_query).desc(), Recipe.id)
 
-    # Cache the recipe
-    try:
-        await redis.set(cache_key, recipe.json(), ex=300)  # Cache for 5 minutes
-    except Exception as e:
-        logger.error(f"Cache set error: {str(e)}")
+    result = await db.scalars(query.offset(offset).limit(limit))
+    return result.all()
 
-    return recipe
+async def find_recipes_by_pantry(db: DBSession, user_id: UUID, pantry: List[str], limit: int = 20) -> List[dict]:
+    """
+    Rank recipes from groups user is member of by how well the pantry covers them:
+    fewest missing ingredients first, then most matched
+    """
+    terms = sorted({term for term in map(normalize_ingredient, pantry) if term})
+    group_ids = await membership_index.get_group_ids(db, user_id)
+    if not group_ids or not terms:
+        return []
+
+    if db.get_bind().dialect.name == "sqlite":
+        term = func.json_each(Recipe.ingredient_terms).table_valued("value")
+        matched = select(func.count()).select_from(term).where(term.c.value.in_(terms)).scalar_subquery()
+        total = func.json_array_length(Recipe.ingredient_terms)
+        candidates = matched > 0
+    else:
+        pantry_terms = cast(terms, ARRAY(String))
+        term = func.unnest(Recipe.ingredient_terms).table_valued("term").render_derived()
+        matched = select(func.count()).select_from(term).where(term.c.term == any_(pantry_terms)).scalar_subquery()
+        total = func.cardinality(Recipe.ingredient_terms)
+        # Only recipes sharing at least one ingredient, found through the GIN index
+        candidates = Recipe.ingredient_terms.op("&&")(pantry_terms)
+
+    missing = (total - matched).label("missing")
+    matched = matched.label("matched")
+    result = await db.execute(
+        select(Recipe, matched, missing).where(
+            Recipe.group_id.in_(group_ids),
+            candidates
+        ).order_by(missing, matched.desc(), Recipe.id).limit(limit)
+    )
+    pantry_terms = set(terms)
+    return [
+        {
+            "recipe": row.Recipe,
+            "matched": row.matched,
+            "missing": row.missing,
+            "missing_ingredients": [term for term in row.Recipe.ingredient_terms if term not in pantry_terms]
+        }
+        for row in result.all()
+    ]
+
+async def get_all_recipes(db: DBSession, cursor: Optional[str] = None, limit: int = 10) -> dict:
+    """Get a page of all recipes in the system, newest first - Admin only"""
+    result = await db.scalars(keyset_paginate(select(Recipe), Recipe, cursor, limit))
+    return build_page(result.all(), limit)
+
+async def get_recipe_by_id(db: DBSession, recipe_id: UUID, user_id: UUID) -> Tuple[str, Dict[str, bytes]]:
+    """
+    Get the ETag and rendered JSON body of a specific recipe if user has access,
+    the body with its precompressed variants by content coding
+    """
+    has_access = None
+
+    async def render() -> Tuple[UUID, int, Dict[str, bytes]]:
+        # On a miss, access is checked by the same query that loads the recipe
+        nonlocal has_access
+        recipe, has_access = await fetch_recipe_with_access(db, recipe_id, user_id)
+        body = RecipeResponse.model_validate(recipe).model_dump_json().encode()
+        return recipe.group_id, recipe.version, await precompress(body)
+
+    # The cached body is shared by all users, so access is checked on every read.
+    # The owning group ID and the version the body was rendered from are stored
+    # as a 16 and an 8 byte prefix in front of the body, so the ETag always
+    # matches the body it is sent with.
+    group_id, version, variants = await get_or_compute(
+        f"recipe:{recipe_id}:body",
+        render,
+        expire_time_seconds=300,  # Cache for 5 minutes
+        tags=lambda entry: [f"recipe:{recipe_id}", f"group:{entry[0]}"],
+        encode=lambda entry: entry[0].bytes + entry[1].to_bytes(8, "big") + pack_variants(entry[2]),
+        decode=lambda raw: (UUID(bytes=raw[:16]), int.from_bytes(raw[16:24], "big"), unpack_variants(raw[24:]))
+    )
 
-async def update_recipe(db: Session, recipe_id: UUID, recipe_update: RecipeUpdate, user_id: UUID) -> Recipe:
-    """Update a recipe if user has access"""
-    # Check if recipe exists and user has access
-    recipe = db.query(Recipe).filter(Recipe.id == recipe_id).first()
-    if not recipe:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Recipe not found"
-        )
-    
     # Check if user has access through group membership
-    if not check_recipe_access(db, recipe_id, user_id):
+    if has_access is None:
+        has_access = await membership_index.is_member(db, user_id, group_id)
+    if not has_access:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied"
         )
+
+    return recipe_etag(recipe_id, version), variants
+
+async def update_recipe(
+    db: DBSession,
+    recipe_id: UUID,
+    recipe_update: RecipeUpdate,
+    user_id: UUID,
+    if_match: Optional[str] = None
+) -> Recipe:
+    """Update a recipe if user has access, and if given, the If-Match header matches its ETag"""
+    # Check if recipe exists and user has access
+    recipe = await get_accessible_recipe(db, recipe_id, user_id)
+    check_if_match(if_match, recipe_etag(recipe.id, recipe.version))
     
     # Update recipe attributes
     for var, value in vars(recipe_update).items():
         if value is not None:
             setattr(recipe, var, value)
+    ingredients = ingredient_columns(recipe.ingredients)
+    for var, value in {**ingredients, **signature_columns(ingredients["ingredient_terms"], recipe.instructions)}.items():
+        setattr(recipe, var, value)
     
     try:
-        db.commit()
-        db.refresh(recipe)
-        await invalidate_recipe_cache(recipe_id)
+        await replace_lsh_buckets(db, recipe)
+        await record_recipe_write(db, recipe_id, recipe.group_id)
+        await db.commit()
+        outbox_dispatcher.notify()
+        await db.refresh(recipe)
         return recipe
+    except StaleDataError:
+        # Updated by another request since it was loaded
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail="The resource was changed since it was read"
+        )
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error updating recipe: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to update recipe"
         )
 
-async def delete_recipe(db: Session, recipe_id: UUID, user_id: UUID) -> bool:
+async def get_similar_recipes(db: DBSession, recipe_id: UUID, user_id: UUID, limit: int = 10) -> List[dict]:
+    """Near duplicates of a recipe within its group, most similar first"""
+    recipe = await get_accessible_recipe(db, recipe_id, user_id)
+    signature = recipe.minhash_signature
+    if signature is None:
+        # Not backfilled yet, other recipes can still be matched against it
+        signature = signature_columns(recipe.ingredient_terms or [], recipe.instructions)["minhash_signature"]
+    return await find_similar_recipes(db, recipe.group_id, signature, exclude_id=recipe.id, limit=limit)
+
+async def delete_recipe(db: DBSession, recipe_id: UUID, user_id: UUID) -> bool:
     """Delete a recipe if user has access"""
-    # First check if recipe exists
-    recipe = db.query(Recipe).filter(Recipe.id == recipe_id).first()
-    if not recipe:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Recipe not found"
-        )
-    
-    # Check if user has access through group membership
-    if not check_recipe_access(db, recipe_id, user_id):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied"
-        )
+    # Check if recipe exists and user has access
+    recipe = await get_accessible_recipe(db, recipe_id, user_id)
     
     try:
         # Delete the recipe
-        db.delete(recipe)
-        db.commit()
-        # Invalidate cache
-        await invalidate_recipe_cache(recipe_id)
+        group_id = recipe.group_id
+        await db.execute(delete(RecipeLSHBucket).where(RecipeLSHBucket.recipe_id == recipe_id))
+        await db.delete(recipe)
+        await record_recipe_write(db, recipe_id, group_id)
+        await db.commit()
+        outbox_dispatcher.notify()
         return True
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error deleting recipe: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to delete recipe"
         )
 
-async def parse_recipe_image(db: Session, image: UploadFile, user_id: UUID):
-    """Parse recipe from image - Premium feature"""
-    # TODO: Implement GPT-4 Vision integration
-    pass
-
-def feature_recipe(db: Session, recipe_id: UUID) -> Recipe:
+async def feature_recipe(db: DBSession, recipe_id: UUID) -> Recipe:
     """Feature a recipe - Admin only"""
-    recipe = db.query(Recipe).filter(Recipe.id == recipe_id).first()
+    recipe = await db.get(Recipe, recipe_id)
     if not recipe:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -201,6 +374,6 @@ def feature_recipe(db: Session, recipe_id: UUID) -> Recipe:
         )
     
     recipe.is_featured = True
-    db.commit()
-    db.refresh(recipe)
-    return recipe 
\ No newline at end of file
+    await db.commit()
+    await db.refresh(recipe)
+    return recipe
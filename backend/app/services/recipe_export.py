@@ -0,0 +1,73 @@
+from sqlalchemy import select
+from fastapi import HTTPException, status
+from uuid import UUID
+from typing import AsyncIterator
+import csv
+import io
+import orjson
+
+from ..models.recipe import Recipe
+from ..dependencies import DBSession
+from .membership import membership_index
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched from the server-side cursor and encoded per chunk
+EXPORT_BATCH_SIZE = 500
+
+EXPORT_COLUMNS = ("id", "title", "ingredients", "instructions", "image_url", "created_at")
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+def _encode_ndjson(rows) -> bytes:
+    return b"".join(orjson.dumps(row._asdict()) + b"\n" for row in rows)
+
+def _encode_csv(rows) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        # Ingredients are written as a JSON array, as accepted by recipes:import
+        writer.writerow([
+            row.id,
+            row.title,
+            orjson.dumps(row.ingredients).decode(),
+            row.instructions,
+            row.image_url or "",
+            row.created_at.isoformat() if row.created_at else ""
+        ])
+    return buffer.getvalue().encode()
+
+async def _export_rows(db: DBSession, group_id: UUID, format: str) -> AsyncIterator[bytes]:
+    if format == "csv":
+        yield (",".join(EXPORT_COLUMNS) + "\r\n").encode()
+    encode = _encode_csv if format == "csv" else _encode_ndjson
+
+    # Plain rows rather than ORM objects, so nothing accumulates in the session
+    result = await db.stream(
+        select(*(getattr(Recipe, column) for column in EXPORT_COLUMNS))
+        .where(Recipe.group_id == group_id)
+        .order_by(Recipe.created_at, Recipe.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    try:
+        async for rows in result.partitions(EXPORT_BATCH_SIZE):
+            yield encode(rows)
+    finally:
+        await result.close()
+
+async def export_recipes(db: DBSession, group_id: UUID, user_id: UUID, format: str = "ndjson") -> AsyncIterator[bytes]:
+    """
+    Stream every recipe of a group as NDJSON or CSV, oldest first.
+    Rows are read through a server-side cursor in batches, so memory use does
+    not grow with the size of the group.
+    """
+    if not await membership_index.is_member(db, user_id, group_id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+    return _export_rows(db, group_id, format)
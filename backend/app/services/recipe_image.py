@@ -0,0 +1,190 @@
+from sqlalchemy import update
+from sqlalchemy.orm import sessionmaker
+from fastapi import HTTPException, status, UploadFile
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+from uuid import UUID
+from typing import AsyncIterator, Dict, Optional, Tuple
+import anyio
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+
+from ..models.recipe import Recipe
+from ..models.user import UserRole
+from ..schemas.recipe import RecipeBase
+from ..config import get_settings
+from ..dependencies import DBSession, SessionLocal
+from ..utils.images import (
+    IMAGE_VARIANTS, SIGNATURE_BYTES, sniff_image_type, image_key, variant_key, render_variants, get_image_pool
+)
+from ..utils.storage import get_image_store, CHUNK_SIZE
+from .recipe import get_accessible_recipe, invalidate_recipe_cache, group_version_bump, record_recipe_write
+from .image_parsers import get_image_parser
+from .jobs import enqueue_job, PermanentJobError
+from .outbox import outbox_dispatcher
+import logging
+
+logger = logging.getLogger(__name__)
+
+PARSE_IMAGE_QUEUE = "parse-image"
+# Roles whose image parsing jobs are run first
+PRIORITY_ROLES = {UserRole.PREMIUM, UserRole.ADMIN, UserRole.SUPER_ADMIN}
+
+async def _receive_image(body: AsyncIterator[bytes], path: str) -> Tuple[str, str, str]:
+    """
+    Stream an uploaded image to a local file, hashing it on the way.
+    Returns its SHA-256 hex digest, content type and extension.
+    """
+    max_bytes = get_settings().IMAGE_MAX_BYTES
+    digest = hashlib.sha256()
+    head = b""
+    size = 0
+    async with await anyio.open_file(path, "wb") as file:
+        async for chunk in body:
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"Images are limited to {max_bytes // (1024 * 1024)} MB"
+                )
+            if len(head) < SIGNATURE_BYTES:
+                head += chunk[:SIGNATURE_BYTES - len(head)]
+            digest.update(chunk)
+            await file.write(chunk)
+
+    image_type = sniff_image_type(head)
+    if image_type is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Upload a JPEG, PNG, GIF or WebP image"
+        )
+    return (digest.hexdigest(), *image_type)
+
+async def _store_image(body: AsyncIterator[bytes], directory: str) -> Tuple[str, str, str]:
+    """
+    Receive an uploaded image into directory and store it, unless an identical
+    image is stored already. Returns its digest, content type and key.
+    """
+    original = os.path.join(directory, "original")
+    digest, content_type, extension = await _receive_image(body, original)
+    store = get_image_store()
+    key = image_key(digest, extension)
+    if not await store.exists(key):
+        await store.put_file(key, original, content_type)
+    return digest, content_type, key
+
+def _set_image_variants(session_factory: sessionmaker, recipe_id: UUID, image_url: str, variants: Dict[str, str]):
+    with session_factory() as db:
+        # Skipped if another image was uploaded for the recipe in the meantime
+        group_id = db.execute(
+            update(Recipe)
+            .where(Recipe.id == recipe_id, Recipe.image_url == image_url)
+            .values(image_variants=variants, version=Recipe.version + 1)
+            .returning(Recipe.group_id)
+        ).scalar()
+        if group_id is not None:
+            db.execute(group_version_bump(group_id))
+            invalidate_recipe_cache(db, recipe_id, group_id)
+        db.commit()
+
+async def store_image_variants(
+    recipe_id: UUID,
+    digest: str,
+    image_url: str,
+    directory: str,
+    session_factory: sessionmaker = SessionLocal
+):
+    """
+    Render the WebP variants of an uploaded image in the image worker processes,
+    store them and record their URLs on the recipe. Runs after the upload is
+    answered and removes the upload's temporary directory when done.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+        paths = await loop.run_in_executor(
+            get_image_pool(), render_variants, os.path.join(directory, "original"), directory
+        )
+        store = get_image_store()
+        for variant, path in paths.items():
+            await store.put_file(variant_key(digest, variant), path, "image/webp")
+
+        variants = {variant: store.url(variant_key(digest, variant)) for variant in paths}
+        await run_in_threadpool(_set_image_variants, session_factory, recipe_id, image_url, variants)
+        outbox_dispatcher.notify()
+    except Exception as e:
+        logger.error(f"Error rendering image variants for recipe {recipe_id}: {str(e)}")
+    finally:
+        await run_in_threadpool(shutil.rmtree, directory, True)
+
+async def upload_recipe_image(
+    db: DBSession,
+    recipe_id: UUID,
+    user_id: UUID,
+    body: AsyncIterator[bytes]
+) -> Tuple[Recipe, Optional[dict]]:
+    """
+    Store an image for a recipe from a streamed body. Images are keyed by their
+    SHA-256, so an image uploaded before is neither stored nor rendered again.
+    Returns the recipe and, if the variants still have to be rendered, the
+    arguments for store_image_variants.
+    """
+    recipe = await get_accessible_recipe(db, recipe_id, user_id)
+    store = get_image_store()
+
+    directory = await run_in_threadpool(tempfile.mkdtemp, "", "recipe-image-")
+    try:
+        digest, _, original_key = await _store_image(body, directory)
+        variants = {variant: store.url(variant_key(digest, variant)) for variant in IMAGE_VARIANTS}
+        rendered = await store.exists(variant_key(digest, list(IMAGE_VARIANTS)[-1]))
+
+        recipe.image_url = store.url(original_key)
+        recipe.image_variants = variants if rendered else None
+        await record_recipe_write(db, recipe_id, recipe.group_id)
+        await db.commit()
+        outbox_dispatcher.notify()
+        await db.refresh(recipe)
+    except BaseException:
+        await run_in_threadpool(shutil.rmtree, directory, True)
+        raise
+
+    if rendered:
+        await run_in_threadpool(shutil.rmtree, directory, True)
+        return recipe, None
+    return recipe, {
+        "recipe_id": recipe.id,
+        "digest": digest,
+        "image_url": recipe.image_url,
+        "directory": directory
+    }
+
+async def _upload_chunks(upload: UploadFile) -> AsyncIterator[bytes]:
+    while chunk := await upload.read(CHUNK_SIZE):
+        yield chunk
+
+async def parse_recipe_image(image: UploadFile, user_id: UUID, role: UserRole) -> dict:
+    """
+    Store a photo of a recipe and queue a job extracting the recipe from it.
+    Returns the job, whose result is the recipe once a worker has parsed it.
+    """
+    directory = await run_in_threadpool(tempfile.mkdtemp, "", "recipe-image-")
+    try:
+        _, content_type, key = await _store_image(_upload_chunks(image), directory)
+    finally:
+        await run_in_threadpool(shutil.rmtree, directory, True)
+
+    priority = "premium" if role in PRIORITY_ROLES else "standard"
+    return await enqueue_job(PARSE_IMAGE_QUEUE, {"image_key": key, "content_type": content_type}, user_id, priority)
+
+async def run_parse_image_job(payload: dict) -> dict:
+    """Job handler of the parse-image queue, the result is an unsaved recipe"""
+    store = get_image_store()
+    image = await store.read(payload["image_key"])
+    recipe = await get_image_parser().parse(image, payload["content_type"])
+    try:
+        parsed = RecipeBase.model_validate({**recipe, "image_url": store.url(payload["image_key"])})
+    except ValidationError as e:
+        raise PermanentJobError(f"No recipe found in the image: {str(e)}")
+    return parsed.model_dump()
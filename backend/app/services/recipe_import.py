@@ -0,0 +1,235 @@
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from fastapi import HTTPException, status
+from pydantic import ValidationError
+from uuid import UUID, uuid4
+from typing import AsyncIterator, List, Optional, Tuple
+import csv
+import orjson
+
+from ..models.recipe import Recipe, RecipeLSHBucket
+from ..schemas.recipe import RecipeCreate
+from ..dependencies import DBSession
+from ..utils.ingredients import ingredient_columns
+from ..utils.minhash import signature_columns, bucket_rows
+from .membership import membership_index
+from .recipe import record_recipe_write
+from .outbox import outbox_dispatcher
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Rows per multi-row INSERT and per commit
+IMPORT_BATCH_SIZE = 1000
+# Longer lines are reported as failed rows rather than buffered
+MAX_LINE_BYTES = 1024 * 1024
+
+RECIPE_COLUMNS = {"title", "ingredients", "instructions", "image_url", "group_id"}
+
+async def _iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Optional[bytes]]:
+    """
+    Split a streamed body into lines without reading it all into memory.
+    Lines longer than MAX_LINE_BYTES are skipped and yielded as None.
+    """
+    buffer = b""
+    skipping = False
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if skipping:
+                # The end of a line already yielded as too long
+                skipping = False
+                continue
+            yield line if len(line) <= MAX_LINE_BYTES else None
+        if len(buffer) > MAX_LINE_BYTES:
+            if not skipping:
+                yield None
+            skipping = True
+            buffer = b""
+    if buffer and not skipping:
+        yield buffer
+
+def _line_too_long() -> ValueError:
+    return ValueError(f"Line longer than {MAX_LINE_BYTES} bytes")
+
+def _decode(line: bytes) -> str:
+    return line.decode("utf-8-sig", errors="replace").rstrip("\r")
+
+async def _ndjson_rows(lines: AsyncIterator[Optional[bytes]]) -> AsyncIterator[Tuple[int, object]]:
+    """One JSON object per line, blank lines are skipped"""
+    row = 0
+    async for line in lines:
+        row += 1
+        if line is None:
+            yield row, _line_too_long()
+            continue
+        if not line.strip():
+            continue
+        try:
+            yield row, orjson.loads(line)
+        except orjson.JSONDecodeError as e:
+            yield row, ValueError(f"Invalid JSON: {str(e)}")
+
+def _parse_ingredients(value: str) -> object:
+    """Ingredients are a JSON array, or one ingredient per line"""
+    if value.lstrip().startswith("["):
+        return orjson.loads(value)
+    return [line.strip() for line in value.splitlines() if line.strip()]
+
+async def _csv_rows(lines: AsyncIterator[Optional[bytes]]) -> AsyncIterator[Tuple[int, object]]:
+    """A header row followed by one recipe per record, quoted fields may span lines"""
+    header = None
+    row = 0
+    record = ""
+    async for line in lines:
+        if line is None or len(record) + len(line) > MAX_LINE_BYTES:
+            # The record is dropped, along with any quoted field it left open
+            row += 1
+            record = ""
+            yield row, _line_too_long()
+            continue
+        record += _decode(line) if not record else "\n" + _decode(line)
+        # A quoted field continues on the next line until its quotes are balanced
+        if record.count('"') % 2:
+            continue
+        values, record = next(csv.reader([record]), []), ""
+        if not values:
+            continue
+        if header is None:
+            header = [name.strip().lower() for name in values]
+            continue
+        row += 1
+        try:
+            data = dict(zip(header, values))
+            if "ingredients" in data:
+                data["ingredients"] = _parse_ingredients(data["ingredients"])
+            yield row, data
+        except orjson.JSONDecodeError as e:
+            yield row, ValueError(f"Invalid ingredients: {str(e)}")
+    if record:
+        yield row + 1, ValueError("Unterminated quoted field")
+
+PARSERS = {
+    "application/x-ndjson": _ndjson_rows,
+    "application/jsonl": _ndjson_rows,
+    "text/csv": _csv_rows,
+}
+
+def _describe(error: Exception) -> str:
+    if isinstance(error, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(part) for part in e['loc'])}: {e['msg']}" for e in error.errors()
+        )
+    return str(error)
+
+async def _insert(db: DBSession, batch: List[Tuple[int, dict]]):
+    await db.execute(insert(Recipe), [values for _, values in batch])
+    await db.execute(insert(RecipeLSHBucket), [
+        bucket for _, values in batch
+        for bucket in bucket_rows(values["id"], values["group_id"], values["minhash_signature"])
+    ])
+
+async def _insert_batch(db: DBSession, batch: List[Tuple[int, dict]], errors: List[dict]) -> int:
+    """
+    Insert a batch in a single multi-row INSERT. If that fails, the batch is
+    retried row by row, each under a savepoint, and only failing rows are reported.
+    """
+    try:
+        await _insert(db, batch)
+        await db.commit()
+        return len(batch)
+    except SQLAlchemyError as e:
+        await db.rollback()
+        logger.error(f"Error importing recipes, retrying row by row: {str(e)}")
+
+    saved = []
+    for row, values in batch:
+        try:
+            async with db.begin_nested():
+                await _insert(db, [(row, values)])
+            saved.append(row)
+        except SQLAlchemyError as e:
+            logger.error(f"Error importing recipe of row {row}: {str(e)}")
+            errors.append({"row": row, "error": "Could not save recipe"})
+    try:
+        await db.commit()
+        return len(saved)
+    except SQLAlchemyError as e:
+        await db.rollback()
+        logger.error(f"Error importing recipes: {str(e)}")
+        errors.extend({"row": row, "error": "Could not save recipe"} for row in saved)
+        return 0
+
+async def _record_import(db: DBSession, group_id: UUID):
+    """Bump the group's version and invalidate its cached reads once, after the last batch"""
+    try:
+        await record_recipe_write(db, group_id=group_id)
+        await db.commit()
+        outbox_dispatcher.notify()
+    except SQLAlchemyError as e:
+        await db.rollback()
+        logger.error(f"Error invalidating imported recipes: {str(e)}")
+
+async def import_recipes(
+    db: DBSession,
+    group_id: UUID,
+    user_id: UUID,
+    body: AsyncIterator[bytes],
+    content_type: str
+) -> dict:
+    """
+    Import recipes into a group from a streamed NDJSON or CSV body.
+    Rows are validated like POST /recipes/ and written in batches, rows that fail
+    are skipped and reported with their 1-based row number.
+    """
+    # Check membership once for the whole import
+    if not await membership_index.is_member(db, user_id, group_id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="User is not a member of this group"
+        )
+
+    parse = PARSERS.get(content_type)
+    if parse is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Unsupported content type, use one of: {', '.join(PARSERS)}"
+        )
+
+    imported = 0
+    errors = []
+    batch = []
+    try:
+        async for row, data in parse(_iter_lines(body)):
+            try:
+                if isinstance(data, Exception):
+                    raise data
+                if not isinstance(data, dict):
+                    raise ValueError("Expected a JSON object")
+                recipe = RecipeCreate.model_validate({**data, "group_id": group_id})
+            except ValueError as e:
+                errors.append({"row": row, "error": _describe(e)})
+                continue
+
+            # IDs are assigned here so the LSH buckets can be inserted with the batch
+            values = {"id": uuid4(), **recipe.model_dump(include=RECIPE_COLUMNS)}
+            values.update(ingredient_columns(recipe.ingredients))
+            values.update(signature_columns(values["ingredient_terms"], recipe.instructions))
+            batch.append((row, values))
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                imported += await _insert_batch(db, batch, errors)
+                batch = []
+
+        if batch:
+            imported += await _insert_batch(db, batch, errors)
+    finally:
+        # Also when the body breaks off, as earlier batches are already committed
+        if imported:
+            await _record_import(db, group_id)
+
+    return {
+        "imported": imported,
+        "failed": len(errors),
+        "errors": errors
+    }
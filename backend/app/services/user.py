@@ -0,0 +1,52 @@
+import logging
+from sqlalchemy import select
+from uuid import UUID
+from fastapi import HTTPException, status
+from ..models.user import User
+from ..schemas.user import UserProfileUpdate
+from ..dependencies import DBSession
+
+logger = logging.getLogger(__name__)
+
+class UserService:
+    async def get_user_by_id(self, db: DBSession, user_id: UUID) -> User:
+        """Get a user by ID"""
+        user = await db.get(User, user_id)
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found"
+            )
+        return user
+
+    async def get_user_by_email(self, db: DBSession, email: str) -> User:
+        """Get a user by email address"""
+        user = await db.scalar(select(User).where(User.email == email).limit(1))
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found"
+            )
+        return user
+
+    async def update_profile(self, db: DBSession, user_id: UUID, profile_update: UserProfileUpdate) -> User:
+        """Update a user's profile fields"""
+        user = await self.get_user_by_id(db, user_id)
+
+        # Update user fields if provided
+        if profile_update.name is not None:
+            user.name = profile_update.name
+        if profile_update.email is not None:
+            user.email = profile_update.email
+
+        try:
+            await db.commit()
+            await db.refresh(user)
+            return user
+        except Exception as e:
+            logger.error(f"Error updating user profile: {str(e)}")
+            await db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Could not update profile"
+            )
@@ -0,0 +1,238 @@
+from sqlalchemy import delete, select, update, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+import asyncio
+import logging
+from ..dependencies import SessionLocal
+from ..models.user import User, UserRole, DeletedUser
+from ..models.group import FamilyGroup, GroupMember
+from .outbox import add_membership_change, add_token_revocation, outbox_dispatcher
+
+logger = logging.getLogger(__name__)
+
+# Columns kept in sync with Supabase Auth, the role is managed in this app
+SYNCED_COLUMNS = ("email", "name", "is_verified", "auth_updated_at")
+
+def parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    """Supabase timestamp in UTC, so stored values compare in order"""
+    return datetime.fromisoformat(value).astimezone(timezone.utc) if value else None
+
+def _utc(value: datetime) -> datetime:
+    # SQLite returns timestamps without their zone
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+def user_values(user_data: dict) -> dict:
+    """
+    Columns of the users table for a Supabase Auth user, either from the admin
+    API (user_metadata) or an auth.users row (raw_user_meta_data)
+    """
+    metadata = user_data.get('user_metadata') or user_data.get('raw_user_meta_data') or {}
+    return {
+        'id': UUID(user_data['id']),
+        'email': user_data['email'],
+        'name': metadata.get('name') or user_data['email'],
+        # Only set for new users
+        'role': UserRole.MEMBER,
+        'is_verified': user_data.get('email_confirmed_at') is not None,
+        'auth_updated_at': parse_timestamp(user_data.get('updated_at'))
+    }
+
+def _upsert(dialect: str):
+    insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    statement = insert(User)
+    return statement.on_conflict_do_update(
+        index_elements=[User.id],
+        set_={column: statement.excluded[column] for column in SYNCED_COLUMNS},
+        # Replayed or reordered changes never overwrite a newer one
+        where=or_(
+            User.auth_updated_at.is_(None),
+            statement.excluded.auth_updated_at.is_(None),
+            statement.excluded.auth_updated_at >= User.auth_updated_at
+        )
+    )
+
+def _without_deleted(db, rows: List[dict]) -> List[dict]:
+    """Drop rows of deleted users that are not newer than their deletion"""
+    deleted = dict(db.execute(
+        select(DeletedUser.id, DeletedUser.deleted_at).where(DeletedUser.id.in_([row["id"] for row in rows]))
+    ).all())
+    kept = []
+    for row in rows:
+        deleted_at = deleted.get(row["id"])
+        if deleted_at is not None and (row["auth_updated_at"] is None or row["auth_updated_at"] <= _utc(deleted_at)):
+            logger.info(f"Skipping change to deleted user {row['id']}")
+            continue
+        kept.append(row)
+    return kept
+
+def _record_deletions(db, deletions: Dict[UUID, datetime]):
+    """Upsert the tombstones of deleted users, keeping the latest deletion"""
+    insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    statement = insert(DeletedUser)
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=[DeletedUser.id],
+            set_={"deleted_at": statement.excluded.deleted_at},
+            where=statement.excluded.deleted_at > DeletedUser.deleted_at
+        ),
+        [{"id": user_id, "deleted_at": deleted_at} for user_id, deleted_at in deletions.items()]
+    )
+
+def upsert_users(session_factory: sessionmaker, rows: List[dict]) -> int:
+    """
+    Insert or update a batch of users in one INSERT ... ON CONFLICT statement.
+    If the batch is rejected, e.g. by an email taken by another user, it is
+    retried row by row so only the offending users are skipped.
+    """
+    with session_factory() as db:
+        rows = _without_deleted(db, rows)
+        if not rows:
+            return 0
+        upsert = _upsert(db.get_bind().dialect.name)
+        try:
+            db.execute(upsert, rows)
+            db.commit()
+            return len(rows)
+        except IntegrityError:
+            db.rollback()
+
+        synced = 0
+        for row in rows:
+            try:
+                db.execute(upsert, [row])
+                db.commit()
+                synced += 1
+            except IntegrityError as e:
+                db.rollback()
+                logger.error(f'Error syncing user {row["email"]}: {str(e)}')
+        return synced
+
+def delete_users(session_factory: sessionmaker, deletions: Dict[UUID, datetime]) -> List[Tuple[UUID, UUID]]:
+    """
+    Delete users with their group memberships, groups they own are kept without owner.
+    deletions maps each user ID to the time of its deletion, which is kept so
+    changes up to it are not applied again. Returns the (group_id, user_id)
+    memberships removed, which are dropped from the membership index through the outbox.
+    """
+    user_ids = list(deletions)
+    with session_factory() as db:
+        _record_deletions(db, deletions)
+        removed = db.execute(
+            delete(GroupMember)
+            .where(GroupMember.user_id.in_(user_ids))
+            .returning(GroupMember.group_id, GroupMember.user_id)
+        ).all()
+        db.execute(update(FamilyGroup).where(FamilyGroup.owner_id.in_(user_ids)).values(owner_id=None))
+        db.execute(delete(User).where(User.id.in_(user_ids)))
+        removed_by_group = defaultdict(list)
+        for group_id, user_id in removed:
+            removed_by_group[group_id].append(user_id)
+        for group_id, members in removed_by_group.items():
+            add_membership_change(db, group_id, removed=members)
+        # Deleted users' tokens stay valid until they expire
+        add_token_revocation(db, user_ids)
+        db.commit()
+        return [tuple(row) for row in removed]
+
+def apply_user_changes(session_factory: sessionmaker, changes: List[dict]) -> List[Tuple[UUID, UUID]]:
+    """Apply a batch of changes, deletes first so a deleted user's email can be reused"""
+    deleted = {change["id"]: change["updated_at"] for change in changes if change["values"] is None}
+    rows = [change["values"] for change in changes if change["values"] is not None]
+    removed = delete_users(session_factory, deleted) if deleted else []
+    if rows:
+        upsert_users(session_factory, rows)
+    return removed
+
+def user_change(event_type: str, record: Optional[dict], old_record: Optional[dict]) -> Optional[dict]:
+    """
+    The change to the users table for a Supabase auth.users webhook event, if any.
+    Raises ValueError for events without the row they change.
+    """
+    row = old_record if event_type == "DELETE" else record
+    if not isinstance(row, dict):
+        raise ValueError(f"{event_type} events need a {'old_record' if event_type == 'DELETE' else 'record'}")
+    if event_type == "DELETE":
+        deleted_at = parse_timestamp(old_record.get("updated_at")) or datetime.now(timezone.utc)
+        return {"id": UUID(old_record["id"]), "updated_at": deleted_at, "values": None}
+    if not record.get("email"):
+        return None
+    values = user_values(record)
+    return {"id": values["id"], "updated_at": values["auth_updated_at"], "values": values}
+
+def _supersedes(change: dict, pending: dict) -> bool:
+    # Deletes win over pending changes, and are only undone by a change newer than them
+    if change["values"] is None:
+        return True
+    if pending["values"] is None:
+        return change["updated_at"] is not None and change["updated_at"] > pending["updated_at"]
+    if change["updated_at"] is None or pending["updated_at"] is None:
+        return True
+    return change["updated_at"] >= pending["updated_at"]
+
+class UserSyncBatcher:
+    """
+    Coalesces bursts of user changes into batched writes. Changes arriving
+    within max_delay of the first are written together, keeping only the
+    latest change per user, and every caller waits until the batch holding
+    its change is committed, so a webhook is only acknowledged once applied.
+    """
+    def __init__(self, session_factory: sessionmaker = SessionLocal, max_delay: float = 0.05, max_batch: int = 500):
+        self.session_factory = session_factory
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self._changes: Dict[UUID, dict] = {}
+        self._waiters: List[asyncio.Future] = []
+        self._full = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+        # Batches are written one at a time, in order
+        self._write_lock = asyncio.Lock()
+
+    async def submit(self, change: dict):
+        """Queue a change and wait until it is written"""
+        pending = self._changes.get(change["id"])
+        if pending is None or _supersedes(change, pending):
+            self._changes[change["id"]] = change
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush())
+        if len(self._changes) >= self.max_batch:
+            self._full.set()
+        await waiter
+
+    async def _flush(self):
+        try:
+            await asyncio.wait_for(self._full.wait(), self.max_delay)
+        except asyncio.TimeoutError:
+            pass
+        changes, waiters = list(self._changes.values()), self._waiters
+        self._changes, self._waiters, self._flusher = {}, [], None
+        self._full.clear()
+
+        try:
+            async with self._write_lock:
+                await run_in_threadpool(apply_user_changes, self.session_factory, changes)
+        except Exception as e:
+            logger.error(f"User sync error: {str(e)}")
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+            return
+        if any(change["values"] is None for change in changes):
+            outbox_dispatcher.notify()
+
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+user_sync_batcher = UserSyncBatcher()
+
+def get_user_sync_batcher() -> UserSyncBatcher:
+    return user_sync_batcher
@@ -1,5 +1,7 @@
 from fastapi import Request, HTTPException, status
-from typing import Optional, Dict
+from typing import Iterable, Optional, Dict, Tuple
+from collections import OrderedDict
+import hashlib
 import jwt
 import time
 from functools import lru_cache
@@ -7,13 +9,127 @@ import logging
 from uuid import UUID
 from enum import Enum
 from ..config import get_settings
+from ..dependencies import get_redis
 from ..schemas.user import UserRole  # Import UserRole from schemas
+from .metrics import JWT_VERIFICATION_DURATION, record_cache_lookup
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+class VerifiedTokenCache:
+    """
+    Bounded LRU cache of verified JWT claims, keyed by a hash of the token.
+    Each entry expires at its token's exp claim, so a cached token is never
+    accepted past the point where a full verification would reject it.
+    Revoked users' tokens issued before the revocation are rejected as well.
+    The cache is per worker, revocations reach every worker through the
+    cache invalidation channel, see revoked_key.
+    """
+    def __init__(self, max_entries: int, max_ttl_seconds: int, revocation_ttl_seconds: int = 24 * 60 * 60):
+        self.max_entries = max_entries
+        self.max_ttl_seconds = max_ttl_seconds
+        self.revocation_ttl_seconds = revocation_ttl_seconds
+        self._entries: "OrderedDict[bytes, Tuple[dict, float]]" = OrderedDict()
+        # Revocation time by subject, kept for revocation_ttl_seconds after it
+        self._revoked: Dict[str, float] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        """Get the verified claims of a token if it is cached and not expired"""
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            record_cache_lookup("jwt", False)
+            return None
+        claims, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            self.misses += 1
+            record_cache_lookup("jwt", False)
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        record_cache_lookup("jwt", True)
+        return claims
+
+    def set(self, token: str, claims: dict):
+        """Cache the claims of a successfully verified token"""
+        expires_at = time.time() + self.max_ttl_seconds
+        if "exp" in claims:
+            expires_at = min(expires_at, float(claims["exp"]))
+        key = self._key(token)
+        self._entries[key] = (claims, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def revoke_subject(self, sub: str, revoked_at: Optional[float] = None):
+        """Drop every cached token issued to a user and reject those issued before now"""
+        now = time.time()
+        self._revoked = {
+            subject: at for subject, at in self._revoked.items() if at > now - self.revocation_ttl_seconds
+        }
+        self._revoked[sub] = max(self._revoked.get(sub, 0.0), revoked_at or now)
+        for key in [key for key, (claims, _) in self._entries.items() if claims.get("sub") == sub]:
+            del self._entries[key]
+
+    def is_revoked(self, claims: dict) -> bool:
+        """Whether the token was issued to a revoked user before the revocation"""
+        revoked_at = self._revoked.get(claims.get("sub"))
+        return revoked_at is not None and float(claims.get("iat", 0)) <= revoked_at
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+# Prefix of the Redis keys holding when a user's tokens were revoked. The keys
+# are also published on the cache invalidation channel, so every worker drops
+# the user's cached tokens, and are read by workers that missed the message
+REVOKED_PREFIX = "jwt:revoked:"
+
+def revoked_key(sub: str) -> str:
+    return f"{REVOKED_PREFIX}{sub}"
+
+def apply_revocations(keys: Iterable[str]):
+    """Revoke the users of the revocation keys among invalidated cache keys"""
+    for key in keys:
+        if key.startswith(REVOKED_PREFIX):
+            verified_token_cache.revoke_subject(key[len(REVOKED_PREFIX):])
+
+async def _revoked_in_redis(claims: dict) -> bool:
+    try:
+        redis = await get_redis()
+        revoked_at = await redis.get(revoked_key(claims.get("sub")))
+    except Exception as e:
+        logger.error(f"Token revocation lookup error: {str(e)}")
+        return False
+    if revoked_at is None:
+        return False
+    verified_token_cache.revoke_subject(claims["sub"], float(revoked_at))
+    return verified_token_cache.is_revoked(claims)
+
+verified_token_cache = VerifiedTokenCache(
+    max_entries=settings.JWT_CACHE_MAX_ENTRIES,
+    max_ttl_seconds=settings.JWT_CACHE_MAX_TTL_SECONDS,
+    revocation_ttl_seconds=settings.JWT_REVOCATION_TTL_SECONDS
+)
+
 async def verify_supabase_jwt(request: Request) -> Optional[dict]:
     """Verify Supabase JWT token"""
+    started = time.perf_counter()
+    result = "rejected"
     try:
         auth_header = request.headers.get('Authorization')
         if not auth_header or not auth_header.startswith('Bearer '):
@@ -23,6 +139,12 @@ async def verify_supabase_jwt(request: Request) -> Optional[dict]:
             )
 
         token = auth_header.split(' ')[1]
+
+        # Repeat requests with an already verified token skip the signature check
+        cached_claims = verified_token_cache.get(token)
+        if cached_claims is not None:
+            result = "cached"
+            return cached_claims
         
         try:
             # Decode and verify the JWT using the JWT secret
@@ -32,6 +154,13 @@ async def verify_supabase_jwt(request: Request) -> Optional[dict]:
                 algorithms=["HS256"],
                 audience="authenticated"
             )
+            if verified_token_cache.is_revoked(payload) or await _revoked_in_redis(payload):
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Token has been revoked"
+                )
+            verified_token_cache.set(token, payload)
+            result = "verified"
             return payload
             
         except jwt.ExpiredSignatureError:
@@ -53,6 +182,8 @@ async def verify_supabase_jwt(request: Request) -> Optional[dict]:
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Authentication failed"
         )
+    finally:
+        JWT_VERIFICATION_DURATION.labels(result).observe(time.perf_counter() - started)
 
 def get_user_id_from_jwt(token_data: dict) -> UUID:
     """Extract user ID from Supabase JWT claims"""
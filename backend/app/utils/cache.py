@@ -1,76 +1,397 @@
 from functools import wraps
-from fastapi import Request
-import json
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+from typing import Callable, Dict, Iterable, Optional, Sequence, Tuple, Union
+from uuid import uuid4
+import asyncio
+import inspect
+import math
+import orjson
+import random
+import time
+from ..config import get_settings
 from ..dependencies import get_redis
+from .auth import get_user_id_from_jwt, apply_revocations
+from .etag import etag_matches, not_modified, set_etag, encoded_etag
+from .compression import choose_encoding, precompress, pack_variants, unpack_variants
+from .local_cache import LocalCache
+from .metrics import record_cache_lookup
 import logging
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
 
-def cache_response(expire_time_seconds: int = 300):
+# Per-worker L1 tier in front of Redis. Entries are kept coherent across
+# workers by the invalidation channel below, and their short TTL bounds
+# staleness if a message is ever missed
+local_cache = LocalCache(
+    max_entries=settings.L1_CACHE_MAX_ENTRIES,
+    max_bytes=settings.L1_CACHE_MAX_BYTES,
+    default_ttl=settings.L1_CACHE_TTL_SECONDS
+)
+
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+# Stampede protection: a short Redis lease lets one worker recompute an
+# expired entry while the others wait for its result
+LEASE_SECONDS = 5
+LEASE_POLL_INTERVAL = 0.05
+EARLY_REFRESH_BETA = 1.0
+
+# Releases a lease only if it is still held by the caller
+RELEASE_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Computations currently running in this worker, by cache key
+_inflight: Dict[str, asyncio.Future] = {}
+
+# Tag sets outlive the entries they point at so a tag is never dropped
+# before an entry registered under it expires
+TAG_TTL_SECONDS = 24 * 60 * 60
+
+# Deletes every entry registered under the given tag sets and the sets
+# themselves, then publishes the dropped keys so every worker evicts them
+# from its L1 tier, all in a single round trip
+INVALIDATE_TAGS_SCRIPT = """
+local keys = {}
+for _, tag_key in ipairs(KEYS) do
+    local members = redis.call('SMEMBERS', tag_key)
+    for _, key in ipairs(members) do
+        redis.call('DEL', key)
+        table.insert(keys, key)
+    end
+    redis.call('DEL', tag_key)
+end
+if #keys > 0 then
+    redis.call('PUBLISH', ARGV[1], cjson.encode(keys))
+end
+return keys
+"""
+
+def tag_key(tag: str) -> str:
+    """Redis key of the set holding all cache keys registered under a tag"""
+    return f"tag:{tag}"
+
+async def cache_get(key: str) -> Optional[bytes]:
+    """Get a cache entry from the L1 tier, falling back to Redis"""
+    value = local_cache.get(key)
+    if value is not None:
+        return value
+    redis = await get_redis()
+    value = await redis.get(key)
+    if value is not None:
+        local_cache.set(key, value)
+    return value
+
+async def cache_set(key: str, value: bytes, expire_time_seconds: int, tags: Iterable[str] = ()):
+    """Store a cache entry in both tiers and register it under its tags"""
+    local_cache.set(key, value, min(expire_time_seconds, local_cache.default_ttl))
+    redis = await get_redis()
+    pipe = redis.pipeline(transaction=True)
+    pipe.set(key, value, ex=expire_time_seconds)
+    for tag in tags:
+        pipe.sadd(tag_key(tag), key)
+        pipe.expire(tag_key(tag), TAG_TTL_SECONDS)
+    await pipe.execute()
+
+async def invalidate(tags: Iterable[str]) -> int:
+    """Drop every cache entry registered under any of the given tags, in all workers"""
+    keys = [tag_key(tag) for tag in set(tags)]
+    if not keys:
+        return 0
+    redis = await get_redis()
+    script = redis.register_script(INVALIDATE_TAGS_SCRIPT)
+    dropped = [key.decode() for key in await script(keys=keys, args=[INVALIDATION_CHANNEL])]
+    # Evict locally right away rather than waiting for our own message
+    local_cache.delete_many(dropped)
+    return len(dropped)
+
+async def listen_for_invalidations():
+    """
+    Evict keys published on the invalidation channel from the L1 tier, and
+    revoke the tokens of users whose revocation key is among them.
+    Runs for the lifetime of the worker and resubscribes after connection errors.
+    """
+    while True:
+        try:
+            redis = await get_redis()
+            pubsub = redis.pubsub(ignore_subscribe_messages=True)
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            # Messages may have been missed while unsubscribed
+            local_cache.clear()
+            try:
+                async for message in pubsub.listen():
+                    keys = orjson.loads(message["data"])
+                    local_cache.delete_many(keys)
+                    apply_revocations(keys)
+            finally:
+                await pubsub.aclose()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Cache invalidation listener error: {str(e)}")
+            await asyncio.sleep(1)
+
+def _pack(value: bytes, delta: float, expires_at: float) -> bytes:
+    """Prefix a cached value with its recompute time and logical expiry"""
+    return b"%.4f|%.3f|" % (delta, expires_at) + value
+
+def _unpack(raw: bytes) -> Tuple[bytes, float, float]:
+    delta, expires_at, value = raw.split(b"|", 2)
+    return value, float(delta), float(expires_at)
+
+def _should_refresh_early(delta: float, expires_at: float) -> bool:
+    """
+    Probabilistic early expiration (XFetch). The closer an entry is to expiry
+    and the longer it took to compute, the more likely a read refreshes it ahead
+    of time, so a hot key is recomputed once instead of by every reader at expiry.
+    """
+    return time.time() - delta * EARLY_REFRESH_BETA * math.log(1.0 - random.random()) >= expires_at
+
+async def _wait_for_value(redis, key: str) -> Optional[bytes]:
+    """Wait for the worker holding the lease on key to store its value"""
+    deadline = time.monotonic() + LEASE_SECONDS
+    while time.monotonic() < deadline:
+        await asyncio.sleep(LEASE_POLL_INTERVAL)
+        raw, lease_held = await redis.pipeline(transaction=False).get(key).exists(f"lease:{key}").execute()
+        if raw is not None:
+            local_cache.set(key, raw)
+            return _unpack(raw)[0]
+        if not lease_held:
+            # The holder failed without storing a value
+            return None
+    return None
+
+async def _compute_with_lease(key, compute, expire_time_seconds, tags, encode, decode, stale):
+    """Compute and store a value, coordinating with other workers through a Redis lease"""
+    lease_key = f"lease:{key}"
+    token = uuid4().hex
+    redis = None
+    acquired = True
+    try:
+        redis = await get_redis()
+        acquired = await redis.set(lease_key, token, nx=True, ex=LEASE_SECONDS)
+    except Exception as e:
+        logger.error(f"Cache lease error: {str(e)}")
+
+    if not acquired:
+        if stale is not None:
+            # Another worker is already refreshing this entry
+            return decode(stale)
+        value = await _wait_for_value(redis, key)
+        if value is not None:
+            return decode(value)
+
+    try:
+        started = time.monotonic()
+        result = await compute()
+        delta = time.monotonic() - started
+
+        try:
+            entry_tags = tags(result) if callable(tags) else tags
+            if inspect.isawaitable(entry_tags):
+                entry_tags = await entry_tags
+            await cache_set(
+                key,
+                _pack(encode(result), delta, time.time() + expire_time_seconds),
+                expire_time_seconds,
+                entry_tags
+            )
+        except Exception as e:
+            logger.error(f"Cache set error: {str(e)}")
+
+        return result
+    finally:
+        if acquired and redis is not None:
+            try:
+                await redis.register_script(RELEASE_LEASE_SCRIPT)(keys=[lease_key], args=[token])
+            except Exception as e:
+                logger.error(f"Cache lease release error: {str(e)}")
+
+async def get_or_compute(
+    key: str,
+    compute: Callable,
+    expire_time_seconds: int = 300,
+    tags: Union[Iterable[str], Callable] = (),
+    encode: Callable = orjson.dumps,
+    decode: Callable = orjson.loads,
+    name: Optional[str] = None
+):
+    """
+    Read-through cache lookup with stampede protection
+    Args:
+        key: Cache key
+        compute: Async callable producing the value on a miss
+        expire_time_seconds: How long to cache the value
+        tags: Tags for the entry, or a callable (value) returning them, may be async
+        encode/decode: Convert the value to and from its cached bytes
+        name: Cache name lookups are counted under in /metrics, by default the key's prefix
+    Concurrent misses in this worker share one computation, misses across workers
+    wait on a Redis lease, and hot entries are refreshed shortly before they expire.
+    """
+    stale = None
+    raw = None
+    try:
+        raw = await cache_get(key)
+        if raw is not None:
+            value, delta, expires_at = _unpack(raw)
+            if not _should_refresh_early(delta, expires_at):
+                return decode(value)
+            stale = value
+    except Exception as e:
+        logger.error(f"Cache retrieval error: {str(e)}")
+    finally:
+        record_cache_lookup(name or key.split(":", 1)[0], raw is not None)
+
+    inflight = _inflight.get(key)
+    if inflight is not None:
+        if stale is not None:
+            return decode(stale)
+        return await asyncio.shield(inflight)
+
+    future = asyncio.get_running_loop().create_future()
+    # Avoid "exception never retrieved" warnings when nobody else was waiting
+    future.add_done_callback(lambda f: f.cancelled() or f.exception())
+    _inflight[key] = future
+    try:
+        result = await _compute_with_lease(key, compute, expire_time_seconds, tags, encode, decode, stale)
+        future.set_result(result)
+        return result
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        _inflight.pop(key, None)
+
+def _scope_values(kwargs: dict, scope: Sequence[str]) -> dict:
+    """Resolve the user and/or group a cached response is scoped to"""
+    values = {}
+    if "user" in scope:
+        values["user"] = get_user_id_from_jwt(kwargs.get("token_data"))
+    if "group" in scope:
+        values["group"] = kwargs["group_id"]
+    return values
+
+def json_response(body: bytes) -> Response:
+    """Send an already encoded JSON body without re-validating or re-encoding it"""
+    return Response(content=body, media_type="application/json")
+
+def variant_response(request: Request, variants: Dict[str, bytes], etag: Optional[str] = None) -> Response:
+    """Send the precompressed variant of a JSON body the client accepts, or the body itself"""
+    encoding = choose_encoding(request.headers.get("accept-encoding"))
+    if encoding not in variants:
+        response = json_response(variants["identity"])
+    else:
+        response = Response(
+            content=variants[encoding],
+            media_type="application/json",
+            headers={"Content-Encoding": encoding}
+        )
+        etag = etag and encoded_etag(etag, encoding)
+    if len(variants) > 1:
+        response.headers["Vary"] = "Accept-Encoding"
+    if etag:
+        set_etag(response, etag)
+    return response
+
+def cache_response(
+    expire_time_seconds: int = 300,
+    response_model=None,
+    scope: Sequence[str] = ("user",),
+    tags: Optional[Callable] = None,
+    etag: Optional[Callable] = None
+):
     """
     Cache decorator for FastAPI endpoint responses
     Args:
         expire_time_seconds: How long to cache the response (default 5 minutes)
+        response_model: Model the endpoint result is rendered through, as in the route
+        scope: Which of "user" and "group" the cache key is scoped by
+        tags: Optional callable (kwargs, response) returning extra tags, may be async
+        etag: Optional async callable (kwargs) computing the response's ETag from
+            version values, without rendering it
+    Entries are always tagged with their scope, e.g. user:{id} and group:{id}.
+    The final JSON body is cached with its compressed variants, and hits are sent
+    as-is without touching pydantic or compressing again.
+    With an etag, matching If-None-Match requests get a 304 before the cache is read,
+    and the ETag is part of the cache key, so a body is never sent with another's ETag.
     """
+    adapter = TypeAdapter(response_model) if response_model is not None else None
+
+    def render(result) -> bytes:
+        if adapter is None:
+            return orjson.dumps(result)
+        return adapter.dump_json(adapter.validate_python(result, from_attributes=True))
+
     def decorator(func):
         @wraps(func)
         async def wrapper(*args, **kwargs):
-            # Get request object from args
-            request = next((arg for arg in args if isinstance(arg, Request)), None)
+            # FastAPI passes endpoint parameters as keyword arguments
+            request = kwargs.get("request") or next((arg for arg in args if isinstance(arg, Request)), None)
             if not request:
                 return await func(*args, **kwargs)
 
-            # Generate cache key from path and query params
+            # Generate cache key from path, query params and scope
+            scope_values = _scope_values(kwargs, scope)
             cache_key = f"cache:{request.url.path}"
             if request.query_params:
                 cache_key += f":{str(request.query_params)}"
+            for name, value in scope_values.items():
+                cache_key += f":{name}:{value}"
 
-            try:
-                # Try to get cached response
-                redis = await get_redis()
-                cached_response = await redis.get(cache_key)
-                if cached_response:
-                    return json.loads(cached_response)
-
-                # Generate new response
-                response = await func(*args, **kwargs)
-
-                # Cache the response
-                await redis.set(
-                    cache_key,
-                    json.dumps(response),
-                    ex=expire_time_seconds
-                )
-                return response
+            current_etag = None
+            if etag:
+                current_etag = await etag(kwargs)
+                if etag_matches(request.headers.get("if-none-match"), current_etag):
+                    return not_modified(current_etag)
+                cache_key += ":etag:" + current_etag.strip('"')
 
-            except Exception as e:
-                logger.error(f"Cache error: {str(e)}")
-                # If caching fails, just return the response
-                return await func(*args, **kwargs)
+            result = None
+
+            async def compute():
+                nonlocal result
+                result = await func(*args, **kwargs)
+                return await precompress(render(result))
+
+            async def entry_tags(body):
+                resolved = [f"{name}:{value}" for name, value in scope_values.items()]
+                if tags:
+                    extra_tags = tags(kwargs, result)
+                    if inspect.isawaitable(extra_tags):
+                        extra_tags = await extra_tags
+                    resolved.extend(extra_tags)
+                return resolved
+
+            variants = await get_or_compute(
+                cache_key,
+                compute,
+                expire_time_seconds,
+                entry_tags,
+                encode=pack_variants,
+                decode=unpack_variants,
+                name=func.__name__
+            )
+            return variant_response(request, variants, current_etag)
 
         return wrapper
-    return decorator 
+    return decorator
 
 def cache_data(cache_key_func, expire_time_seconds=300):
     def decorator(func):
         @wraps(func)
         async def wrapper(*args, **kwargs):
             cache_key = cache_key_func(*args, **kwargs)
-            try:
-                redis = await get_redis()
-                cached_data = await redis.get(cache_key)
-                if cached_data:
-                    return json.loads(cached_data)
-            except Exception as e:
-                logger.error(f"Cache retrieval error: {str(e)}")
-            
-            result = await func(*args, **kwargs)
-            
-            try:
-                await redis.set(cache_key, json.dumps(result), ex=expire_time_seconds)
-            except Exception as e:
-                logger.error(f"Cache set error: {str(e)}")
-            
-            return result
+
+            async def compute():
+                return await func(*args, **kwargs)
+
+            return await get_or_compute(cache_key, compute, expire_time_seconds)
         return wrapper
-    return decorator 
\ No newline at end of file
+    return decorator
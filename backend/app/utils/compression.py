@@ -0,0 +1,167 @@
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from typing import Dict, Optional
+import brotli
+import zlib
+from ..config import get_settings
+from .etag import encoded_etag
+
+# Supported content codings, preferred in this order when the client accepts several equally
+ENCODINGS = ("br", "gzip")
+# Levels for compressing on the fly, and for cache entries, which are compressed only once
+LEVELS = {"br": 4, "gzip": 6}
+PRECOMPRESS_LEVELS = {"br": 9, "gzip": 9}
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+# Starts a cache entry holding precompressed variants, JSON bodies never start with it
+VARIANTS_MARKER = b"\x00variants\n"
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """The supported coding an Accept-Encoding header prefers, None for the identity"""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(","):
+        coding, *params = item.split(";")
+        weight = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name.strip() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.strip().lower()] = weight
+    best, best_weight = None, 0.0
+    for encoding in ENCODINGS:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.startswith(COMPRESSIBLE_TYPES)
+
+class StreamCompressor:
+    """Incremental br or gzip compressor"""
+    def __init__(self, encoding: str, level: Optional[int] = None):
+        level = level or LEVELS[encoding]
+        if encoding == "br":
+            compressor = brotli.Compressor(quality=level)
+            self._compress, self._finish = compressor.process, compressor.finish
+        else:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+            self._compress, self._finish = compressor.compress, compressor.flush
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compress(data)
+
+    def finish(self) -> bytes:
+        return self._finish()
+
+def compress(body: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    compressor = StreamCompressor(encoding, level)
+    return compressor.compress(body) + compressor.finish()
+
+def _precompress(body: bytes) -> Dict[str, bytes]:
+    variants = {"identity": body}
+    if len(body) >= get_settings().COMPRESSION_MIN_BYTES:
+        for encoding in ENCODINGS:
+            variants[encoding] = compress(body, encoding, PRECOMPRESS_LEVELS[encoding])
+    return variants
+
+async def precompress(body: bytes) -> Dict[str, bytes]:
+    """
+    The body by content coding, with a compressed variant per supported coding
+    from COMPRESSION_MIN_BYTES. Compressed in the threadpool, as zlib and brotli
+    release the GIL.
+    """
+    return await run_in_threadpool(_precompress, body)
+
+def pack_variants(variants: Dict[str, bytes]) -> bytes:
+    """Encode the variants of a body as a single cache entry"""
+    if len(variants) == 1:
+        return variants["identity"]
+    header = ",".join(f"{encoding}:{len(body)}" for encoding, body in variants.items())
+    return VARIANTS_MARKER + header.encode() + b"\n" + b"".join(variants.values())
+
+def unpack_variants(raw: bytes) -> Dict[str, bytes]:
+    if not raw.startswith(VARIANTS_MARKER):
+        return {"identity": raw}
+    header, _, data = raw[len(VARIANTS_MARKER):].partition(b"\n")
+    variants = {}
+    offset = 0
+    for entry in header.decode().split(","):
+        encoding, size = entry.split(":")
+        variants[encoding] = data[offset:offset + int(size)]
+        offset += int(size)
+    return variants
+
+class CompressionMiddleware:
+    """
+    Negotiated br or gzip compression of JSON, NDJSON and text responses from
+    COMPRESSION_MIN_BYTES, streamed responses included. Responses that already
+    have a Content-Encoding, such as precompressed cache hits, pass through as-is.
+    """
+    def __init__(self, app: ASGIApp, minimum_size: Optional[int] = None):
+        self.app = app
+        self.minimum_size = minimum_size or get_settings().COMPRESSION_MIN_BYTES
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        compressor: Optional[StreamCompressor] = None
+        passthrough = False
+
+        async def send_compressed(message: Message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk shows whether to compress
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(raw=start["headers"])
+                if "content-encoding" in headers or not is_compressible(headers.get("content-type")):
+                    passthrough = True
+                elif not more_body and len(body) < self.minimum_size:
+                    headers.add_vary_header("Accept-Encoding")
+                    passthrough = True
+                if passthrough:
+                    await send(start)
+                    await send(message)
+                    return
+
+                compressor = StreamCompressor(encoding)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if "etag" in headers:
+                    headers["ETag"] = encoded_etag(headers["etag"], encoding)
+                if "content-length" in headers:
+                    del headers["Content-Length"]
+                if not more_body:
+                    body = compressor.compress(body) + compressor.finish()
+                    headers["Content-Length"] = str(len(body))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(start)
+
+            chunk = compressor.compress(body)
+            if not more_body:
+                chunk += compressor.finish()
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,55 @@
+from fastapi import HTTPException, Response, status
+from typing import List, Optional
+import hashlib
+
+# Strong ETags of compressed responses end in their content coding, as a
+# strong validator must differ between codings. Compared without it, since
+# every coding of a body carries the same version.
+CODING_SUFFIXES = ('-br"', '-gzip"')
+
+def make_etag(*parts) -> str:
+    """Strong ETag from the version values a representation is rendered from"""
+    digest = hashlib.blake2b("|".join(map(str, parts)).encode(), digest_size=16)
+    return f'"{digest.hexdigest()}"'
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """The ETag of a body compressed with a content coding, weak ETags are unchanged"""
+    if not etag.startswith('"'):
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+def _without_coding(tag: str) -> str:
+    for suffix in CODING_SUFFIXES:
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)] + '"'
+    return tag
+
+def _parse(header: str) -> List[str]:
+    return [_without_coding(tag.strip()) for tag in header.split(",") if tag.strip()]
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches, compared weakly as RFC 9110 requires"""
+    if not if_none_match:
+        return False
+    tags = _parse(if_none_match)
+    return "*" in tags or etag in (tag.removeprefix("W/") for tag in tags)
+
+def check_if_match(if_match: Optional[str], etag: str):
+    """Raise 412 unless an If-Match header, if any, strongly matches the current ETag"""
+    if not if_match:
+        return
+    tags = _parse(if_match)
+    if "*" not in tags and etag not in tags:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail="The resource was changed since it was read"
+        )
+
+def set_etag(response: Response, etag: str) -> Response:
+    """Send the ETag, and have browsers revalidate with it rather than reuse the body unchecked"""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+def not_modified(etag: str) -> Response:
+    return set_etag(Response(status_code=status.HTTP_304_NOT_MODIFIED), etag)
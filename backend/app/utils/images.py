@@ -0,0 +1,71 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+from PIL import Image, ImageOps
+import os
+from ..config import get_settings
+
+# Longest side of each generated WebP variant, in pixels
+IMAGE_VARIANTS = {
+    "thumbnail": 320,
+    "medium": 1280,
+}
+WEBP_QUALITY = 80
+
+# Leading bytes of the accepted formats, with their content type and extension
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg", "jpg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png", "png"),
+    (b"GIF87a", "image/gif", "gif"),
+    (b"GIF89a", "image/gif", "gif"),
+)
+# Bytes needed to recognize any accepted format
+SIGNATURE_BYTES = 12
+
+def sniff_image_type(head: bytes) -> Optional[Tuple[str, str]]:
+    """Content type and extension of an image from its first bytes, None if not a supported image"""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp", "webp"
+    for signature, content_type, extension in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return content_type, extension
+    return None
+
+def image_key(digest: str, extension: str) -> str:
+    """Content-addressed key of an original image, so identical uploads share it"""
+    return f"{digest[:2]}/{digest}.{extension}"
+
+def variant_key(digest: str, variant: str) -> str:
+    return f"{digest[:2]}/{digest}/{variant}.webp"
+
+def render_variants(source: str, directory: str) -> Dict[str, str]:
+    """
+    Write a WebP of the image at source for every variant into directory,
+    returning their paths by variant. Runs in a worker process.
+    """
+    paths = {}
+    with Image.open(source) as image:
+        # Phones store the orientation in EXIF rather than rotating the pixels
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        for variant, size in IMAGE_VARIANTS.items():
+            resized = image.copy()
+            resized.thumbnail((size, size), Image.LANCZOS)
+            paths[variant] = os.path.join(directory, f"{variant}.webp")
+            resized.save(paths[variant], "WEBP", quality=WEBP_QUALITY)
+    return paths
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+def get_image_pool() -> ProcessPoolExecutor:
+    """Worker processes for image processing, created on first use"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=get_settings().IMAGE_WORKERS)
+    return _pool
+
+def shutdown_image_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
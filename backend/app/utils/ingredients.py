@@ -0,0 +1,130 @@
+from typing import Iterable, List, Optional, Tuple
+import html
+import re
+
+# Leading amounts such as "2", "1/2", "1 1/2", "2-3", "½" and "2.5"
+AMOUNT = r"\d+\s+\d+/\d+|\d+/\d+|\d*\s*[¼½¾⅓⅔⅛]|\d+(?:\.\d+)?"
+QUANTITY_PATTERN = re.compile(rf"^(?P<amount>{AMOUNT})(?:\s*(?:-|to)\s*(?P<max>{AMOUNT}))?\s*")
+
+VULGAR_FRACTIONS = {"¼": 0.25, "½": 0.5, "¾": 0.75, "⅓": 1 / 3, "⅔": 2 / 3, "⅛": 0.125}
+
+# Spellings of each unit, by canonical name
+UNITS = {
+    "cup": ("cup", "cups", "c"),
+    "tablespoon": ("tablespoon", "tablespoons", "tbsp", "tbs", "tb"),
+    "teaspoon": ("teaspoon", "teaspoons", "tsp"),
+    "ounce": ("ounce", "ounces", "oz"),
+    "pound": ("pound", "pounds", "lb", "lbs"),
+    "gram": ("gram", "grams", "g"),
+    "kilogram": ("kilogram", "kilograms", "kg"),
+    "milliliter": ("milliliter", "milliliters", "ml"),
+    "liter": ("liter", "liters", "l"),
+    "pint": ("pint", "pints"),
+    "quart": ("quart", "quarts"),
+    "gallon": ("gallon", "gallons"),
+    "pinch": ("pinch", "pinches"),
+    "dash": ("dash", "dashes"),
+    "clove": ("clove", "cloves"),
+    "can": ("can", "cans"),
+    "package": ("package", "packages", "pkg"),
+    "stick": ("stick", "sticks"),
+    "slice": ("slice", "slices"),
+    "bunch": ("bunch", "bunches"),
+    "handful": ("handful", "handfuls"),
+    "sprig": ("sprig", "sprigs"),
+    "piece": ("piece", "pieces"),
+}
+UNIT_ALIASES = {alias: unit for unit, aliases in UNITS.items() for alias in aliases}
+
+# Words that describe an ingredient without changing what it is, kept as notes
+DESCRIPTORS = {
+    "fresh", "chopped", "diced", "minced", "sliced", "grated", "shredded", "melted", "softened",
+    "peeled", "crushed", "finely", "roughly", "thinly", "large", "medium", "small",
+}
+
+def _singular(word: str) -> str:
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith("oes") and len(word) > 4:
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(("ss", "us")) and len(word) > 3:
+        return word[:-1]
+    return word
+
+def _amount(text: str) -> float:
+    text = text.strip()
+    whole, _, fraction = text.rpartition(" ")
+    if text[-1] in VULGAR_FRACTIONS:
+        return float(text[:-1] or 0) + VULGAR_FRACTIONS[text[-1]]
+    if "/" in text:
+        numerator, denominator = (fraction or text).split("/")
+        return float(whole or 0) + int(numerator) / int(denominator)
+    return float(text)
+
+def _quantity(text: str) -> Tuple[Optional[float], Optional[float], str]:
+    """Split a leading amount or range off an ingredient line"""
+    match = QUANTITY_PATTERN.match(text)
+    if not match:
+        return None, None, text
+    try:
+        quantity = _amount(match.group("amount"))
+        quantity_max = _amount(match.group("max")) if match.group("max") else None
+    except (ValueError, ZeroDivisionError):
+        return None, None, text
+    if quantity_max is not None and quantity_max < min(quantity, 1):
+        # "1-1/2" is a mixed number rather than a range
+        quantity, quantity_max = quantity + quantity_max, None
+    return quantity, quantity_max, text[match.end():]
+
+def parse_ingredient(line: str) -> dict:
+    """
+    Split an ingredient line into quantity, unit, canonical name and notes, e.g.
+    "1 1/2 cups Tomatoes (diced), peeled" becomes
+    {"quantity": 1.5, "quantity_max": None, "unit": "cup", "name": "tomato", "notes": "diced, peeled"}
+    """
+    notes = re.findall(r"\((.*?)\)", line)
+    text = re.sub(r"\(.*?\)", " ", line).strip()
+    # Preparation notes follow the first comma
+    text, _, trailing_notes = text.partition(",")
+
+    quantity, quantity_max, text = _quantity(text.strip())
+    # Lines are stored HTML escaped, "salt &amp; pepper" names salt and pepper.
+    # Letters of any script count, so "jalapeños" is not split at the "ñ"
+    words = re.findall(r"[^\W\d_]+", html.unescape(text).lower())
+
+    unit = None
+    if words and words[0] in UNIT_ALIASES:
+        unit = UNIT_ALIASES[words.pop(0)]
+        if words and words[0] == "of":
+            words.pop(0)
+
+    descriptors = [word for word in words if word in DESCRIPTORS]
+    name = " ".join(_singular(word) for word in words if word not in DESCRIPTORS)
+    notes = ", ".join(note.strip() for note in [*descriptors, *notes, trailing_notes] if note.strip())
+
+    return {
+        "quantity": quantity,
+        "quantity_max": quantity_max,
+        "unit": unit,
+        "name": name,
+        "notes": notes or None
+    }
+
+def normalize_ingredient(line: str) -> str:
+    """
+    Reduce an ingredient line to the name of the ingredient, so that
+    "2 cups Tomatoes, diced" and "tomato" compare equal
+    """
+    return parse_ingredient(line)["name"]
+
+def ingredient_terms(lines: Iterable[str]) -> List[str]:
+    """Sorted, de-duplicated normalized names of a recipe's ingredients"""
+    return sorted({term for term in map(normalize_ingredient, lines) if term})
+
+def ingredient_columns(lines: List[str]) -> dict:
+    """Values of the ingredient columns derived from a recipe's ingredient lines"""
+    parsed = [parse_ingredient(line) for line in lines]
+    return {
+        "parsed_ingredients": parsed,
+        "ingredient_terms": sorted({ingredient["name"] for ingredient in parsed if ingredient["name"]})
+    }
@@ -0,0 +1,73 @@
+from collections import OrderedDict
+from typing import Any, Iterable, Optional
+import sys
+import time
+
+def _sizeof(value: Any) -> int:
+    """Approximate memory used by a cached value"""
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    return sys.getsizeof(value)
+
+class LocalCache:
+    """
+    Bounded in-process LRU cache with per-entry TTL and a total byte budget.
+    Lives in a single worker and is only touched from the event loop, so it needs no locking.
+    """
+    def __init__(self, max_entries: int, max_bytes: int, default_ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        """Get a live entry and mark it as recently used"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires_at, _ = entry
+        if expires_at <= time.monotonic():
+            self.delete(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """Store an entry, evicting least recently used entries to stay within bounds"""
+        size = _sizeof(value)
+        self.delete(key)
+        if size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + (ttl if ttl is not None else self.default_ttl)
+        self._entries[key] = (value, expires_at, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+
+    def delete(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def delete_many(self, keys: Iterable[str]):
+        for key in keys:
+            self.delete(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses
+        }
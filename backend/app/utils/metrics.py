@@ -0,0 +1,178 @@
+from contextvars import ContextVar
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, REGISTRY, generate_latest, multiprocess
+)
+from redis import asyncio as aioredis
+from redis.asyncio.client import Pipeline
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from typing import Callable, Dict, Optional
+import os
+import time
+
+# Every metric is a counter or a histogram with few, bounded labels, so an
+# observation is a dict lookup and a few additions, cheap enough for every
+# request and query. With PROMETHEUS_MULTIPROC_DIR set, as required with
+# several uvicorn workers, values are shared through files in that directory.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# For operations that usually take well under a millisecond
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5)
+# Fast as a rule, but a slow query or an exhausted pool can take seconds
+DB_BUCKETS = FAST_BUCKETS + (1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Requests no route handled, such as 404s and requests rejected by auth,
+# share one label so unknown paths cannot grow the number of series
+UNMATCHED_ROUTE = "<unmatched>"
+
+REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by method, route and status", ["method", "route", "status"]
+)
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by method and route",
+    ["method", "route"], buckets=LATENCY_BUCKETS
+)
+REQUEST_DB_QUERIES = Histogram(
+    "http_request_db_queries", "Database queries per HTTP request", ["route"], buckets=QUERY_COUNT_BUCKETS
+)
+REQUEST_DB_DURATION = Histogram(
+    "http_request_db_duration_seconds", "Time spent in database queries per HTTP request",
+    ["route"], buckets=LATENCY_BUCKETS
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "Database query latency", buckets=DB_BUCKETS
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out", "Database connections checked out of the pool", ["engine"], multiprocess_mode="livesum"
+)
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_overflow", "Database connections open beyond the pool size", ["engine"], multiprocess_mode="livesum"
+)
+DB_POOL_CHECKOUT_DURATION = Histogram(
+    "db_pool_checkout_duration_seconds",
+    "Time to check out a database connection, waiting for a free one or connecting",
+    ["engine"], buckets=DB_BUCKETS
+)
+REDIS_DURATION = Histogram(
+    "redis_command_duration_seconds", "Redis command latency, pipelines as PIPELINE",
+    ["command"], buckets=FAST_BUCKETS
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "Cache lookups by cache and result, hit or miss", ["cache", "result"]
+)
+JWT_VERIFICATION_DURATION = Histogram(
+    "jwt_verification_duration_seconds", "JWT verification time by result: cached, verified or rejected",
+    ["result"], buckets=FAST_BUCKETS
+)
+
+class RequestStats:
+    """Database work of the current request, collected across the threadpool"""
+    __slots__ = ("db_queries", "db_seconds")
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+
+# Threadpool calls and SQLAlchemy's async greenlets run in a copy of the
+# request's context, so they all see, and add to, the same RequestStats
+request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+def record_cache_lookup(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    DB_QUERY_DURATION.observe(elapsed)
+    stats = request_stats.get()
+    if stats is not None:
+        stats.db_queries += 1
+        stats.db_seconds += elapsed
+
+# Every engine, including the async engine's sync core and those of scripts and tests
+event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+class _InstrumentedPool:
+    engine_name = "sync"
+
+    def _update_usage(self):
+        DB_POOL_CHECKED_OUT.labels(self.engine_name).set(self.checkedout())
+        DB_POOL_OVERFLOW.labels(self.engine_name).set(max(self.overflow(), 0))
+
+    def _do_get(self):
+        # Waiting for a free connection, or opening a new one
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_DURATION.labels(self.engine_name).observe(time.perf_counter() - started)
+            self._update_usage()
+
+    def _do_return_conn(self, record):
+        super()._do_return_conn(record)
+        self._update_usage()
+
+class InstrumentedQueuePool(_InstrumentedPool, QueuePool):
+    """QueuePool recording its checkout times and connections in use"""
+
+class InstrumentedAsyncQueuePool(_InstrumentedPool, AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool recording its checkout times and connections in use"""
+    engine_name = "async"
+
+class InstrumentedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            REDIS_DURATION.labels("PIPELINE").observe(time.perf_counter() - started)
+
+class InstrumentedRedis(aioredis.Redis):
+    """Redis client recording the latency of every command and pipeline"""
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            REDIS_DURATION.labels(str(args[0]).upper()).observe(time.perf_counter() - started)
+
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None) -> InstrumentedPipeline:
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+# Path templates of endpoints, resolved on first use
+_route_paths: Dict[Callable, str] = {}
+
+def route_name(app, endpoint: Optional[Callable]) -> str:
+    """Path template of the route an endpoint serves, e.g. /recipes/{recipe_id}"""
+    if endpoint is None:
+        return UNMATCHED_ROUTE
+    path = _route_paths.get(endpoint)
+    if path is None:
+        # Mounted apps have no endpoint of their own and are labelled with their mount path
+        path = next(
+            (route.path for route in app.routes if getattr(route, "endpoint", getattr(route, "app", None)) is endpoint),
+            UNMATCHED_ROUTE
+        )
+        _route_paths[endpoint] = path
+    return path
+
+def record_request(method: str, route: str, status: int, duration: float, stats: RequestStats):
+    REQUESTS.labels(method, route, str(status)).inc()
+    REQUEST_DURATION.labels(method, route).observe(duration)
+    REQUEST_DB_QUERIES.labels(route).observe(stats.db_queries)
+    REQUEST_DB_DURATION.labels(route).observe(stats.db_seconds)
+
+def render_metrics() -> bytes:
+    """The metrics in the Prometheus text format, of all workers in multiprocess mode"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+METRICS_CONTENT_TYPE = CONTENT_TYPE_LATEST
@@ -0,0 +1,59 @@
+from typing import Iterable, List, Set, Tuple
+import hashlib
+import random
+import re
+import struct
+
+NUM_PERM = 64
+# 16 bands of 4 rows: pairs above ~0.5 Jaccard similarity share a bucket with high probability
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERM // LSH_BANDS
+SHINGLE_SIZE = 3
+
+MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(20240101)
+# Fixed seed, signatures must stay comparable across processes and deploys
+PERMUTATIONS = [
+    (_rng.randrange(1, MERSENNE_PRIME), _rng.randrange(0, MERSENNE_PRIME)) for _ in range(NUM_PERM)
+]
+
+def _hash(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "big")
+
+def recipe_features(ingredient_terms: Iterable[str], instructions: str) -> Set[str]:
+    """The ingredient set plus word shingles of the instructions"""
+    # Words of any script, so accented and non-Latin instructions shingle whole words
+    words = re.findall(r"\w+", instructions.lower())
+    shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(len(words) - SHINGLE_SIZE + 1, 1))}
+    return {f"i:{term}" for term in ingredient_terms} | {f"s:{shingle}" for shingle in shingles if shingle}
+
+def minhash_signature(features: Iterable[str]) -> List[int]:
+    """MinHash signature, the share of equal positions estimates Jaccard similarity"""
+    hashes = [_hash(feature) for feature in features]
+    if not hashes:
+        return [MERSENNE_PRIME] * NUM_PERM
+    return [min((a * h + b) % MERSENNE_PRIME for h in hashes) for a, b in PERMUTATIONS]
+
+def lsh_buckets(signature: List[int]) -> List[Tuple[int, int]]:
+    """(band, bucket) pairs, recipes sharing any of them are candidate duplicates"""
+    buckets = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        digest = hashlib.blake2b(struct.pack(f">{LSH_ROWS}Q", *rows), digest_size=8).digest()
+        # Signed so it fits a BIGINT column
+        buckets.append((band, int.from_bytes(digest, "big", signed=True)))
+    return buckets
+
+def estimate_similarity(signature: List[int], other: List[int]) -> float:
+    return sum(1 for a, b in zip(signature, other) if a == b) / NUM_PERM
+
+def signature_columns(ingredient_terms: Iterable[str], instructions: str) -> dict:
+    """Value of the signature column derived from a recipe's ingredient terms and instructions"""
+    return {"minhash_signature": minhash_signature(recipe_features(ingredient_terms, instructions))}
+
+def bucket_rows(recipe_id, group_id, signature: List[int]) -> List[dict]:
+    """Rows of recipe_lsh_buckets for a recipe's signature"""
+    return [
+        {"recipe_id": recipe_id, "band": band, "bucket": bucket, "group_id": group_id}
+        for band, bucket in lsh_buckets(signature)
+    ]
@@ -0,0 +1,43 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+from uuid import UUID
+from fastapi import HTTPException, status
+from sqlalchemy import Select, tuple_
+
+def encode_cursor(created_at: datetime, row_id: UUID) -> str:
+    """Encode the sort key of the last row on a page as an opaque cursor"""
+    payload = json.dumps([created_at.isoformat(), str(row_id)]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    """Decode a cursor produced by encode_cursor"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), UUID(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+def keyset_paginate(query: Select, model, cursor: Optional[str], limit: int) -> Select:
+    """
+    Apply newest-first keyset pagination on (created_at, id) to a query.
+    One extra row is fetched so the caller can tell whether another page exists.
+    """
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.where(tuple_(model.created_at, model.id) < tuple_(created_at, row_id))
+    return query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1)
+
+def build_page(rows: list, limit: int) -> dict:
+    """Split the rows fetched by keyset_paginate into a page and the next cursor"""
+    items = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return {"items": items, "next_cursor": next_cursor}
@@ -0,0 +1,109 @@
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from starlette.concurrency import run_in_threadpool
+import anyio
+import httpx
+import os
+import shutil
+import uuid
+from ..config import get_settings
+
+# Bytes read from a file per chunk when uploading it
+CHUNK_SIZE = 1024 * 1024
+
+class ImageStore(ABC):
+    """Where uploaded images and their variants are kept, by key"""
+    @abstractmethod
+    async def exists(self, key: str) -> bool:
+        """Whether an image is stored under key"""
+
+    @abstractmethod
+    async def put_file(self, key: str, path: str, content_type: str):
+        """Store a local file under key, streaming it in chunks"""
+
+    @abstractmethod
+    async def read(self, key: str) -> bytes:
+        """The bytes stored under key"""
+
+    @abstractmethod
+    def url(self, key: str) -> str:
+        """Public URL of the image stored under key"""
+
+class LocalImageStore(ImageStore):
+    """Images in a local directory, served by the app under base_url"""
+    def __init__(self, root: str, base_url: str):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    async def exists(self, key: str) -> bool:
+        return await run_in_threadpool(os.path.exists, self._path(key))
+
+    async def put_file(self, key: str, path: str, content_type: str):
+        def copy():
+            target = self._path(key)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            # Renamed into place so readers never see a partial file
+            partial = f"{target}.{uuid.uuid4().hex}.partial"
+            shutil.copyfile(path, partial)
+            os.replace(partial, target)
+        await run_in_threadpool(copy)
+
+    async def read(self, key: str) -> bytes:
+        async with await anyio.open_file(self._path(key), "rb") as file:
+            return await file.read()
+
+    def url(self, key: str) -> str:
+        return f"{self.base_url}/{key}"
+
+class SupabaseImageStore(ImageStore):
+    """Images in a public Supabase Storage bucket"""
+    def __init__(self, supabase_url: str, service_key: str, bucket: str):
+        self.public_url = f"{supabase_url.rstrip('/')}/storage/v1/object/public/{bucket}"
+        self.bucket = bucket
+        self.client = httpx.AsyncClient(
+            base_url=f"{supabase_url.rstrip('/')}/storage/v1",
+            headers={"apikey": service_key, "Authorization": f"Bearer {service_key}"},
+            timeout=60
+        )
+
+    async def exists(self, key: str) -> bool:
+        response = await self.client.head(f"/object/public/{self.bucket}/{key}")
+        return response.status_code == 200
+
+    async def put_file(self, key: str, path: str, content_type: str):
+        async def chunks():
+            async with await anyio.open_file(path, "rb") as file:
+                while chunk := await file.read(CHUNK_SIZE):
+                    yield chunk
+
+        response = await self.client.post(
+            f"/object/{self.bucket}/{key}",
+            content=chunks(),
+            headers={
+                "Content-Type": content_type,
+                "Content-Length": str(os.path.getsize(path)),
+                # Keys are content hashes, so stored objects never change
+                "Cache-Control": "max-age=31536000",
+                "x-upsert": "true"
+            }
+        )
+        response.raise_for_status()
+
+    async def read(self, key: str) -> bytes:
+        response = await self.client.get(f"/object/public/{self.bucket}/{key}")
+        response.raise_for_status()
+        return response.content
+
+    def url(self, key: str) -> str:
+        return f"{self.public_url}/{key}"
+
+@lru_cache()
+def get_image_store() -> ImageStore:
+    """The image store selected by IMAGE_STORE, "local" or "supabase" """
+    settings = get_settings()
+    if settings.IMAGE_STORE == "supabase":
+        return SupabaseImageStore(settings.SUPABASE_URL, settings.SUPABASE_KEY, settings.SUPABASE_STORAGE_BUCKET)
+    return LocalImageStore(settings.IMAGE_STORE_PATH, settings.IMAGE_BASE_URL)
@@ -0,0 +1,124 @@
+"""
+Benchmark the HTTP middleware stack on GET /recipes/{id}.
+
+Compares the previous stack (an @app.middleware("http") auth middleware plus
+BaseHTTPMiddleware request ID and error handling) against RequestContextMiddleware.
+Requests are driven in-process through ASGI and the recipe service is stubbed
+with a pre-rendered body, so only routing and middleware overhead is measured.
+
+Usage: python scripts/bench_middleware.py [--requests N] [--concurrency N]
+"""
+import sys
+import os
+
+# Add the parent directory to Python path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import time
+import uuid
+import httpx
+import jwt
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+from app.config import get_settings
+from app.dependencies import get_async_db
+from app.middleware.request_context import RequestContextMiddleware
+from app.routers import recipes
+from app.services import recipe as recipe_service
+from app.utils.auth import verify_supabase_jwt
+
+RECIPE_ID = uuid.uuid4()
+USER_ID = uuid.uuid4()
+RECIPE_BODY = (
+    b'{"title":"Benchmark soup","ingredients":["water","salt"],"instructions":"Boil.",'
+    b'"image_url":null,"id":"%s","group_id":"%s","created_at":"2024-01-01T00:00:00"}'
+) % (str(RECIPE_ID).encode(), str(uuid.uuid4()).encode())
+
+RECIPE_ETAG = recipe_service.recipe_etag(RECIPE_ID, 1)
+
+async def stub_get_recipe_by_id(db, recipe_id, user_id):
+    return RECIPE_ETAG, {"identity": RECIPE_BODY}
+
+async def stub_db():
+    yield None
+
+def add_legacy_middleware(app: FastAPI):
+    """The middleware stack as it was before RequestContextMiddleware"""
+    @app.middleware("http")
+    async def error_handler(request: Request, call_next):
+        try:
+            return await call_next(request)
+        except Exception:
+            return JSONResponse(status_code=500, content={"detail": "An unexpected error occurred."})
+
+    class RequestIDMiddleware(BaseHTTPMiddleware):
+        async def dispatch(self, request: Request, call_next):
+            request_id = str(uuid.uuid4())
+            response = await call_next(request)
+            response.headers["X-Request-ID"] = request_id
+            return response
+
+    app.add_middleware(RequestIDMiddleware)
+
+    @app.middleware("http")
+    async def supabase_auth_middleware(request: Request, call_next):
+        try:
+            token_data = await verify_supabase_jwt(request)
+            if token_data:
+                request.state.user = token_data
+        except HTTPException as e:
+            if not request.url.path.startswith("/auth/"):
+                raise e
+        return await call_next(request)
+
+def build_app(legacy: bool) -> FastAPI:
+    app = FastAPI()
+    if legacy:
+        add_legacy_middleware(app)
+    else:
+        app.add_middleware(RequestContextMiddleware)
+    app.include_router(recipes.router, prefix="/recipes")
+    app.dependency_overrides[get_async_db] = stub_db
+    return app
+
+async def run(app: FastAPI, total: int, concurrency: int, headers: dict) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://localhost") as client:
+        url = f"/recipes/{RECIPE_ID}"
+
+        async def worker(count: int):
+            for _ in range(count):
+                response = await client.get(url, headers=headers)
+                # A failing stack would otherwise be timed on its error responses
+                if response.status_code != 200 or response.headers.get("etag") != RECIPE_ETAG:
+                    raise SystemExit(f"GET {url} answered {response.status_code}: {response.text}")
+
+        # Warm up routing, dependency resolution and the verified token cache
+        await worker(100)
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(total // concurrency) for _ in range(concurrency)))
+        return (total // concurrency * concurrency) / (time.perf_counter() - started)
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    recipe_service.get_recipe_by_id = stub_get_recipe_by_id
+    token = jwt.encode(
+        {"sub": str(USER_ID), "aud": "authenticated", "exp": int(time.time()) + 3600},
+        get_settings().SUPABASE_JWT_SECRET,
+        algorithm="HS256"
+    )
+    headers = {"Authorization": f"Bearer {token}"}
+
+    for name, legacy in (("before (http + BaseHTTPMiddleware)", True), ("after (RequestContextMiddleware)", False)):
+        rps = await run(build_app(legacy), args.requests, args.concurrency, headers)
+        print(f"{name:40s} {rps:10.0f} req/s")
+
+if __name__ == '__main__':
+    asyncio.run(main())
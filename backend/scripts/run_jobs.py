@@ -0,0 +1,10 @@
+import sys
+import os
+
+# Add the parent directory to Python path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.scripts.run_jobs import main
+
+if __name__ == '__main__':
+    main()
@@ -14,13 +14,19 @@ setup(
         "passlib==1.7.4",
         "python-multipart==0.0.6",
         "redis==5.0.1",
+        "orjson==3.9.10",
         "psycopg2-binary==2.9.9",
+        "asyncpg==0.29.0",
         "python-dotenv==1.0.0",
         "authlib==1.2.1",
         "httpx==0.25.2",
+        "Pillow>=10.1.0",
+        "Brotli>=1.1.0",
+        "prometheus-client>=0.19.0",
         "supabase>=2.0.0",
         "uuid==1.30",
         "pytest==7.4.3",
-        "pytest-asyncio==0.21.1"
+        "pytest-asyncio==0.21.1",
+        "fakeredis[lua]>=2.20.0"
     ],
 ) 
\ No newline at end of file
@@ -4,7 +4,7 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from app.main import app
 from app.models import Base
-from app.dependencies import get_db
+from app.dependencies import get_db, get_async_db, ThreadedSession
 
 # Use SQLite for testing
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -32,9 +32,14 @@ def client(test_db):
         finally:
             test_db.close()
     
+    async def override_get_async_db():
+        yield ThreadedSession(test_db)
+    
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
     yield TestClient(app)
-    del app.dependency_overrides[get_db] 
+    del app.dependency_overrides[get_db]
+    del app.dependency_overrides[get_async_db]
 
 @pytest.fixture(autouse=True)
 def mock_rate_limit(mocker):
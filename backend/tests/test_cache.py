@@ -0,0 +1,77 @@
+import asyncio
+import time
+import uuid
+import fakeredis
+import pytest
+from fastapi import Depends, FastAPI, Request
+from fastapi.testclient import TestClient
+import app.dependencies as dependencies
+from app.utils import cache
+
+app = FastAPI()
+
+def user_claims(request: Request) -> dict:
+    return {"sub": request.headers["x-user"]}
+
+@app.get("/profile")
+@cache.cache_response(expire_time_seconds=60)
+async def profile(request: Request, token_data: dict = Depends(user_claims)):
+    return {"user": token_data["sub"]}
+
+@pytest.fixture
+def redis(monkeypatch):
+    redis = fakeredis.aioredis.FakeRedis()
+    monkeypatch.setattr(dependencies, "redis_client", redis)
+    cache.local_cache.clear()
+    return redis
+
+def test_entries_far_from_expiry_are_not_refreshed_early():
+    assert not cache._should_refresh_early(delta=0.01, expires_at=time.time() + 300)
+
+def test_expired_entries_are_always_refreshed():
+    assert cache._should_refresh_early(delta=0.01, expires_at=time.time() - 1)
+
+def test_packed_values_round_trip():
+    raw = cache._pack(b'{"a": "b|c"}', 0.25, 1700000000.5)
+    assert cache._unpack(raw) == (b'{"a": "b|c"}', 0.25, 1700000000.5)
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_computation():
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return {"value": 42}
+
+    results = await asyncio.gather(*[
+        cache.get_or_compute("test:single-flight", compute, expire_time_seconds=1)
+        for _ in range(10)
+    ])
+
+    assert calls == 1
+    assert all(result == {"value": 42} for result in results)
+
+def test_cached_responses_are_scoped_to_the_user(redis):
+    first, second = str(uuid.uuid4()), str(uuid.uuid4())
+    with TestClient(app) as client:
+        for _ in range(2):
+            assert client.get("/profile", headers={"x-user": first}).json() == {"user": first}
+            assert client.get("/profile", headers={"x-user": second}).json() == {"user": second}
+        keys = client.portal.call(redis.keys, "cache:/profile*")
+
+    assert sorted(key.decode() for key in keys) == sorted(f"cache:/profile:user:{user}" for user in (first, second))
+
+@pytest.mark.asyncio
+async def test_invalidate_drops_tagged_entries_in_both_tiers(redis):
+    await cache.cache_set("test:a", b"a", 60, tags=["group:1"])
+    await cache.cache_set("test:b", b"b", 60, tags=["group:1", "user:1"])
+    await cache.cache_set("test:c", b"c", 60, tags=["group:2"])
+
+    assert await cache.invalidate(["group:1"]) == 2
+
+    assert await redis.exists("test:a", "test:b") == 0
+    assert cache.local_cache.get("test:a") is None and cache.local_cache.get("test:b") is None
+    assert await cache.cache_get("test:c") == b"c"
+    assert cache.local_cache.get("test:c") == b"c"
@@ -0,0 +1,91 @@
+import gzip
+import brotli
+from fastapi import FastAPI, Request
+from fastapi.responses import Response, StreamingResponse
+from fastapi.testclient import TestClient
+from app.utils.compression import (
+    CompressionMiddleware, choose_encoding, compress, precompress, pack_variants, unpack_variants
+)
+from app.utils.cache import variant_response
+from app.utils.etag import check_if_match, etag_matches, make_etag
+
+BODY = b'{"instructions": "' + b"Stir until golden. " * 200 + b'"}'
+ETAG = make_etag("recipe", 1)
+
+app = FastAPI()
+app.add_middleware(CompressionMiddleware, minimum_size=1024)
+
+@app.get("/large")
+async def large():
+    return Response(BODY, media_type="application/json", headers={"ETag": ETAG})
+
+@app.get("/small")
+async def small():
+    return Response(b'{"ok": true}', media_type="application/json")
+
+@app.get("/stream")
+async def stream():
+    async def lines():
+        for n in range(100):
+            yield b'{"row": %d, "title": "Soup"}\n' % n
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.get("/precompressed")
+async def precompressed(request: Request):
+    return variant_response(request, await precompress(BODY), ETAG)
+
+client = TestClient(app)
+
+def raw_get(path: str, accept_encoding: str):
+    # Read the body as sent, without httpx decoding it
+    with client.stream("GET", path, headers={"Accept-Encoding": accept_encoding}) as response:
+        return response, b"".join(response.iter_raw())
+
+def test_choose_encoding():
+    assert choose_encoding("gzip, deflate, br") == "br"
+    assert choose_encoding("br;q=0.5, gzip") == "gzip"
+    assert choose_encoding("gzip;q=0, *;q=0.1") == "br"
+    assert choose_encoding("identity") is None
+    assert choose_encoding(None) is None
+
+def test_variants_round_trip():
+    variants = {"identity": BODY, "gzip": compress(BODY, "gzip"), "br": compress(BODY, "br")}
+    assert unpack_variants(pack_variants(variants)) == variants
+    # Entries cached before variants were stored hold the body alone
+    assert unpack_variants(BODY) == {"identity": BODY}
+
+def test_large_responses_are_compressed_with_the_preferred_coding():
+    response, body = raw_get("/large", "gzip, br")
+    assert response.headers["content-encoding"] == "br"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) == len(body)
+    assert brotli.decompress(body) == BODY
+
+    response, body = raw_get("/large", "gzip")
+    assert gzip.decompress(body) == BODY
+
+def test_compressed_etags_still_match():
+    response, _ = raw_get("/large", "gzip")
+    etag = response.headers["etag"]
+    assert etag != ETAG
+    assert etag_matches(etag, ETAG)
+    check_if_match(etag, ETAG)
+
+def test_small_and_unaccepted_responses_are_sent_as_is():
+    response, body = raw_get("/small", "gzip")
+    assert "content-encoding" not in response.headers and body == b'{"ok": true}'
+
+    response, body = raw_get("/large", "identity")
+    assert "content-encoding" not in response.headers and body == BODY
+
+def test_streamed_responses_are_compressed_on_the_fly():
+    response, body = raw_get("/stream", "gzip")
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert gzip.decompress(body).count(b"\n") == 100
+
+def test_precompressed_variants_pass_through():
+    response, body = raw_get("/precompressed", "br")
+    assert response.headers["content-encoding"] == "br"
+    assert response.headers["etag"] == ETAG[:-1] + '-br"'
+    assert brotli.decompress(body) == BODY
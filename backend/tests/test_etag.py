@@ -0,0 +1,60 @@
+import uuid
+import pytest
+from fastapi import HTTPException
+from app.dependencies import ThreadedSession
+from app.models.group import FamilyGroup, GroupMember
+from app.models.recipe import Recipe
+from app.models.user import User, UserRole
+from app.schemas.recipe import RecipeUpdate
+from app.services import recipe as recipe_service
+from app.utils.etag import make_etag, etag_matches, check_if_match
+
+def test_etags_depend_only_on_their_parts():
+    etag = make_etag("recipe", 1, 2)
+    assert etag.startswith('"') and etag.endswith('"')
+    assert etag == make_etag("recipe", 1, 2)
+    assert etag != make_etag("recipe", 1, 3)
+
+def test_if_none_match_compares_weakly():
+    etag = make_etag("recipe", 1)
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches('"other"', etag)
+
+def test_if_match_compares_strongly():
+    etag = make_etag("recipe", 1)
+    check_if_match(None, etag)
+    check_if_match(etag, etag)
+    check_if_match("*", etag)
+    for header in (f"W/{etag}", '"other"'):
+        with pytest.raises(HTTPException) as error:
+            check_if_match(header, etag)
+        assert error.value.status_code == 412
+
+@pytest.fixture
+def recipe(test_db):
+    user = User(id=uuid.uuid4(), email="cook@example.com", name="Cook", role=UserRole.MEMBER)
+    group = FamilyGroup(id=uuid.uuid4(), name="Family", owner_id=user.id)
+    recipe = Recipe(id=uuid.uuid4(), title="Omelette", ingredients=["2 eggs"], instructions="Whisk", group_id=group.id)
+    test_db.add_all([user, group, GroupMember(user_id=user.id, group_id=group.id), recipe])
+    test_db.commit()
+    return user.id, group.id, recipe.id
+
+@pytest.mark.asyncio
+async def test_updates_bump_versions_and_check_if_match(test_db, recipe):
+    user_id, group_id, recipe_id = recipe
+    db = ThreadedSession(test_db)
+    read_etag = recipe_service.recipe_etag(recipe_id, 1)
+    change = RecipeUpdate(title="Frittata", ingredients=["3 eggs"], instructions="Bake")
+
+    updated = await recipe_service.update_recipe(db, recipe_id, change, user_id, if_match=read_etag)
+    assert updated.version == 2
+    assert test_db.get(FamilyGroup, group_id).version == 2
+
+    # A second writer holding the first ETag is rejected
+    with pytest.raises(HTTPException) as error:
+        await recipe_service.update_recipe(db, recipe_id, change, user_id, if_match=read_etag)
+    assert error.value.status_code == 412
+    assert test_db.get(Recipe, recipe_id).version == 2
@@ -0,0 +1,77 @@
+import uuid
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+from app.models.group import FamilyGroup
+from app.models.outbox import OutboxEvent
+from app.models.recipe import Recipe
+from app.models.user import User, UserRole
+from app.scripts.backfill_ingredients import backfill_ingredients, parse_batch
+from app.services.outbox import CACHE_INVALIDATION
+from app.utils.minhash import signature_columns, LSH_BANDS
+from app.utils.ingredients import ingredient_columns, ingredient_terms, normalize_ingredient, parse_ingredient
+
+def test_quantities_units_and_notes_are_dropped():
+    assert normalize_ingredient("2 cups flour, sifted") == "flour"
+    assert normalize_ingredient("1 1/2 tsp Salt") == "salt"
+    assert normalize_ingredient("½ cup Tomatoes (diced)") == "tomato"
+    assert normalize_ingredient("2-3 cloves of garlic, minced") == "garlic"
+
+def test_plurals_are_singularized():
+    assert normalize_ingredient("3 large eggs") == "egg"
+    assert normalize_ingredient("berries") == "berry"
+    assert normalize_ingredient("asparagus") == "asparagus"
+
+def test_accented_names_are_kept_whole():
+    assert normalize_ingredient("2 jalapeños") == "jalapeño"
+    assert parse_ingredient("1 cup crème fraîche")["name"] == "crème fraîche"
+    assert normalize_ingredient("200 g Gruyère, grated") == "gruyère"
+
+def test_escaped_lines_are_unescaped():
+    assert normalize_ingredient("salt &amp; pepper") == "salt pepper"
+
+def test_terms_are_unique_and_sorted():
+    assert ingredient_terms(["Salt", "2 eggs", "salt, to taste", "1 egg"]) == ["egg", "salt"]
+
+def test_lines_are_parsed_into_fields():
+    assert parse_ingredient("1 1/2 cups Tomatoes (diced), peeled") == {
+        "quantity": 1.5,
+        "quantity_max": None,
+        "unit": "cup",
+        "name": "tomato",
+        "notes": "diced, peeled"
+    }
+
+def test_ranges_and_mixed_numbers():
+    assert parse_ingredient("2-3 cloves of garlic")["quantity_max"] == 3.0
+    assert parse_ingredient("1-1/2 cups sugar")["quantity"] == 1.5
+    assert parse_ingredient("1½ cups milk")["quantity"] == 1.5
+
+def test_lines_without_quantity_or_unit():
+    assert parse_ingredient("Salt and pepper, to taste") == {
+        "quantity": None,
+        "quantity_max": None,
+        "unit": None,
+        "name": "salt and pepper",
+        "notes": "to taste"
+    }
+
+def test_backfill_batches_match_write_time_columns():
+    rows = [(uuid.uuid4(), ["2 eggs", "1 cup flour"], "Whisk and bake", uuid.uuid4())]
+    values, buckets = parse_batch(rows)
+    columns = ingredient_columns(rows[0][1])
+    assert values == [{"id": rows[0][0], **columns, **signature_columns(columns["ingredient_terms"], "Whisk and bake")}]
+    assert len(buckets) == LSH_BANDS
+
+def test_backfill_invalidates_the_groups_it_bumps(test_db):
+    user = User(id=uuid.uuid4(), email="cook@example.com", name="Cook", role=UserRole.MEMBER)
+    group = FamilyGroup(id=uuid.uuid4(), name="Family", owner_id=user.id)
+    recipe = Recipe(id=uuid.uuid4(), title="Omelette", ingredients=["2 eggs"], instructions="Whisk", group_id=group.id)
+    test_db.add_all([user, group, recipe])
+    test_db.commit()
+
+    assert backfill_ingredients(sessionmaker(bind=test_db.get_bind()), workers=1) == 1
+
+    test_db.expire_all()
+    assert test_db.get(FamilyGroup, group.id).version == 2
+    events = test_db.scalars(select(OutboxEvent).where(OutboxEvent.topic == CACHE_INVALIDATION)).all()
+    assert [event.payload for event in events] == [{"tags": [f"group:{group.id}"]}]
@@ -0,0 +1,158 @@
+import asyncio
+import io
+import uuid
+import fakeredis
+import pytest
+from fastapi import HTTPException, UploadFile
+from PIL import Image
+import app.dependencies as dependencies
+from app.config import get_settings
+from app.models.user import UserRole
+from app.services import recipe_image
+from app.services.image_parsers import FakeImageParser, recipe_from_text
+from app.services import jobs
+from app.services.jobs import JobWorker, PermanentJobError, delayed_key, enqueue_job, get_job, stream_key
+from app.utils.storage import LocalImageStore
+
+USER_ID = uuid.uuid4()
+
+@pytest.fixture(autouse=True)
+def redis(monkeypatch):
+    redis = fakeredis.aioredis.FakeRedis()
+    monkeypatch.setattr(dependencies, "redis_client", redis)
+    monkeypatch.setattr(get_settings(), "JOB_RETRY_BACKOFF_SECONDS", 0)
+    # Retries are moved back to the streams between reads
+    monkeypatch.setattr(jobs, "BLOCK_MILLISECONDS", 10)
+    return redis
+
+async def run_until_done(worker: JobWorker, *job_ids, timeout: float = 5):
+    """Run the worker until every job has finished"""
+    task = asyncio.create_task(worker.run())
+    try:
+        for _ in range(int(timeout * 100)):
+            jobs = [await get_job(job_id, USER_ID) for job_id in job_ids]
+            if all(job["status"] in ("succeeded", "failed") for job in jobs):
+                return jobs
+            await asyncio.sleep(0.01)
+        raise AssertionError(f"Jobs did not finish: {jobs}")
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+@pytest.mark.asyncio
+async def test_jobs_are_only_visible_to_their_owner():
+    job = await enqueue_job("test", {"n": 1}, USER_ID)
+    assert (job["status"], job["attempts"], job["result"]) == ("queued", 0, None)
+    assert (await get_job(job["id"], USER_ID))["id"] == job["id"]
+    with pytest.raises(HTTPException) as error:
+        await get_job(job["id"], uuid.uuid4())
+    assert error.value.status_code == 404
+
+@pytest.mark.asyncio
+async def test_failed_jobs_are_retried():
+    calls = []
+
+    async def flaky(payload):
+        calls.append(payload)
+        if len(calls) < 3:
+            raise ConnectionError("backend unavailable")
+        return {"doubled": payload["n"] * 2}
+
+    job = await enqueue_job("test", {"n": 21}, USER_ID)
+    [done] = await run_until_done(JobWorker("test", flaky), job["id"])
+    assert (done["status"], done["attempts"], done["result"], done["error"]) == ("succeeded", 3, {"doubled": 42}, None)
+
+@pytest.mark.asyncio
+async def test_jobs_fail_after_max_attempts_or_permanent_errors():
+    async def failing(payload):
+        if payload["permanent"]:
+            raise PermanentJobError("not a recipe")
+        raise TimeoutError()
+
+    retried = await enqueue_job("test", {"permanent": False}, USER_ID)
+    permanent = await enqueue_job("test", {"permanent": True}, USER_ID)
+    retried, permanent = await run_until_done(JobWorker("test", failing), retried["id"], permanent["id"])
+    assert (retried["status"], retried["attempts"], retried["error"]) == ("failed", 3, "TimeoutError")
+    assert (permanent["status"], permanent["attempts"], permanent["error"]) == ("failed", 1, "not a recipe")
+
+@pytest.mark.asyncio
+async def test_jobs_waiting_to_retry_hold_no_slot(redis, monkeypatch):
+    monkeypatch.setattr(get_settings(), "JOB_RETRY_BACKOFF_SECONDS", 60)
+
+    async def handler(payload):
+        if payload["fail"]:
+            raise ConnectionError("backend unavailable")
+        return {}
+
+    worker = JobWorker("test", handler, concurrency=1)
+    failing = await enqueue_job("test", {"fail": True}, USER_ID)
+    working = await enqueue_job("test", {"fail": False}, USER_ID)
+    task = asyncio.create_task(worker.run())
+    try:
+        for _ in range(500):
+            if (await get_job(working["id"], USER_ID))["status"] == "succeeded":
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    assert (await get_job(working["id"], USER_ID))["status"] == "succeeded"
+    assert (await get_job(failing["id"], USER_ID))["status"] == "queued"
+    assert await redis.zrange(delayed_key(stream_key("test", "standard")), 0, -1) == [failing["id"].encode()]
+
+@pytest.mark.asyncio
+async def test_premium_jobs_run_first(redis):
+    order = []
+
+    async def record(payload):
+        order.append(payload["name"])
+        return {}
+
+    worker = JobWorker("test", record, concurrency=1)
+    await worker.setup(redis)
+    jobs = [await enqueue_job("test", {"name": name}, USER_ID, priority) for name, priority in [
+        ("standard 1", "standard"), ("standard 2", "standard"), ("premium", "premium")
+    ]]
+    await run_until_done(worker, *(job["id"] for job in jobs))
+    assert order == ["premium", "standard 1", "standard 2"]
+
+@pytest.mark.asyncio
+async def test_results_expire(redis):
+    async def handler(payload):
+        return {}
+
+    job = await enqueue_job("test", {}, USER_ID)
+    await run_until_done(JobWorker("test", handler), job["id"])
+    assert 0 < await redis.ttl(f"job:{job['id']}") <= get_settings().JOB_RESULT_TTL_SECONDS
+
+@pytest.mark.asyncio
+async def test_parse_image_job_returns_a_recipe(tmp_path, monkeypatch):
+    store = LocalImageStore(str(tmp_path), "/images")
+    monkeypatch.setattr(recipe_image, "get_image_store", lambda: store)
+    monkeypatch.setattr(recipe_image, "get_image_parser", lambda: FakeImageParser())
+    photo = io.BytesIO()
+    Image.new("RGB", (10, 10)).save(photo, "PNG")
+    photo.seek(0)
+
+    job = await recipe_image.parse_recipe_image(UploadFile(file=photo, filename="photo.png"), USER_ID, UserRole.PREMIUM)
+    [done] = await run_until_done(JobWorker(recipe_image.PARSE_IMAGE_QUEUE, recipe_image.run_parse_image_job), job["id"])
+    assert done["result"]["title"] == "Parsed recipe"
+    assert done["result"]["image_url"].startswith("/images/") and done["result"]["image_url"].endswith(".png")
+
+def test_recipe_from_text():
+    text = """
+    Grandma's Pancakes
+
+    Ingredients:
+    - 2 cups flour
+    - 2 eggs
+    Method
+    Whisk everything together.
+    Fry until golden.
+    """
+    assert recipe_from_text(text) == {
+        "title": "Grandma's Pancakes",
+        "ingredients": ["2 cups flour", "2 eggs"],
+        "instructions": "Whisk everything together.\nFry until golden."
+    }
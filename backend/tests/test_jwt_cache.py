@@ -0,0 +1,84 @@
+import time
+import jwt
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+from app.config import get_settings
+import fakeredis
+import app.dependencies as dependencies
+from app.utils.auth import VerifiedTokenCache, revoked_key, verify_supabase_jwt, verified_token_cache
+
+def make_request(token: str) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/recipes/",
+        "headers": [(b"authorization", f"Bearer {token}".encode())]
+    })
+
+def make_token(sub: str = "user-1", expires_in: int = 3600) -> str:
+    claims = {"sub": sub, "aud": "authenticated", "iat": int(time.time()), "exp": int(time.time()) + expires_in}
+    return jwt.encode(claims, get_settings().SUPABASE_JWT_SECRET, algorithm="HS256")
+
+def test_cached_claims_expire_with_the_token():
+    cache = VerifiedTokenCache(max_entries=10, max_ttl_seconds=3600)
+    cache.set("live", {"sub": "a", "exp": time.time() + 60})
+    cache.set("expired", {"sub": "a", "exp": time.time() - 1})
+
+    assert cache.get("live") == {"sub": "a", "exp": pytest.approx(time.time() + 60, abs=1)}
+    assert cache.get("expired") is None
+
+def test_cache_is_bounded():
+    cache = VerifiedTokenCache(max_entries=2, max_ttl_seconds=3600)
+    for token in ("a", "b", "c"):
+        cache.set(token, {"sub": token})
+
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 2
+
+def test_revoked_entries_are_dropped():
+    cache = VerifiedTokenCache(max_entries=10, max_ttl_seconds=3600)
+    cache.set("t1", {"sub": "a"})
+    cache.set("t2", {"sub": "a"})
+    cache.set("t3", {"sub": "b"})
+
+    cache.revoke_subject("a")
+
+    assert cache.stats()["entries"] == 1
+    assert cache.get("t3") == {"sub": "b"}
+
+@pytest.mark.asyncio
+async def test_repeat_requests_are_served_from_cache():
+    verified_token_cache.clear()
+    token = make_token()
+    hits = verified_token_cache.hits
+
+    first = await verify_supabase_jwt(make_request(token))
+    second = await verify_supabase_jwt(make_request(token))
+
+    assert first == second
+    assert verified_token_cache.hits == hits + 1
+
+@pytest.mark.asyncio
+async def test_tokens_issued_before_a_revocation_are_rejected():
+    verified_token_cache.clear()
+    token = make_token(sub="revoked-user")
+    await verify_supabase_jwt(make_request(token))
+
+    verified_token_cache.revoke_subject("revoked-user", time.time() + 1)
+
+    with pytest.raises(HTTPException) as error:
+        await verify_supabase_jwt(make_request(token))
+    assert error.value.detail == "Token has been revoked"
+
+@pytest.mark.asyncio
+async def test_revocations_missed_by_a_worker_are_read_from_redis(monkeypatch):
+    redis = fakeredis.aioredis.FakeRedis()
+    monkeypatch.setattr(dependencies, "redis_client", redis)
+    verified_token_cache.clear()
+    token = make_token(sub="deleted-user")
+    await redis.set(revoked_key("deleted-user"), time.time() + 1)
+
+    with pytest.raises(HTTPException) as error:
+        await verify_supabase_jwt(make_request(token))
+    assert error.value.detail == "Token has been revoked"
@@ -0,0 +1,50 @@
+import time
+from app.utils.local_cache import LocalCache
+
+def test_get_returns_stored_value_and_counts_hits():
+    cache = LocalCache(max_entries=10, max_bytes=1024, default_ttl=60)
+    cache.set("a", "value")
+
+    assert cache.get("a") == "value"
+    assert cache.get("missing") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LocalCache(max_entries=2, max_bytes=1024, default_ttl=60)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+
+    assert cache.get("a") == "1"
+    assert cache.get("b") is None
+    assert cache.get("c") == "3"
+
+def test_byte_budget_is_enforced():
+    cache = LocalCache(max_entries=10, max_bytes=10, default_ttl=60)
+    cache.set("a", "x" * 6)
+    cache.set("b", "y" * 6)
+    cache.set("too_big", "z" * 11)
+
+    assert cache.get("a") is None
+    assert cache.get("b") == "y" * 6
+    assert cache.get("too_big") is None
+    assert cache.stats()["bytes"] == 6
+
+def test_expired_entries_are_not_returned():
+    cache = LocalCache(max_entries=10, max_bytes=1024, default_ttl=60)
+    cache.set("a", "1", ttl=0.01)
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+def test_delete_many_drops_invalidated_keys():
+    cache = LocalCache(max_entries=10, max_bytes=1024, default_ttl=60)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.delete_many(["a", "unknown"])
+
+    assert cache.get("a") is None
+    assert cache.get("b") == "2"
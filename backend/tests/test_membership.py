@@ -0,0 +1,92 @@
+import uuid
+import fakeredis
+import pytest
+import app.dependencies as dependencies
+from app.services.membership import COMPLETE_MARKER, membership_index, membership_key
+from app.utils.cache import local_cache
+
+class FakeScalars:
+    def __init__(self, values):
+        self.values = values
+
+    def all(self):
+        return self.values
+
+class FakeSession:
+    """Counts queries and returns a fixed membership"""
+    def __init__(self, group_ids):
+        self.group_ids = group_ids
+        self.queries = 0
+
+    async def scalars(self, statement):
+        self.queries += 1
+        return FakeScalars(self.group_ids)
+
+class RacingSession(FakeSession):
+    """Returns its membership as read before running a change, as a load racing that change would"""
+    def __init__(self, group_ids, change):
+        super().__init__(group_ids)
+        self.change = change
+
+    async def scalars(self, statement):
+        result = await super().scalars(statement)
+        if self.queries == 1:
+            await self.change()
+        return result
+
+@pytest.fixture
+def redis(monkeypatch):
+    redis = fakeredis.aioredis.FakeRedis()
+    monkeypatch.setattr(dependencies, "redis_client", redis)
+    return redis
+
+@pytest.mark.asyncio
+async def test_cached_membership_needs_no_query():
+    user_id, group_id = uuid.uuid4(), uuid.uuid4()
+    local_cache.set(membership_key(user_id), frozenset([group_id]))
+    db = FakeSession([])
+
+    assert await membership_index.is_member(db, user_id, group_id)
+    assert not await membership_index.is_member(db, user_id, uuid.uuid4())
+    assert db.queries == 0
+
+@pytest.mark.asyncio
+async def test_falls_back_to_the_database():
+    user_id, group_id = uuid.uuid4(), uuid.uuid4()
+    db = FakeSession([group_id])
+
+    assert await membership_index.get_group_ids(db, user_id) == frozenset([group_id])
+    assert db.queries >= 1
+
+@pytest.mark.asyncio
+async def test_membership_changes_evict_the_local_entry(redis):
+    user_id, group_id = uuid.uuid4(), uuid.uuid4()
+    local_cache.set(membership_key(user_id), frozenset())
+
+    await membership_index.update(group_id, added=[user_id])
+
+    assert local_cache.get(membership_key(user_id)) is None
+    assert await redis.smembers(membership_key(user_id)) == {str(group_id).encode()}
+
+@pytest.mark.asyncio
+async def test_loaded_membership_is_stored_complete(redis):
+    user_id, group_id = uuid.uuid4(), uuid.uuid4()
+    db = FakeSession([group_id])
+
+    assert await membership_index.get_group_ids(db, user_id) == frozenset([group_id])
+    assert await redis.smembers(membership_key(user_id)) == {COMPLETE_MARKER, str(group_id).encode()}
+
+@pytest.mark.asyncio
+async def test_load_racing_a_removal_is_not_stored(redis):
+    user_id, group_id = uuid.uuid4(), uuid.uuid4()
+    db = RacingSession([group_id], lambda: membership_index.update(group_id, removed=[user_id]))
+
+    # The load saw the membership before the removal committed
+    assert await membership_index.get_group_ids(db, user_id) == frozenset([group_id])
+    assert COMPLETE_MARKER not in await redis.smembers(membership_key(user_id))
+    assert local_cache.get(membership_key(user_id)) is None
+
+    # The next check loads again and sees the removal
+    db.group_ids = []
+    assert not await membership_index.is_member(db, user_id, group_id)
+    assert db.queries == 2
@@ -0,0 +1,119 @@
+import time
+import uuid
+import fakeredis
+import jwt
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+from starlette.concurrency import run_in_threadpool
+from app.config import get_settings
+from app.main import app as main_app
+from app.middleware.request_context import RequestContextMiddleware
+from app.utils.cache import get_or_compute, local_cache
+from app.utils.metrics import InstrumentedQueuePool, InstrumentedRedis, UNMATCHED_ROUTE, render_metrics
+import app.dependencies as dependencies
+
+engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+
+def run_queries(count: int):
+    with engine.connect() as connection:
+        for _ in range(count):
+            connection.execute(text("SELECT 1"))
+
+app = FastAPI()
+app.add_middleware(RequestContextMiddleware)
+
+@app.get("/health")
+async def health():
+    return {"status": "healthy"}
+
+@app.get("/items/{item_id}")
+async def item(item_id: int):
+    await run_in_threadpool(run_queries, 3)
+    return {"id": item_id}
+
+client = TestClient(app, raise_server_exceptions=False)
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+def auth_headers() -> dict:
+    claims = {"sub": str(uuid.uuid4()), "aud": "authenticated", "exp": int(time.time()) + 3600}
+    token = jwt.encode(claims, get_settings().SUPABASE_JWT_SECRET, algorithm="HS256")
+    return {"Authorization": f"Bearer {token}"}
+
+def test_requests_are_labelled_by_route_template():
+    before = sample("http_requests_total", method="GET", route="/items/{item_id}", status="200")
+    client.get("/items/1", headers=auth_headers())
+    client.get("/items/2", headers=auth_headers())
+    assert sample("http_requests_total", method="GET", route="/items/{item_id}", status="200") == before + 2
+    assert b'route="/items/{item_id}"' in render_metrics()
+
+def test_unknown_paths_share_one_label():
+    before = sample("http_requests_total", method="GET", route=UNMATCHED_ROUTE, status="401")
+    client.get(f"/unknown/{uuid.uuid4()}")
+    assert sample("http_requests_total", method="GET", route=UNMATCHED_ROUTE, status="401") == before + 1
+
+def test_database_queries_are_counted_per_request():
+    before = sample("http_request_db_queries_sum", route="/items/{item_id}")
+    response = client.get("/items/1", headers=auth_headers())
+    assert sample("http_request_db_queries_sum", route="/items/{item_id}") == before + 3
+    assert "db;dur=" in response.headers["server-timing"]
+
+def test_jwt_verification_is_timed_by_result():
+    headers = auth_headers()
+    verified = sample("jwt_verification_duration_seconds_count", result="verified")
+    cached = sample("jwt_verification_duration_seconds_count", result="cached")
+    client.get("/health", headers=headers)
+    client.get("/items/1", headers=headers)
+    client.get("/items/1", headers=headers)
+    assert sample("jwt_verification_duration_seconds_count", result="verified") == verified + 1
+    assert sample("jwt_verification_duration_seconds_count", result="cached") == cached + 1
+
+def test_pool_checkouts_are_tracked():
+    pooled = create_engine("sqlite://", poolclass=InstrumentedQueuePool)
+    checked_out = sample("db_pool_checked_out", engine="sync")
+    checkouts = sample("db_pool_checkout_duration_seconds_count", engine="sync")
+    with pooled.connect():
+        assert sample("db_pool_checked_out", engine="sync") == checked_out + 1
+    assert sample("db_pool_checked_out", engine="sync") == checked_out
+    assert sample("db_pool_checkout_duration_seconds_count", engine="sync") == checkouts + 1
+
+@pytest.mark.asyncio
+async def test_redis_commands_and_cache_lookups_are_recorded(monkeypatch):
+    redis = InstrumentedRedis(connection_pool=fakeredis.aioredis.FakeRedis().connection_pool)
+    monkeypatch.setattr(dependencies, "redis_client", redis)
+    local_cache.clear()
+    key = f"metrics-test:{uuid.uuid4()}"
+    gets = sample("redis_command_duration_seconds_count", command="GET")
+    pipelines = sample("redis_command_duration_seconds_count", command="PIPELINE")
+    hits = sample("cache_requests_total", cache="metrics-test", result="hit")
+    misses = sample("cache_requests_total", cache="metrics-test", result="miss")
+
+    async def compute():
+        return {"value": 1}
+
+    assert await get_or_compute(key, compute) == {"value": 1}
+    assert await get_or_compute(key, compute) == {"value": 1}
+    assert sample("cache_requests_total", cache="metrics-test", result="miss") == misses + 1
+    assert sample("cache_requests_total", cache="metrics-test", result="hit") == hits + 1
+    assert sample("redis_command_duration_seconds_count", command="GET") == gets + 1
+    assert sample("redis_command_duration_seconds_count", command="PIPELINE") == pipelines + 1
+
+def test_metrics_endpoint_fails_closed(monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "")
+    main_client = TestClient(main_app, base_url="http://localhost")
+    assert main_client.get("/metrics").status_code == 404
+
+    monkeypatch.setattr(settings, "METRICS_PUBLIC", True)
+    assert main_client.get("/metrics").status_code == 200
+
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "scrape")
+    assert main_client.get("/metrics").status_code == 401
+    response = main_client.get("/metrics", headers={"Authorization": "Bearer scrape"})
+    assert response.status_code == 200
+    assert b"http_requests_total" in response.content
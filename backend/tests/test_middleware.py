@@ -0,0 +1,55 @@
+import time
+import uuid
+import jwt
+from fastapi import Depends, FastAPI, Request
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import OperationalError
+from app.config import get_settings
+from app.middleware.request_context import RequestContextMiddleware
+from app.utils.auth import get_current_user
+
+app = FastAPI()
+app.add_middleware(RequestContextMiddleware)
+
+@app.get("/health")
+async def health():
+    return {"status": "healthy"}
+
+@app.get("/me")
+async def me(request: Request, token_data: dict = Depends(get_current_user)):
+    return {"sub": token_data["sub"], "request_id": request.state.request_id}
+
+@app.get("/broken")
+async def broken():
+    raise OperationalError("SELECT 1", {}, Exception("connection refused"))
+
+client = TestClient(app, raise_server_exceptions=False)
+
+def auth_headers(sub: str) -> dict:
+    claims = {"sub": sub, "aud": "authenticated", "exp": int(time.time()) + 3600}
+    token = jwt.encode(claims, get_settings().SUPABASE_JWT_SECRET, algorithm="HS256")
+    return {"Authorization": f"Bearer {token}"}
+
+def test_public_paths_skip_auth():
+    response = client.get("/health")
+    assert response.status_code == 200
+    assert response.headers["x-request-id"]
+    assert response.headers["server-timing"].startswith("app;dur=")
+
+def test_verified_claims_reach_the_endpoint():
+    sub = str(uuid.uuid4())
+    response = client.get("/me", headers=auth_headers(sub))
+    assert response.status_code == 200
+    assert response.json() == {"sub": sub, "request_id": response.headers["x-request-id"]}
+
+def test_missing_token_is_rejected():
+    response = client.get("/me")
+    assert response.status_code == 401
+    assert response.json() == {"detail": "Missing or invalid authorization header"}
+    assert response.headers["x-request-id"]
+
+def test_database_errors_are_handled():
+    response = client.get("/broken", headers=auth_headers(str(uuid.uuid4())))
+    assert response.status_code == 500
+    assert response.json() == {"detail": "A database error occurred."}
+    assert response.headers["x-request-id"]
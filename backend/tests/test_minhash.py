@@ -0,0 +1,90 @@
+import uuid
+import pytest
+from sqlalchemy import insert
+from app.dependencies import ThreadedSession
+from app.models.group import FamilyGroup
+from app.models.recipe import Recipe, RecipeLSHBucket
+from app.models.user import User, UserRole
+from app.services import recipe as recipe_service
+from app.utils.ingredients import ingredient_columns
+from app.utils.minhash import (
+    recipe_features, minhash_signature, lsh_buckets, estimate_similarity, signature_columns, bucket_rows, LSH_BANDS
+)
+
+PANCAKES = (
+    ["2 cups flour", "2 eggs", "1 1/2 cups milk", "2 tbsp sugar", "1 tsp baking powder", "pinch of salt"],
+    "Whisk the flour, sugar, baking powder and salt. Beat in the eggs and milk until smooth, "
+    "then ladle onto a hot buttered pan and cook until bubbles form. Flip and cook until golden."
+)
+
+def signature(ingredients, instructions):
+    return signature_columns(ingredient_columns(ingredients)["ingredient_terms"], instructions)["minhash_signature"]
+
+def test_identical_recipes_have_equal_signatures():
+    assert signature(*PANCAKES) == signature(*PANCAKES)
+    assert estimate_similarity(signature(*PANCAKES), signature(*PANCAKES)) == 1.0
+
+def test_reworded_copy_is_similar():
+    ingredients, instructions = PANCAKES
+    copy = signature(["2 Cups Flour", *ingredients[1:]], instructions.replace("golden.", "golden brown."))
+    assert estimate_similarity(signature(*PANCAKES), copy) >= 0.5
+    assert set(lsh_buckets(signature(*PANCAKES))) & set(lsh_buckets(copy))
+
+def test_unrelated_recipes_are_not_similar():
+    soup = signature(["4 tomatoes", "1 onion", "2 cloves garlic"], "Roast the tomatoes, then blend with stock.")
+    assert estimate_similarity(signature(*PANCAKES), soup) < 0.2
+
+def test_features_combine_ingredients_and_instruction_shingles():
+    assert recipe_features(["egg"], "Beat the eggs well") == {"i:egg", "s:beat the eggs", "s:the eggs well"}
+
+def test_shingles_keep_accented_and_non_latin_words():
+    assert recipe_features([], "Faire revenir à feu doux") == {"s:faire revenir à", "s:revenir à feu", "s:à feu doux"}
+    assert recipe_features([], "Обжарить лук до золотистого") == {"s:обжарить лук до", "s:лук до золотистого"}
+
+def test_empty_features_have_a_signature():
+    assert len(lsh_buckets(minhash_signature([]))) == LSH_BANDS
+
+@pytest.fixture
+def group_recipes(test_db):
+    user = User(id=uuid.uuid4(), email="cook@example.com", name="Cook", role=UserRole.MEMBER)
+    group = FamilyGroup(id=uuid.uuid4(), name="Family", owner_id=user.id)
+    other_group = FamilyGroup(id=uuid.uuid4(), name="Strangers", owner_id=user.id)
+    test_db.add_all([user, group, other_group])
+    ingredients, instructions = PANCAKES
+    recipes = {
+        "pancakes": (group, ingredients, instructions),
+        "soup": (group, ["4 tomatoes", "1 onion"], "Roast the tomatoes, then blend with stock."),
+        "other group pancakes": (other_group, ingredients, instructions),
+    }
+    for title, (recipe_group, recipe_ingredients, recipe_instructions) in recipes.items():
+        columns = ingredient_columns(recipe_ingredients)
+        recipe = Recipe(
+            id=uuid.uuid4(),
+            title=title,
+            ingredients=recipe_ingredients,
+            instructions=recipe_instructions,
+            group_id=recipe_group.id,
+            **columns,
+            **signature_columns(columns["ingredient_terms"], recipe_instructions)
+        )
+        test_db.add(recipe)
+        test_db.flush()
+        test_db.execute(insert(RecipeLSHBucket), bucket_rows(recipe.id, recipe.group_id, recipe.minhash_signature))
+    test_db.commit()
+    return group.id
+
+@pytest.mark.asyncio
+async def test_find_similar_recipes_within_group(test_db, group_recipes):
+    ingredients, instructions = PANCAKES
+    matches = await recipe_service.find_similar_recipes(
+        ThreadedSession(test_db), group_recipes, signature(ingredients[:-1], instructions)
+    )
+    assert [(match["recipe"].title, match["similarity"] >= 0.5) for match in matches] == [("pancakes", True)]
+
+@pytest.mark.asyncio
+async def test_find_similar_recipes_excludes_the_recipe_itself(test_db, group_recipes):
+    pancakes = test_db.query(Recipe).filter_by(title="pancakes").one()
+    matches = await recipe_service.find_similar_recipes(
+        ThreadedSession(test_db), group_recipes, pancakes.minhash_signature, exclude_id=pancakes.id
+    )
+    assert matches == []
@@ -0,0 +1,76 @@
+import uuid
+import fakeredis
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+import app.dependencies as dependencies
+from app.models.outbox import OutboxEvent
+from app.services.membership import membership_key
+from app.services.outbox import OutboxDispatcher, add_event, add_membership_change
+from app.utils.cache import local_cache
+
+@pytest.fixture
+def session_factory(test_db):
+    return sessionmaker(bind=test_db.get_bind())
+
+@pytest.fixture(autouse=True)
+def redis(monkeypatch):
+    redis = fakeredis.aioredis.FakeRedis()
+    monkeypatch.setattr(dependencies, "redis_client", redis)
+    return redis
+
+def dispatcher_recording(session_factory, calls: list, fail: int = 0) -> OutboxDispatcher:
+    dispatcher = OutboxDispatcher(session_factory, batch_size=2)
+
+    async def handler(payload: dict):
+        if payload["n"] == fail:
+            raise RuntimeError("unavailable")
+        calls.append(payload["n"])
+
+    dispatcher.register("test", handler)
+    return dispatcher
+
+@pytest.mark.asyncio
+async def test_only_committed_events_run_in_order(session_factory):
+    with session_factory() as db:
+        add_event(db, "test", {"n": 1})
+        db.rollback()
+        for n in (2, 3, 4):
+            add_event(db, "test", {"n": n})
+        db.commit()
+
+    calls = []
+    assert await dispatcher_recording(session_factory, calls).drain() == 3
+    assert calls == [2, 3, 4]
+    with session_factory() as db:
+        assert db.scalars(select(OutboxEvent)).all() == []
+
+@pytest.mark.asyncio
+async def test_failed_event_holds_back_later_ones(session_factory):
+    with session_factory() as db:
+        for n in (1, 2, 3):
+            add_event(db, "test", {"n": n})
+        db.commit()
+
+    calls = []
+    assert await dispatcher_recording(session_factory, calls, fail=2).drain() == 1
+    with session_factory() as db:
+        pending = db.scalars(select(OutboxEvent).order_by(OutboxEvent.id)).all()
+        assert [(event.payload["n"], event.attempts) for event in pending] == [(2, 1), (3, 0)]
+        assert pending[0].last_error == "unavailable"
+
+    # Delivered once the failure clears
+    assert await dispatcher_recording(session_factory, calls).drain() == 2
+    assert calls == [1, 2, 3]
+
+@pytest.mark.asyncio
+async def test_membership_changes_update_the_index(session_factory, redis):
+    user_id, group_id = uuid.uuid4(), uuid.uuid4()
+    local_cache.set(membership_key(user_id), frozenset())
+    with session_factory() as db:
+        add_membership_change(db, group_id, added=[user_id])
+        db.commit()
+
+    assert await OutboxDispatcher(session_factory).drain() == 1
+    assert await redis.smembers(membership_key(user_id)) == {str(group_id).encode()}
+    assert local_cache.get(membership_key(user_id)) is None
@@ -0,0 +1,34 @@
+import pytest
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from uuid import uuid4
+from fastapi import HTTPException
+from app.utils.pagination import encode_cursor, decode_cursor, build_page
+
+def test_cursor_round_trip():
+    created_at = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+    row_id = uuid4()
+
+    cursor = encode_cursor(created_at, row_id)
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (created_at, row_id)
+
+def test_invalid_cursor_is_rejected():
+    with pytest.raises(HTTPException) as exc_info:
+        decode_cursor("not-a-cursor")
+    assert exc_info.value.status_code == 400
+
+def test_build_page_sets_next_cursor_only_when_more_rows_exist():
+    rows = [
+        SimpleNamespace(id=uuid4(), created_at=datetime(2024, 5, day, tzinfo=timezone.utc))
+        for day in (3, 2, 1)
+    ]
+
+    page = build_page(rows, limit=2)
+    assert page["items"] == rows[:2]
+    assert decode_cursor(page["next_cursor"]) == (rows[1].created_at, rows[1].id)
+
+    last_page = build_page(rows[2:], limit=2)
+    assert last_page["items"] == rows[2:]
+    assert last_page["next_cursor"] is None
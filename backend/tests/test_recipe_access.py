@@ -0,0 +1,98 @@
+import time
+import uuid
+import fakeredis
+import jwt
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import app.dependencies as dependencies
+from app.config import get_settings
+from app.dependencies import ThreadedSession, get_async_db
+from app.middleware.request_context import RequestContextMiddleware
+from app.models.group import FamilyGroup, GroupMember
+from app.models.recipe import Recipe
+from app.models.user import User, UserRole
+from app.routers import groups, recipes
+from app.utils.cache import local_cache
+
+app = FastAPI()
+app.add_middleware(RequestContextMiddleware)
+app.include_router(recipes.router, prefix="/recipes")
+app.include_router(groups.router, prefix="/groups")
+
+def auth_headers(user_id: uuid.UUID) -> dict:
+    claims = {"sub": str(user_id), "aud": "authenticated", "exp": int(time.time()) + 3600}
+    token = jwt.encode(claims, get_settings().SUPABASE_JWT_SECRET, algorithm="HS256")
+    return {"Authorization": f"Bearer {token}"}
+
+@pytest.fixture
+def client(test_db, monkeypatch):
+    monkeypatch.setattr(dependencies, "redis_client", fakeredis.aioredis.FakeRedis())
+    local_cache.clear()
+
+    async def override_get_async_db():
+        yield ThreadedSession(test_db)
+
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    # One event loop for the whole test, which the Redis client is bound to
+    with TestClient(app) as client:
+        yield client
+    app.dependency_overrides.clear()
+
+@pytest.fixture
+def recipe(test_db):
+    member = User(id=uuid.uuid4(), email="cook@example.com", name="Cook", role=UserRole.MEMBER)
+    outsider = User(id=uuid.uuid4(), email="guest@example.com", name="Guest", role=UserRole.MEMBER)
+    group = FamilyGroup(id=uuid.uuid4(), name="Family", owner_id=member.id)
+    recipe = Recipe(id=uuid.uuid4(), title="Omelette", ingredients=["2 eggs"], instructions="Whisk", group_id=group.id)
+    test_db.add_all([member, outsider, group, GroupMember(user_id=member.id, group_id=group.id), recipe])
+    test_db.commit()
+    return member.id, outsider.id, recipe.id
+
+def test_members_can_read_a_recipe(client, recipe):
+    member_id, _, recipe_id = recipe
+    response = client.get(f"/recipes/{recipe_id}", headers=auth_headers(member_id))
+    assert response.status_code == 200
+    assert response.json()["title"] == "Omelette"
+
+def test_non_members_are_forbidden(client, recipe):
+    member_id, outsider_id, recipe_id = recipe
+    # Checked by the query loading the recipe, then against the cached body
+    assert client.get(f"/recipes/{recipe_id}", headers=auth_headers(outsider_id)).status_code == 403
+    assert client.get(f"/recipes/{recipe_id}", headers=auth_headers(member_id)).status_code == 200
+    assert client.get(f"/recipes/{recipe_id}", headers=auth_headers(outsider_id)).status_code == 403
+    assert client.get(f"/recipes/{recipe_id}/similar", headers=auth_headers(outsider_id)).status_code == 403
+
+def test_missing_recipes_are_not_found(client, recipe):
+    member_id, outsider_id, _ = recipe
+    missing_id = uuid.uuid4()
+    for user_id in (member_id, outsider_id):
+        response = client.get(f"/recipes/{missing_id}", headers=auth_headers(user_id))
+        assert response.status_code == 404
+        assert response.json()["detail"] == "Recipe not found"
+    assert client.get(f"/recipes/{missing_id}/similar", headers=auth_headers(member_id)).status_code == 404
+
+def test_removed_members_lose_access_at_once(client, test_db, recipe):
+    member_id, _, recipe_id = recipe
+    group_id = test_db.get(Recipe, recipe_id).group_id
+    # Renders the recipe, then checks the cached body against the membership index
+    assert client.get(f"/recipes/{recipe_id}", headers=auth_headers(member_id)).status_code == 200
+    assert client.get(f"/recipes/{recipe_id}", headers=auth_headers(member_id)).status_code == 200
+
+    # No outbox dispatcher runs here, the index is updated by the request itself
+    response = client.delete(f"/groups/{group_id}/members/{member_id}", headers=auth_headers(member_id))
+    assert response.status_code == 200
+    assert client.get(f"/recipes/{recipe_id}", headers=auth_headers(member_id)).status_code == 403
+
+def test_new_group_owners_can_write_at_once(client, recipe):
+    _, outsider_id, _ = recipe
+    # Caches the outsider's membership, without the new group
+    assert client.get("/recipes/", headers=auth_headers(outsider_id)).status_code == 200
+
+    group_id = client.post("/groups/", json={"name": "Mine"}, headers=auth_headers(outsider_id)).json()["id"]
+    response = client.post(
+        "/recipes/",
+        json={"title": "Toast", "ingredients": ["1 slice bread"], "instructions": "Toast it", "group_id": group_id},
+        headers=auth_headers(outsider_id)
+    )
+    assert response.status_code == 200
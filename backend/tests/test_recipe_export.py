@@ -0,0 +1,21 @@
+import uuid
+from collections import namedtuple
+from datetime import datetime
+import orjson
+from app.services.recipe_export import EXPORT_COLUMNS, _encode_csv, _encode_ndjson
+
+Row = namedtuple("Row", EXPORT_COLUMNS)
+
+ROWS = [
+    Row(uuid.uuid4(), "Soup", ["water", "salt, to taste"], "Boil\nthen serve", None, datetime(2024, 1, 1)),
+    Row(uuid.uuid4(), "Stew", ["beef"], "Simmer", "https://example.com/stew.jpg", datetime(2024, 1, 2)),
+]
+
+def test_ndjson_has_one_recipe_per_line():
+    lines = _encode_ndjson(ROWS).splitlines()
+    assert [orjson.loads(line)["title"] for line in lines] == ["Soup", "Stew"]
+
+def test_csv_ingredients_are_json_arrays():
+    body = _encode_csv(ROWS).decode()
+    assert '"[""water"",""salt, to taste""]"' in body
+    assert '"Boil\nthen serve"' in body
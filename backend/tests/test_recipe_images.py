@@ -0,0 +1,91 @@
+import io
+import os
+import uuid
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+from sqlalchemy.orm import sessionmaker
+from app.config import get_settings
+from app.dependencies import ThreadedSession
+from app.models.group import FamilyGroup, GroupMember
+from app.models.recipe import Recipe
+from app.models.user import User, UserRole
+from app.services import recipe_image
+from app.utils.images import sniff_image_type, shutdown_image_pool
+from app.utils.storage import LocalImageStore
+
+def png(width=1600, height=1200, color="tomato") -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+async def chunks(data: bytes, size: int = 4096):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = LocalImageStore(str(tmp_path), "/images")
+    monkeypatch.setattr(recipe_image, "get_image_store", lambda: store)
+    yield store
+    shutdown_image_pool()
+
+@pytest.fixture
+def recipes(test_db):
+    user = User(id=uuid.uuid4(), email="cook@example.com", name="Cook", role=UserRole.MEMBER)
+    group = FamilyGroup(id=uuid.uuid4(), name="Family", owner_id=user.id)
+    test_db.add_all([user, group, GroupMember(user_id=user.id, group_id=group.id)])
+    recipes = [
+        Recipe(id=uuid.uuid4(), title=title, ingredients=["egg"], instructions="Cook", group_id=group.id)
+        for title in ("Omelette", "Frittata")
+    ]
+    test_db.add_all(recipes)
+    test_db.commit()
+    return user.id, [recipe.id for recipe in recipes]
+
+def test_sniff_image_type():
+    assert sniff_image_type(png(1, 1)[:12]) == ("image/png", "png")
+    assert sniff_image_type(b"RIFF\x00\x00\x00\x00WEBP") == ("image/webp", "webp")
+    assert sniff_image_type(b"<html>") is None
+
+@pytest.mark.asyncio
+async def test_upload_stores_image_and_renders_variants(test_db, store, recipes):
+    user_id, (recipe_id, _) = recipes
+    recipe, pending = await recipe_image.upload_recipe_image(ThreadedSession(test_db), recipe_id, user_id, chunks(png()))
+
+    assert recipe.image_url.startswith("/images/") and recipe.image_url.endswith(".png")
+    assert recipe.image_variants is None
+    assert pending["image_url"] == recipe.image_url
+
+    await recipe_image.store_image_variants(**pending, session_factory=sessionmaker(bind=test_db.get_bind()))
+    test_db.expire_all()
+    variants = test_db.get(Recipe, recipe_id).image_variants
+    assert set(variants) == {"thumbnail", "medium"}
+    with Image.open(store._path(variants["thumbnail"].removeprefix("/images/"))) as thumbnail:
+        assert (thumbnail.format, thumbnail.size) == ("WEBP", (320, 240))
+    assert not os.path.exists(pending["directory"])
+
+@pytest.mark.asyncio
+async def test_identical_images_are_stored_once(test_db, store, recipes):
+    user_id, (first_id, second_id) = recipes
+    db = ThreadedSession(test_db)
+    first, pending = await recipe_image.upload_recipe_image(db, first_id, user_id, chunks(png()))
+    await recipe_image.store_image_variants(**pending, session_factory=sessionmaker(bind=test_db.get_bind()))
+
+    second, pending = await recipe_image.upload_recipe_image(db, second_id, user_id, chunks(png(), size=1000))
+    assert pending is None
+    assert second.image_url == first.image_url
+    assert set(second.image_variants) == {"thumbnail", "medium"}
+
+@pytest.mark.asyncio
+async def test_rejects_non_images_and_oversized_uploads(test_db, store, recipes, monkeypatch):
+    user_id, (recipe_id, _) = recipes
+    db = ThreadedSession(test_db)
+    with pytest.raises(HTTPException) as error:
+        await recipe_image.upload_recipe_image(db, recipe_id, user_id, chunks(b"not an image"))
+    assert error.value.status_code == 415
+
+    monkeypatch.setattr(get_settings(), "IMAGE_MAX_BYTES", 1024)
+    with pytest.raises(HTTPException) as error:
+        await recipe_image.upload_recipe_image(db, recipe_id, user_id, chunks(png()))
+    assert error.value.status_code == 413
@@ -0,0 +1,118 @@
+import uuid
+import fakeredis
+import orjson
+import pytest
+from sqlalchemy import func, select
+import app.dependencies as dependencies
+from app.dependencies import ThreadedSession
+from app.models.group import FamilyGroup, GroupMember
+from app.models.outbox import OutboxEvent
+from app.models.recipe import Recipe
+from app.models.user import User, UserRole
+from app.services import recipe_import
+from app.services.outbox import CACHE_INVALIDATION
+from app.services.recipe_import import _csv_rows, _iter_lines, _ndjson_rows, import_recipes
+
+async def stream(body: bytes, chunk_size: int = 7):
+    for i in range(0, len(body), chunk_size):
+        yield body[i:i + chunk_size]
+
+async def collect(rows):
+    return [row async for row in rows]
+
+@pytest.mark.asyncio
+async def test_lines_are_split_across_chunks():
+    lines = await collect(_iter_lines(stream(b"first line\nsecond\n\nlast")))
+    assert lines == [b"first line", b"second", b"", b"last"]
+
+@pytest.mark.asyncio
+async def test_long_lines_are_skipped_not_buffered(monkeypatch):
+    monkeypatch.setattr(recipe_import, "MAX_LINE_BYTES", 20)
+    body = b"short\n" + b"x" * 50 + b"\nafter\n" + b"y" * 50
+    lines = await collect(_iter_lines(stream(body)))
+    assert lines == [b"short", None, b"after", None]
+
+@pytest.mark.asyncio
+async def test_long_lines_are_reported_as_failed_rows(monkeypatch):
+    monkeypatch.setattr(recipe_import, "MAX_LINE_BYTES", 30)
+    body = b'{"title": "Soup"}\n{"title": "' + b"x" * 50 + b'"}\n{"title": "Stew"}\n'
+    rows = await collect(_ndjson_rows(_iter_lines(stream(body))))
+
+    assert [row for row, _ in rows] == [1, 2, 3]
+    assert str(rows[1][1]) == "Line longer than 30 bytes"
+    assert rows[2][1] == {"title": "Stew"}
+
+@pytest.mark.asyncio
+async def test_csv_records_are_bounded(monkeypatch):
+    monkeypatch.setattr(recipe_import, "MAX_LINE_BYTES", 40)
+    # An unclosed quote would otherwise gather the rest of the body into one record
+    body = b'title,instructions\nSoup,"Boil\n' + b"and stir\n" * 10 + b'Stew,Simmer\n'
+    rows = await collect(_csv_rows(_iter_lines(stream(body))))
+
+    assert isinstance(rows[0][1], ValueError)
+    assert rows[-1] == (len(rows), {"title": "Stew", "instructions": "Simmer"})
+
+@pytest.mark.asyncio
+async def test_ndjson_rows_report_invalid_lines():
+    body = b'{"title": "Soup"}\n\nnot json\n{"title": "Stew"}\n'
+    rows = await collect(_ndjson_rows(_iter_lines(stream(body))))
+
+    assert [row for row, _ in rows] == [1, 3, 4]
+    assert rows[0][1] == {"title": "Soup"}
+    assert isinstance(rows[1][1], ValueError)
+
+@pytest.mark.asyncio
+async def test_csv_fields_may_span_lines():
+    body = (
+        b'title,ingredients,instructions\r\n'
+        b'Soup,"[""water"", ""salt""]","Boil,\r\nthen serve"\r\n'
+        b'Stew,"beef\ncarrot",Simmer\n'
+    )
+    rows = await collect(_csv_rows(_iter_lines(stream(body))))
+
+    assert rows == [
+        (1, {"title": "Soup", "ingredients": ["water", "salt"], "instructions": "Boil,\nthen serve"}),
+        (2, {"title": "Stew", "ingredients": ["beef", "carrot"], "instructions": "Simmer"}),
+    ]
+
+def soups(count: int) -> bytes:
+    return b"\n".join(
+        orjson.dumps({"title": f"Soup {i}", "ingredients": ["1 onion"], "instructions": "Simmer"}) for i in range(count)
+    )
+
+@pytest.fixture
+def member(test_db, monkeypatch):
+    monkeypatch.setattr(dependencies, "redis_client", fakeredis.aioredis.FakeRedis())
+    user = User(id=uuid.uuid4(), email="cook@example.com", name="Cook", role=UserRole.MEMBER)
+    group = FamilyGroup(id=uuid.uuid4(), name="Family", owner_id=user.id)
+    test_db.add_all([user, group, GroupMember(user_id=user.id, group_id=group.id)])
+    test_db.commit()
+    return user, group
+
+@pytest.mark.asyncio
+async def test_imports_invalidate_once_after_the_last_batch(test_db, member, monkeypatch):
+    monkeypatch.setattr(recipe_import, "IMPORT_BATCH_SIZE", 2)
+    user, group = member
+
+    result = await import_recipes(ThreadedSession(test_db), group.id, user.id, stream(soups(5)), "application/x-ndjson")
+
+    assert result["imported"] == 5
+    assert test_db.scalar(select(func.count()).select_from(Recipe)) == 5
+    test_db.expire_all()
+    assert test_db.get(FamilyGroup, group.id).version == 2
+    assert test_db.scalar(select(func.count()).where(OutboxEvent.topic == CACHE_INVALIDATION)) == 1
+
+@pytest.mark.asyncio
+async def test_failed_batches_are_retried_row_by_row(test_db, member, monkeypatch):
+    user, group = member
+    taken = uuid.uuid4()
+    test_db.add(Recipe(id=taken, title="Stew", ingredients=["beef"], instructions="Simmer", group_id=group.id))
+    test_db.commit()
+    # The third row collides with an existing recipe, failing the multi-row INSERT
+    ids = iter([uuid.uuid4(), uuid.uuid4(), taken, uuid.uuid4()])
+    monkeypatch.setattr(recipe_import, "uuid4", lambda: next(ids))
+
+    result = await import_recipes(ThreadedSession(test_db), group.id, user.id, stream(soups(4)), "application/x-ndjson")
+
+    assert result == {"imported": 3, "failed": 1, "errors": [{"row": 3, "error": "Could not save recipe"}]}
+    assert test_db.scalar(select(func.count()).select_from(Recipe)) == 4
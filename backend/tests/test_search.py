@@ -0,0 +1,63 @@
+import uuid
+import pytest
+from app.dependencies import ThreadedSession
+from app.models.user import User, UserRole
+from app.models.group import FamilyGroup, GroupMember
+from app.models.recipe import Recipe
+from app.services import recipe as recipe_service
+from app.utils.ingredients import ingredient_terms
+
+@pytest.fixture
+def member(test_db):
+    user = User(id=uuid.uuid4(), email="cook@example.com", name="Cook", role=UserRole.MEMBER)
+    group = FamilyGroup(id=uuid.uuid4(), name="Family", owner_id=user.id)
+    other_group = FamilyGroup(id=uuid.uuid4(), name="Strangers", owner_id=user.id)
+    test_db.add_all([user, group, other_group])
+    test_db.add(GroupMember(user_id=user.id, group_id=group.id))
+    test_db.add_all([
+        Recipe(title="Tomato soup", ingredients=["tomatoes", "basil"], instructions="Simmer", group_id=group.id),
+        Recipe(title="Basil pesto", ingredients=["basil", "pine nuts"], instructions="Blend", group_id=group.id),
+        Recipe(title="Bread", ingredients=["flour", "water"], instructions="Bake", group_id=group.id),
+        Recipe(title="Basil salad", ingredients=["basil"], instructions="Toss", group_id=other_group.id),
+    ])
+    test_db.commit()
+    return user.id
+
+async def search(test_db, user_id, q):
+    return [recipe.title for recipe in await recipe_service.search_recipes(ThreadedSession(test_db), user_id, q)]
+
+@pytest.mark.asyncio
+async def test_search_ranks_title_matches_first(test_db, member):
+    assert await search(test_db, member, "basil") == ["Basil pesto", "Tomato soup"]
+
+@pytest.mark.asyncio
+async def test_search_matches_word_forms(test_db, member):
+    assert await search(test_db, member, "tomato") == ["Tomato soup"]
+
+@pytest.mark.asyncio
+async def test_search_only_returns_recipes_from_member_groups(test_db, member):
+    assert "Basil salad" not in await search(test_db, member, "basil")
+
+@pytest.mark.asyncio
+async def test_search_follows_updates(test_db, member):
+    bread = test_db.query(Recipe).filter(Recipe.title == "Bread").one()
+    bread.title = "Sourdough"
+    test_db.commit()
+
+    assert await search(test_db, member, "sourdough") == ["Sourdough"]
+    assert await search(test_db, member, "bread") == []
+
+@pytest.mark.asyncio
+async def test_pantry_matches_rank_by_coverage(test_db, member):
+    for recipe in test_db.query(Recipe).all():
+        recipe.ingredient_terms = ingredient_terms(recipe.ingredients)
+    test_db.commit()
+
+    matches = await recipe_service.find_recipes_by_pantry(
+        ThreadedSession(test_db), member, ["Tomatoes", "basil", "2 cups flour"]
+    )
+
+    ranked = [(m["recipe"].title, m["matched"], m["missing"]) for m in matches]
+    assert ranked[0] == ("Tomato soup", 2, 0)
+    assert sorted(ranked[1:]) == [("Basil pesto", 1, 1), ("Bread", 1, 1)]
+    assert {m["recipe"].title: m["missing_ingredients"] for m in matches}["Basil pesto"] == ["pine nut"]
@@ -0,0 +1,93 @@
+import json
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import httpx
+import pytest
+from sqlalchemy.orm import sessionmaker
+from app.models.user import User, UserRole
+from app.scripts.sync_users import sync_users
+
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+def supabase_user(i: int, **changes) -> dict:
+    return {
+        "id": str(uuid.UUID(int=i + 1)),
+        "email": f"user{i}@example.com",
+        "user_metadata": {"name": f"User {i}"},
+        "email_confirmed_at": EPOCH.isoformat() if i % 2 else None,
+        "updated_at": (EPOCH + timedelta(seconds=i)).isoformat(),
+        **changes
+    }
+
+@pytest.fixture
+def supabase():
+    """Local stub of the paginated Supabase admin users endpoint"""
+    users = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+            page, per_page = int(params["page"][0]), int(params["per_page"][0])
+            body = json.dumps({"users": users[(page - 1) * per_page:page * per_page]}).encode()
+            self.send_response(200 if url.path == "/auth/v1/admin/users" else 404)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield users, f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+async def sync(test_db, base_url, **kwargs):
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        return await sync_users(client, sessionmaker(bind=test_db.get_bind()), page_size=100, **kwargs)
+
+@pytest.mark.asyncio
+async def test_sync_inserts_every_page(test_db, supabase):
+    users, base_url = supabase
+    users.extend(supabase_user(i) for i in range(250))
+
+    assert await sync(test_db, base_url) == {"fetched": 250, "synced": 250, "skipped": 0}
+    assert test_db.query(User).count() == 250
+    user = test_db.get(User, uuid.UUID(int=2))
+    assert (user.email, user.name, user.role, user.is_verified) == ("user1@example.com", "User 1", UserRole.MEMBER, True)
+
+@pytest.mark.asyncio
+async def test_sync_only_writes_users_changed_since_last_run(test_db, supabase):
+    users, base_url = supabase
+    users.extend(supabase_user(i) for i in range(250))
+    await sync(test_db, base_url)
+
+    later = (EPOCH + timedelta(days=1)).isoformat()
+    users[10] = supabase_user(10, user_metadata={"name": "Renamed"}, updated_at=later)
+    users[20] = supabase_user(20, email="new20@example.com", updated_at=later)
+    # The user at the watermark of the last run is synced again
+    assert (await sync(test_db, base_url))["synced"] == 3
+    assert test_db.get(User, uuid.UUID(int=11)).name == "Renamed"
+    assert test_db.get(User, uuid.UUID(int=21)).email == "new20@example.com"
+
+@pytest.mark.asyncio
+async def test_sync_keeps_roles_and_skips_conflicting_users(test_db, supabase):
+    users, base_url = supabase
+    users.extend(supabase_user(i) for i in range(5))
+    await sync(test_db, base_url)
+    test_db.get(User, uuid.UUID(int=1)).role = UserRole.ADMIN
+    test_db.commit()
+
+    users[1] = supabase_user(1, email="user2@example.com")
+    users.append({**supabase_user(5), "email": None})
+    result = await sync(test_db, base_url, full=True)
+
+    assert result == {"fetched": 6, "synced": 4, "skipped": 1}
+    test_db.expire_all()
+    assert test_db.get(User, uuid.UUID(int=1)).role == UserRole.ADMIN
+    assert test_db.get(User, uuid.UUID(int=2)).email == "user1@example.com"
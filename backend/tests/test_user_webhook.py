@@ -0,0 +1,155 @@
+import asyncio
+import json
+import time
+import uuid
+import fakeredis
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+import app.dependencies as dependencies
+from app.config import get_settings
+from app.models.group import FamilyGroup, GroupMember
+from app.models.user import User, UserRole, DeletedUser
+from app.routers import webhooks
+from app.services import user_sync
+from app.services.user_sync import UserSyncBatcher, get_user_sync_batcher, user_change
+from app.services.outbox import OutboxDispatcher
+from app.utils.auth import revoked_key, verified_token_cache
+from app.utils.webhooks import sign_webhook, verify_webhook
+
+SECRET = "v1,whsec_c2VjcmV0LXNpZ25pbmcta2V5"
+USER_ID = str(uuid.UUID(int=1))
+
+app = FastAPI()
+app.include_router(webhooks.router, prefix="/webhooks")
+
+def auth_user(**changes) -> dict:
+    return {
+        "id": USER_ID,
+        "email": "cook@example.com",
+        "raw_user_meta_data": {"name": "Cook"},
+        "email_confirmed_at": None,
+        "updated_at": "2024-01-01T10:00:00+00:00",
+        **changes
+    }
+
+def event(event_type: str, record=None, old_record=None) -> bytes:
+    return json.dumps({
+        "type": event_type, "table": "users", "schema": "auth", "record": record, "old_record": old_record
+    }).encode()
+
+def signed(body: bytes, secret: str = SECRET) -> dict:
+    message_id, timestamp = str(uuid.uuid4()), int(time.time())
+    return {
+        "webhook-id": message_id,
+        "webhook-timestamp": str(timestamp),
+        "webhook-signature": sign_webhook(secret, message_id, timestamp, body),
+        "Content-Type": "application/json"
+    }
+
+@pytest.fixture
+def client(test_db, monkeypatch):
+    monkeypatch.setattr(get_settings(), "SUPABASE_WEBHOOK_SECRET", SECRET)
+    batcher = UserSyncBatcher(sessionmaker(bind=test_db.get_bind()), max_delay=0.01)
+    app.dependency_overrides[get_user_sync_batcher] = lambda: batcher
+    with TestClient(app) as client:
+        yield client
+    app.dependency_overrides.clear()
+
+def post(client, body: bytes, **headers):
+    return client.post("/webhooks/supabase/users", content=body, headers={**signed(body), **headers})
+
+def test_insert_and_update_events_upsert_the_user(client, test_db):
+    assert post(client, event("INSERT", auth_user())).json() == {"status": "applied"}
+    post(client, event("UPDATE", auth_user(
+        raw_user_meta_data={"name": "Head Cook"},
+        email_confirmed_at="2024-01-01T11:00:00Z",
+        updated_at="2024-01-01T11:00:00Z"
+    )))
+
+    user = test_db.get(User, uuid.UUID(USER_ID))
+    assert (user.name, user.role, user.is_verified) == ("Head Cook", UserRole.MEMBER, True)
+
+def test_replayed_older_events_do_not_overwrite_newer_ones(client, test_db):
+    newer = event("UPDATE", auth_user(raw_user_meta_data={"name": "New"}, updated_at="2024-01-02T00:00:00Z"))
+    older = event("UPDATE", auth_user(raw_user_meta_data={"name": "Old"}))
+    post(client, newer)
+    post(client, older)
+    post(client, newer)
+
+    assert test_db.get(User, uuid.UUID(USER_ID)).name == "New"
+
+def test_delete_event_removes_user_and_memberships(client, test_db):
+    post(client, event("INSERT", auth_user()))
+    group = FamilyGroup(id=uuid.uuid4(), name="Family", owner_id=uuid.UUID(USER_ID))
+    test_db.add(group)
+    test_db.add(GroupMember(user_id=uuid.UUID(USER_ID), group_id=group.id))
+    test_db.commit()
+
+    assert post(client, event("DELETE", old_record=auth_user())).status_code == 200
+    test_db.expire_all()
+    assert test_db.get(User, uuid.UUID(USER_ID)) is None
+    assert test_db.query(GroupMember).count() == 0
+    assert test_db.get(FamilyGroup, group.id).owner_id is None
+
+def test_late_changes_do_not_bring_back_deleted_users(client, test_db):
+    post(client, event("INSERT", auth_user()))
+    post(client, event("DELETE", old_record=auth_user(updated_at="2024-01-01T12:00:00Z")))
+    post(client, event("UPDATE", auth_user(raw_user_meta_data={"name": "Replayed"}, updated_at="2024-01-01T11:00:00Z")))
+    post(client, event("INSERT", auth_user(updated_at="2024-01-01T12:00:00Z")))
+
+    test_db.expire_all()
+    assert test_db.get(User, uuid.UUID(USER_ID)) is None
+    assert test_db.get(DeletedUser, uuid.UUID(USER_ID)) is not None
+
+def test_deleted_users_tokens_are_revoked(client, test_db, monkeypatch):
+    redis = fakeredis.aioredis.FakeRedis()
+    monkeypatch.setattr(dependencies, "redis_client", redis)
+    verified_token_cache.clear()
+    claims = {"sub": USER_ID, "iat": int(time.time()) - 60}
+    verified_token_cache.set("token", claims)
+    post(client, event("DELETE", old_record=auth_user()))
+    client.portal.call(OutboxDispatcher(sessionmaker(bind=test_db.get_bind())).drain)
+
+    assert verified_token_cache.get("token") is None
+    assert client.portal.call(redis.exists, revoked_key(USER_ID)) == 1
+    assert verified_token_cache.is_revoked(claims)
+    assert not verified_token_cache.is_revoked({"sub": USER_ID, "iat": int(time.time()) + 60})
+
+def test_events_without_their_row_are_rejected(client):
+    for body in (event("INSERT"), event("UPDATE", old_record=auth_user()), event("DELETE", record=auth_user())):
+        response = post(client, body)
+        assert response.status_code == 400
+        assert response.json()["detail"].startswith("Invalid user event")
+
+def test_unsigned_and_missigned_events_are_rejected(client):
+    body = event("INSERT", auth_user())
+    assert client.post("/webhooks/supabase/users", content=body).status_code == 401
+    forged = signed(body, secret="v1,whsec_b3RoZXIta2V5")
+    assert client.post("/webhooks/supabase/users", content=body, headers=forged).status_code == 401
+
+def test_stale_signatures_are_rejected():
+    body = b"{}"
+    timestamp = int(time.time()) - 3600
+    headers = {"webhook-id": "msg", "webhook-timestamp": str(timestamp),
+               "webhook-signature": sign_webhook(SECRET, "msg", timestamp, body)}
+    with pytest.raises(HTTPException) as error:
+        verify_webhook(SECRET, headers, body)
+    assert error.value.status_code == 401
+
+@pytest.mark.asyncio
+async def test_bursts_are_coalesced_into_one_write(test_db, mocker):
+    apply = mocker.spy(user_sync, "apply_user_changes")
+    batcher = UserSyncBatcher(sessionmaker(bind=test_db.get_bind()), max_delay=0.05)
+    changes = [
+        user_change("UPDATE", auth_user(raw_user_meta_data={"name": f"Cook {i}"}, updated_at=f"2024-01-01T10:00:0{i}Z"), None)
+        for i in (2, 3, 1)
+    ]
+    other = user_change("INSERT", auth_user(id=str(uuid.UUID(int=2)), email="baker@example.com"), None)
+
+    await asyncio.gather(*(batcher.submit(change) for change in [*changes, other]))
+
+    assert apply.call_count == 1
+    assert len(apply.call_args.args[1]) == 2
+    assert test_db.get(User, uuid.UUID(USER_ID)).name == "Cook 3"